@@ -0,0 +1,339 @@
+import re
+import json
+from functools import lru_cache
+
+from lexicon import is_pattern
+
+# Building blocks of an analyzer, chosen by name so a configuration is plain JSON
+TOKENIZERS = ("regex", "nltk", "word", "filename")
+NORMALIZERS = ("lemma", "stem", "none")
+STOPWORDS = ("english", "none")
+SOURCES = ("text", "filename")  # what a field indexes: the document text or its filename
+FIELD_NAME = re.compile(r"^\w+$")
+NORMALIZE_CACHE_SIZE = 1 << 16
+
+WORD = re.compile(r"\w+")
+# filename parts: runs of letters split at camelCase boundaries, and numbers
+FILENAME_PART = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+
+def _tokenize(tokenizer, text, lowercase):
+    if tokenizer == "filename":
+        # drop the extension (both of "x.log.gz"), then split words, snake_case
+        # and camelCase (before case folding)
+        for _ in range(2):
+            stem, dot, extension = text.rpartition(".")
+            if not (dot and stem and extension.isalnum()):
+                break
+            text = stem
+            if extension.lower() != "gz":
+                break
+        parts = FILENAME_PART.findall(text)
+        return [p.lower() for p in parts] if lowercase else parts
+    if lowercase:
+        text = text.lower()
+    if tokenizer == "regex":
+        from preprocess import TOKEN_SPLIT
+
+        return TOKEN_SPLIT.split(text)
+    if tokenizer == "nltk":
+        from preprocess import ensure_resources
+
+        ensure_resources()
+        from nltk.tokenize import word_tokenize
+
+        return word_tokenize(text)
+    return WORD.findall(text)
+
+
+def _token_spans(tokenizer, text, lowercase):
+    # (start, end, token) of every token, found in the text in order; tokens a
+    # tokenizer rewrites (word_tokenize's quotes) are not in the text and are left out
+    if lowercase:
+        # fold case character by character, so offsets stay those of the text
+        haystack = "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+    else:
+        haystack = text
+    spans = []
+    pos = 0
+    for token in _tokenize(tokenizer, text, lowercase):
+        start = haystack.find(token, pos) if token else -1
+        if start >= 0:
+            pos = start + len(token)
+            spans.append((start, pos, token))
+    return spans
+
+
+@lru_cache(maxsize=None)
+def _token_normalizer(normalizer, stopwords):
+    """Memoized token -> term function (None drops the token) for one normalizer and stop word list."""
+    from preprocess import PUNCTUATION, get_lemmatizer, get_stopwords, normalize_token
+
+    if normalizer == "lemma" and stopwords == "english":
+        return normalize_token  # the preprocess_fast pipeline, sharing its cache
+    stop = get_stopwords() if stopwords == "english" else frozenset()
+    if normalizer == "lemma":
+        transform = get_lemmatizer().lemmatize
+    elif normalizer == "stem":
+        from nltk.stem import PorterStemmer
+
+        transform = PorterStemmer().stem
+    else:
+        transform = None
+
+    @lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+    def normalize(token):
+        token = PUNCTUATION.sub("", token)
+        if not token or token in stop:
+            return None
+        return transform(token) if transform is not None else token
+
+    return normalize
+
+
+class Analyzer:
+    """
+    Configurable text -> terms pipeline.
+
+    Text is lowercased (unless lowercase is False), split by the tokenizer,
+    and every token is stripped of punctuation, dropped if it is a stop word
+    and lemmatized, stemmed or kept as is. With ngrams > 1, the runs of up
+    to ngrams consecutive terms are added after the terms, space-joined.
+    The default analyzer is preprocess_fast itself.
+
+    An analyzer only holds its configuration, so it pickles cheaply to
+    ingestion workers; the NLTK models it needs are loaded on first use.
+
+    Attributes:
+        tokenizer (str): "regex" (word_tokenize's splits, see
+            preprocess.TOKEN_SPLIT), "nltk" (word_tokenize itself), "word"
+            (runs of word characters) or "filename" (extension dropped,
+            snake_case and camelCase split).
+        normalizer (str): "lemma" (WordNet), "stem" (Porter) or "none".
+        stopwords (str): "english" (NLTK's list) or "none".
+        ngrams (int): longest run of terms indexed as one term.
+        lowercase (bool): fold case (before tokenizing, except for filenames,
+            whose camelCase is split first).
+    """
+
+    def __init__(self, tokenizer="regex", normalizer="lemma", stopwords="english", ngrams=1, lowercase=True):
+        for value, allowed, name in (
+            (tokenizer, TOKENIZERS, "tokenizer"), (normalizer, NORMALIZERS, "normalizer"),
+            (stopwords, STOPWORDS, "stopwords"),
+        ):
+            if value not in allowed:
+                raise ValueError(f"{name} must be one of {', '.join(allowed)}, not {value!r}")
+        if not isinstance(ngrams, int) or ngrams < 1:
+            raise ValueError("ngrams must be a positive integer")
+        self.tokenizer = tokenizer
+        self.normalizer = normalizer
+        self.stopwords = stopwords
+        self.ngrams = ngrams
+        self.lowercase = lowercase
+
+    @property
+    def config(self):
+        return {
+            "tokenizer": self.tokenizer, "normalizer": self.normalizer, "stopwords": self.stopwords,
+            "ngrams": self.ngrams, "lowercase": self.lowercase,
+        }
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(**config)
+
+    def __eq__(self, other):
+        return isinstance(other, Analyzer) and self.config == other.config
+
+    def __hash__(self):
+        return hash(tuple(self.config.items()))
+
+    def __repr__(self):
+        return f"Analyzer({', '.join(f'{k}={v!r}' for k, v in self.config.items())})"
+
+    def normalize(self, token):
+        """Term of one token (already lowercased if the analyzer lowercases), None if it is dropped."""
+        return _token_normalizer(self.normalizer, self.stopwords)(token)
+
+    def __call__(self, text):
+        """
+        Analyze a text.
+
+        Returns:
+            list[str]: its terms, in text order (n-grams after the terms).
+        """
+        if self == DEFAULT_ANALYZER:
+            from preprocess import preprocess_fast
+
+            return preprocess_fast(text)
+        normalize = _token_normalizer(self.normalizer, self.stopwords)
+        terms = []
+        for token in _tokenize(self.tokenizer, text, self.lowercase):
+            if token:
+                term = normalize(token)
+                if term is not None:
+                    terms.append(term)
+        for n in range(2, self.ngrams + 1):
+            terms.extend(" ".join(terms[i:i + n]) for i in range(len(terms) - n + 1))
+        return terms
+
+    def term_spans(self, text):
+        """
+        Where the terms of a text are, for highlighting.
+
+        Returns:
+            list[tuple[int, int, str]]: (start, end) character offsets of every
+            token that yields a term, and the term, in text order (n-grams
+            are runs of consecutive entries).
+        """
+        normalize = _token_normalizer(self.normalizer, self.stopwords)
+        spans = []
+        for start, end, token in _token_spans(self.tokenizer, text, self.lowercase):
+            term = normalize(token)
+            if term is not None:
+                spans.append((start, end, term))
+        return spans
+
+    def analyze(self, text):
+        """
+        Analyze text sentence by sentence, for indexing.
+
+        Returns:
+            tuple[list[str], list[tuple[int, int, int]]]: the terms of the
+            whole text, and for each sentence its (start, end) character
+            offsets and how many of those terms it produced.
+        """
+        from preprocess import get_sentence_tokenizer
+
+        tokens = []
+        sentences = []
+        for start, end in get_sentence_tokenizer().span_tokenize(text):
+            sentence_tokens = self(text[start:end])
+            tokens.extend(sentence_tokens)
+            sentences.append((start, end, len(sentence_tokens)))
+        return tokens, sentences
+
+
+DEFAULT_ANALYZER = Analyzer()
+
+
+class Field:
+    """
+    A document field indexed next to the body, for BM25 ranking.
+
+    Attributes:
+        analyzer (Analyzer): turns the field into terms.
+        boost (float): weight of the field's BM25 scores, relative to the body's.
+        source (str): "filename" or "text" (the body text, analyzed differently).
+    """
+
+    def __init__(self, analyzer, boost=1.0, source="filename"):
+        if source not in SOURCES:
+            raise ValueError(f"source must be one of {', '.join(SOURCES)}, not {source!r}")
+        self.analyzer = analyzer
+        self.boost = float(boost)
+        self.source = source
+
+    @property
+    def config(self):
+        return {"analyzer": self.analyzer.config, "boost": self.boost, "source": self.source}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(Analyzer.from_config(config["analyzer"]), config.get("boost", 1.0), config.get("source", "filename"))
+
+
+def field_term(field, term):
+    """Key of a field's term among the BM25 postings; body terms never contain ":"."""
+    return f"{field}:{term}"
+
+
+def split_field_term(key):
+    """(field, term) of a field_term key."""
+    field, _, term = key.partition(":")
+    return field, term
+
+
+class Schema:
+    """
+    How documents are analyzed into the index: the body analyzer, and the
+    extra fields indexed with their own analyzers and boosts.
+
+    The body feeds every index structure, so queries must be analyzed with
+    the same body analyzer; fields only feed BM25 (and the impact-ordered
+    index built from it), their postings stored under field_term keys with
+    the boost already applied. A query gets field-weighted BM25 scores by
+    adding its field_terms, each field's terms analyzed once, at index time,
+    by that field's analyzer. The configuration is written with the index
+    (see index_store), so an index is always searched the way it was built.
+
+    Attributes:
+        body (Analyzer): analyzer of the document text.
+        fields (dict[str, Field]): extra fields by name.
+    """
+
+    def __init__(self, body=None, fields=None):
+        self.body = body if body is not None else Analyzer()
+        self.fields = dict(fields or {})
+        if self.body.ngrams != 1:
+            raise ValueError("the body analyzer cannot emit n-grams: positions need one term per token")
+        for name in self.fields:
+            if not FIELD_NAME.match(name) or name == "body":
+                raise ValueError(f"invalid field name {name!r}")
+
+    @property
+    def config(self):
+        return {"body": self.body.config, "fields": {name: f.config for name, f in self.fields.items()}}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            Analyzer.from_config(config["body"]),
+            {name: Field.from_config(f) for name, f in config.get("fields", {}).items()},
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, Schema) and self.config == other.config
+
+    def __repr__(self):
+        return f"Schema({self.config})"
+
+    def analyze_document(self, filename, text):
+        """
+        Analyze one document for IndexBuilder.add_document.
+
+        Returns:
+            tuple[list[str], list[tuple], dict[str, list[str]]]: body terms,
+            sentence boundaries and the terms of every field.
+        """
+        tokens, sentences = self.body.analyze(text)
+        fields = {
+            name: field.analyzer(filename if field.source == "filename" else text)
+            for name, field in self.fields.items()
+        }
+        return tokens, sentences, fields
+
+    def analyze_batch(self, documents):
+        """analyze_document over (filename, text) pairs; runs in ingestion workers."""
+        return [self.analyze_document(name, text) for name, text in documents]
+
+    def field_terms(self, query):
+        """
+        The query's terms in every field, as field_term keys, to add to a
+        BM25 query. Wildcard and fuzzy words are left out.
+        """
+        text = " ".join(word for word in query.split() if not is_pattern(word.lower()))
+        return [field_term(name, t) for name, field in self.fields.items() for t in field.analyzer(text)]
+
+
+# the filename is split into words and stemmed: no NLTK data, and short
+# names are cheap to analyze; a filename match weighs twice a body match
+DEFAULT_SCHEMA = Schema(Analyzer(), {"filename": Field(Analyzer("filename", "stem", "none"), boost=2.0)})
+
+
+def load_schema(path):
+    """Schema from a JSON file holding a Schema.config, or DEFAULT_SCHEMA if path is None."""
+    if path is None:
+        return DEFAULT_SCHEMA
+    with open(path, encoding="utf-8") as f:
+        return Schema.from_config(json.load(f))
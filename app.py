@@ -1,91 +1,145 @@
-import os
-import nltk
+import re
+import json
 import base64
 import logging
+from contextlib import ExitStack
 from pathlib import Path
-nltk.download('punkt')
 import streamlit as st
-from preprocess import preprocess
-from indexing import build_vocabulary, build_term_doc_matrix, build_inverted_index
-from retrival import (
-    search_term_doc_incidence,
-    search_inverted_index,
-    search_tfidf,
-)
+from preprocess import MissingResourceError, ensure_resources
+from segments import LiveIndex
+from query_cache import CachedSearcher, QueryCache
+from instrument import METRICS, span, trace
+from boolean_query import parse_boolean, query_terms as boolean_terms
+from lexicon import is_pattern, parse_query
 
 # --- Configuration ---
 logging.basicConfig(level=logging.INFO)
 GIF_URL = "https://ik.imagekit.io/tosp1g2et/img3.jpeg?updatedAt=1747670323821"
+INDEX_DIR = "index"
+PAGE_SIZE = 10  # matching documents shown per page
+NEAR_PATTERN = re.compile(r"\bNEAR/(\d+)\b", re.IGNORECASE)
+QUERY_WORD = re.compile(r"(?<![\w*?])\w+(?![\w*?~])")  # a query word that is no wildcard or fuzzy pattern
+OPERATOR_WORDS = {"AND", "OR", "NOT", "NEAR"}
 
 # --- Helper Functions ---
-def get_snippet(text, terms, radius=50):
-    """Returns all sentences containing search terms with highlighting"""
-    snippets = []
-    sentences = nltk.sent_tokenize(text)
-    
-    for sentence in sentences:
-        lower_sentence = sentence.lower()
-        found = any(term.lower() in lower_sentence for term in terms)
-        if found:
-            # Highlight all terms in the sentence
-            highlighted = sentence
-            for term in terms:
-                highlighted = highlighted.replace(term, f'<span class="highlight">{term}</span>')
-                highlighted = highlighted.replace(term.title(), f'<span class="highlight">{term.title()}</span>')
-                highlighted = highlighted.replace(term.upper(), f'<span class="highlight">{term.upper()}</span>')
-            snippets.append(highlighted)
-    
-    if snippets:
-        # Join snippets with ellipsis and limit total length
-        combined = " [...] ".join(snippets)
-        if len(combined) > 1000:  # Prevent very long results
-            combined = combined[:1000] + " [...]"
-        return combined
-    else:
-        # If no sentences found, return beginning of text
-        beginning = text[:radius*2].strip().replace("\n", " ")
-        return f"{beginning} [...]"
+def get_snippet(searcher, doc_id, terms):
+    """Returns all sentences containing search terms with highlighting,
+    looked up in the sentence index built at indexing time"""
+    with span("snippets"):
+        return searcher.snippet(doc_id, terms)
+
+def render_hit(searcher, doc_id, snippet, icon):
+    """One matching document: its name and snippet"""
+    with st.container():
+        st.markdown(f"### {icon} {searcher.filenames[doc_id]}")
+        st.markdown(f'<div class="result-box">{snippet}</div>', unsafe_allow_html=True)
+
+def request_more_hits():
+    """"Load more" button: show the next page of the current search on the rerun"""
+    st.session_state.load_more = True
+
+def show_hit_pages(searcher, key, fetch, icon, snippet_terms, load_more, empty_message):
+    """Render the hits of a matching mode page by page. A new search shows
+    its first page as soon as it is found; "load more" fetches the next one
+    from the cursor kept in the session, under the hits already shown, whose
+    snippets are kept too, so no page is ever searched or snippeted twice"""
+    pages = st.session_state.get("hit_pages")
+    if not load_more or pages is None or pages["key"] != key:
+        pages = {"key": key, "hits": [], "cursor": None}
+    status = st.empty()
+    for doc_id, snippet in pages["hits"]:
+        render_hit(searcher, doc_id, snippet, icon)
+    if not pages["hits"] or pages["cursor"] is not None:
+        page = fetch(pages["cursor"])
+        for doc_id in page.hits:
+            snippet = get_snippet(searcher, doc_id, snippet_terms)
+            pages["hits"].append((doc_id, snippet))
+            render_hit(searcher, doc_id, snippet, icon)
+        pages["cursor"] = page.cursor
+    st.session_state.hit_pages = pages
+    if not pages["hits"]:
+        status.warning(empty_message)
+        return
+    more = pages["cursor"] is not None
+    status.success(f"Showing {len(pages['hits'])} matching documents{' (more available)' if more else ''}")
+    if more:
+        st.button("⬇️ Load more", key="load_more_btn", on_click=request_more_hits, use_container_width=True)
+
+def parse_positional_query(query):
+    """Split `a NEAR/k b` into its text and k; plain text is treated as a phrase (k=None)"""
+    match = NEAR_PATTERN.search(query)
+    if not match:
+        return query, None
+    return NEAR_PATTERN.sub(" ", query), int(match.group(1))
+
+def did_you_mean(searcher, query):
+    """Rewrite the query with every word unknown to the index replaced by
+    the closest indexed term; None if there is nothing to correct"""
+    changed = False
+
+    def correct(match):
+        nonlocal changed
+        word = match.group(0)
+        if word in OPERATOR_WORDS or word.isdigit():
+            return word
+        terms = searcher.schema.body(word)
+        if len(terms) != 1 or searcher.doc_freq(terms[0]):
+            return word
+        suggestion = searcher.suggest(terms[0])
+        if suggestion is None:
+            return word
+        changed = True
+        return suggestion
+
+    corrected = QUERY_WORD.sub(correct, query)
+    return corrected if changed else None
+
+def analyze_query(searcher, model, query):
+    """Everything a search works out before it runs: the query terms (and
+    the boolean tree or NEAR distance), the indexed terms every wildcard or
+    fuzzy term stands for and the "did you mean" suggestion"""
+    analysis = {"tree": None, "distance": None}
+    with span("preprocess"):
+        # queries are analyzed the way the index was built
+        analyze = searcher.schema.body
+        if model == "Phrase / Proximity":
+            query_text, analysis["distance"] = parse_positional_query(query)
+            analysis["terms"] = analyze(query_text)
+        elif model == "Boolean (AND / OR / NOT)":
+            analysis["tree"] = parse_boolean(query, lambda word: parse_query(word, analyze))
+            analysis["terms"] = boolean_terms(analysis["tree"])
+        else:
+            analysis["terms"] = parse_query(query, analyze)
+    analysis["expansions"] = {term: searcher.expand(term) for term in analysis["terms"] if is_pattern(term)}
+    analysis["suggestion"] = did_you_mean(searcher, query)
+    return analysis
+
+def query_analysis(searcher, key, model, query):
+    """analyze_query once per search: the "load more" reruns of the same
+    search reuse the analysis kept in the session"""
+    analysis = st.session_state.get("query_analysis")
+    if analysis is None or analysis["key"] != key:
+        analysis = {"key": key, **analyze_query(searcher, model, query)}
+        st.session_state.query_analysis = analysis
+    return analysis
+
+def search_suggestion(suggestion):
+    """Put the "did you mean" query in the search box and run it"""
+    st.session_state.search_input = suggestion
+    st.session_state.run_suggestion = True
 
 # --- Data Loading ---
-@st.cache_data(show_spinner=False)
-def load_and_index(data_dir="Dataset"):
-    try:
-        if not os.path.exists(data_dir):
-            raise FileNotFoundError(f"Dataset folder not found at: {data_dir}")
-            
-        filenames = sorted([f for f in os.listdir(data_dir) if f.endswith(".txt")])
-        if not filenames:
-            raise ValueError("No .txt files found in Dataset folder")
-
-        raw_docs = []
-        for f in filenames:
-            file_path = os.path.join(data_dir, f)
-            with open(file_path, encoding="utf-8") as file:
-                content = file.read()
-                if not content.strip():
-                    logging.warning(f"Empty file: {f}")
-                raw_docs.append(content)
-
-        pre_docs = [preprocess(doc) for doc in raw_docs]
-        vocabulary = build_vocabulary(pre_docs)
-        term_doc_matrix = build_term_doc_matrix(pre_docs, vocabulary)
-        inverted_index = build_inverted_index(pre_docs)
-        tfidf_docs = [" ".join(tokens) for tokens in pre_docs]
-        
-        logging.info(f"Successfully loaded {len(filenames)} documents")
-        return {
-            "filenames": filenames,
-            "raw_docs": raw_docs,
-            "pre_docs": pre_docs,
-            "vocabulary": vocabulary,
-            "term_doc_matrix": term_doc_matrix,
-            "inverted_index": inverted_index,
-            "tfidf_docs": tfidf_docs
-        }
-    
-    except Exception as e:
-        logging.exception("Data loading failed")
-        return None
+@st.cache_resource(show_spinner=False)
+def load_and_index(index_dir=INDEX_DIR, data_dir="Dataset"):
+    """One LiveIndex for every session: searchers are immutable and thread-safe,
+    so all sessions query the same one (never pickled or copied), and a
+    rebuilt index is swapped in for everyone once it is written"""
+    return LiveIndex(index_dir, data_dir)
+
+@st.cache_resource(show_spinner=False)
+def get_query_cache():
+    """One query result cache shared by every session"""
+    return QueryCache()
 
 # --- Main App ---
 def main():
@@ -352,18 +406,33 @@ def main():
         </style>
     """, unsafe_allow_html=True)
 
+    try:
+        ensure_resources()
+    except MissingResourceError as e:
+        st.error(f"❌ {e}")
+        st.stop()
+
     with st.spinner("Initializing search engine..."):
-        data = load_and_index()
+        # the on-disk index if there is one (see `python segments.py`), else the dataset indexed in memory
+        try:
+            searcher, index_version = load_and_index().get()
+        except Exception:
+            logging.exception("Data loading failed")
+            searcher = None
     
-    if data is None:
+    if searcher is None:
         st.error("""
             ❌ Failed to initialize search engine. Please check:
-            1. Dataset folder exists and contains .txt files
+            1. Dataset folder exists and contains .txt, .log or .jsonl files (optionally gzipped)
             2. Files have readable content
             3. You have proper permissions
             """)
         st.stop()
 
+    # repeated queries are answered from the shared cache until the index changes
+    query_cache = get_query_cache()
+    searcher = CachedSearcher(searcher, query_cache, index_version)
+
     # UI Components
     st.markdown('<div class="main-container">', unsafe_allow_html=True)
     
@@ -387,69 +456,97 @@ def main():
     # Search method selection with transparent radio buttons
     model = st.radio(
         "Search Method:",
-        ["Document-Term Incidence", "Inverted Index", "TF-IDF with Cosine Similarity"],
+        ["Document-Term Incidence", "Inverted Index", "Boolean (AND / OR / NOT)", "Phrase / Proximity", "TF-IDF with Cosine Similarity", "BM25", "Semantic (LSA)"],
         horizontal=True,
-        index=2
+        index=4
     )
     
-    # Results count slider (only for TF-IDF)
-    if model == "TF-IDF with Cosine Similarity":
+    # Results count slider (only for the ranked modes)
+    if model in ("TF-IDF with Cosine Similarity", "BM25", "Semantic (LSA)"):
         k = st.slider("Number of results:", 1, 20, 5)
+    show_trace = st.checkbox("Show query trace", value=False)
     
     # Search button
-    if st.button("Search", key="search_btn", use_container_width=True):
+    searched = st.button("Search", key="search_btn", use_container_width=True)
+    load_more = st.session_state.pop("load_more", False)
+    if searched or st.session_state.pop("run_suggestion", False) or load_more:
         if not query.strip():
             st.warning("⚠️ Please enter a search query")
             st.stop()
         
-        with st.spinner("🔍 Searching..."):
+        query_trace = None
+        with st.spinner("🔍 Searching..."), ExitStack() as tracing:
+            if show_trace:
+                query_trace = tracing.enter_context(trace(model))
             try:
-                query_terms = preprocess(query)
+                search_key = (model, query, index_version)
+                analysis = query_analysis(searcher, search_key, model, query)
+                query_terms, query_tree, distance = analysis["terms"], analysis["tree"], analysis["distance"]
                 st.info(f"**Processed terms:** {', '.join(query_terms)}")
+                # snippets highlight the indexed terms a wildcard or fuzzy term stands for
+                snippet_terms = []
+                for term in query_terms:
+                    if not is_pattern(term):
+                        snippet_terms.append(term)
+                        continue
+                    expansions = analysis["expansions"][term]
+                    snippet_terms.extend(expansions)
+                    st.caption(f"`{term}` matches: {', '.join(expansions) if expansions else 'no indexed term'}")
+                suggestion = analysis["suggestion"]
+                if suggestion is not None:
+                    st.button(
+                        f"💡 Did you mean: {suggestion}", key="suggestion_btn",
+                        on_click=search_suggestion, args=(suggestion,),
+                    )
                 st.markdown("---")
                 
-                # Document-Term Incidence search
+                # Matching modes: hits are shown a page at a time, snippets only for the hits on screen
                 if model == "Document-Term Incidence":
-                    hits = search_term_doc_incidence(query_terms, data['term_doc_matrix'], data['vocabulary'])
-                    if not hits:
-                        st.warning("No documents matched all query terms")
-                    else:
-                        st.success(f"Found {len(hits)} matching documents")
-                        for i in hits:
-                            with st.container():
-                                st.markdown(f"### 📄 {data['filenames'][i]}")
-                                st.markdown(
-                                    f'<div class="result-box">{get_snippet(data["raw_docs"][i], query_terms)}</div>',
-                                    unsafe_allow_html=True
-                                )
+                    show_hit_pages(
+                        searcher, search_key, lambda cursor: searcher.page_term_doc_incidence(query_terms, cursor, PAGE_SIZE),
+                        "📄", snippet_terms, load_more, "No documents matched all query terms")
                 
                 # Inverted Index search
                 elif model == "Inverted Index":
-                    hits = search_inverted_index(query_terms, data['inverted_index'])
-                    if not hits:
-                        st.warning("No documents found")
+                    show_hit_pages(
+                        searcher, search_key, lambda cursor: searcher.page_inverted_index(query_terms, cursor, PAGE_SIZE),
+                        "📂", snippet_terms, load_more, "No documents found")
+                
+                # Boolean query with AND / OR / NOT and parentheses
+                elif model == "Boolean (AND / OR / NOT)":
+                    st.caption(f"Parsed query: {query_tree}")
+                    show_hit_pages(
+                        searcher, search_key, lambda cursor: searcher.page_boolean(query_tree, cursor, PAGE_SIZE),
+                        "🔣", snippet_terms, load_more, "No documents matched the boolean query")
+                
+                # Phrase search, or NEAR/k proximity search
+                elif model == "Phrase / Proximity":
+                    if distance is None:
+                        fetch = lambda cursor: searcher.page_phrase(query_terms, cursor, PAGE_SIZE)
                     else:
-                        st.success(f"Found {len(hits)} matching documents")
-                        for i in hits:
-                            with st.container():
-                                st.markdown(f"### 📂 {data['filenames'][i]}")
-                                st.markdown(
-                                    f'<div class="result-box">{get_snippet(data["raw_docs"][i], query_terms)}</div>',
-                                    unsafe_allow_html=True
-                                )
+                        fetch = lambda cursor: searcher.page_proximity(query_terms, distance, cursor, PAGE_SIZE)
+                    show_hit_pages(
+                        searcher, search_key, fetch, "📑", snippet_terms, load_more,
+                        "No documents matched the phrase" if distance is None else f"No documents had all terms within {distance} words")
                 
-                # TF-IDF search
+                # TF-IDF, BM25 or semantic ranked search
                 else:
-                    results = search_tfidf(data['tfidf_docs'], query, top_k=k)
+                    if model == "BM25":
+                        # filename and other field matches add their boosted scores
+                        results = searcher.search_bm25(query_terms + searcher.schema.field_terms(query), top_k=k)
+                    elif model == "Semantic (LSA)":
+                        results = searcher.search_lsa(query_terms, top_k=k)
+                    else:
+                        results = searcher.search_tfidf(query_terms, top_k=k)
                     if not results:
                         st.warning("No relevant documents found")
                     else:
                         st.success(f"Top {k} most relevant documents")
                         for i, score in results:
                             with st.container():
-                                st.markdown(f"### 🏆 {data['filenames'][i]} (Score: {score:.3f})")
+                                st.markdown(f"### 🏆 {searcher.filenames[i]} (Score: {score:.3f})")
                                 st.markdown(
-                                    f'<div class="result-box">{get_snippet(data["raw_docs"][i], query_terms)}</div>',
+                                    f'<div class="result-box">{get_snippet(searcher, i, snippet_terms)}</div>',
                                     unsafe_allow_html=True
                                 )
             
@@ -457,6 +554,25 @@ def main():
                 st.error(f"❌ Error during search: {str(e)}")
                 logging.exception("Search error")
 
+        if query_trace is not None:
+            with st.expander(f"Query trace ({query_trace.seconds * 1000:.2f} ms)", expanded=True):
+                st.table([
+                    {"stage": stage, "ms": f"{seconds * 1000:.3f}", "calls": calls}
+                    for stage, (seconds, calls) in query_trace.spans.items()
+                ])
+                if query_trace.counters:
+                    st.table([{"counter": name, "value": value} for name, value in query_trace.counters.items()])
+                st.download_button(
+                    "Download metrics", json.dumps(METRICS.snapshot(), indent=2),
+                    file_name="search_metrics.json", mime="application/json",
+                )
+
+        stats = query_cache.stats()
+        st.caption(
+            f"Query cache: {stats['hit_rate']:.0%} hit rate "
+            f"({stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries, {stats['bytes'] / 1024:.1f} KB)"
+        )
+
     st.markdown('</div>', unsafe_allow_html=True)
 
 if __name__ == "__main__":
@@ -0,0 +1,626 @@
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+_IMPORT_TIMER = """
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def time_import(module, cold, runs=5):
+    """
+    Time `import module` in fresh interpreters.
+
+    Cold runs point PYTHONPYCACHEPREFIX at an empty folder, so every module
+    (ours and third-party) is compiled from source. Warm runs reuse the
+    normal bytecode caches, after one untimed run has filled them.
+
+    Returns:
+        list[float]: seconds per run.
+    """
+    code = _IMPORT_TIMER.format(root=ROOT, module=module)
+    env = dict(os.environ)
+    if not cold:
+        subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True)
+    timings = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as pycache:
+            if cold:
+                env["PYTHONPYCACHEPREFIX"] = pycache
+            out = subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True)
+        timings.append(float(out.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def bench_startup(runs):
+    """Cold and warm import times of preprocess and app."""
+    results = []
+    for module in ("preprocess", "app"):
+        for cold in (True, False):
+            timings = time_import(module, cold, runs)
+            results.append({
+                "benchmark": "startup",
+                "module": module,
+                "mode": "cold" if cold else "warm",
+                "runs": runs,
+                "median_s": statistics.median(timings),
+                "min_s": min(timings),
+                "max_s": max(timings),
+            })
+    return results
+
+
+def synthetic_vocabulary(n_terms):
+    """n_terms distinct lowercase pseudo-words, most frequent first."""
+    letters = "etaoinshrdlcumwfgypbvkjxqz"
+    words = []
+    for i in range(n_terms):
+        word = ""
+        i += 26 * 27  # at least three letters, so no word is a stop word like "a"
+        while i:
+            i, r = divmod(i, 26)
+            word += letters[r]
+        words.append(word)
+    return np.array(words)
+
+
+def zipf_weights(n_terms, s=1.1):
+    """Probability of each frequency rank under a Zipf law with exponent s."""
+    weights = 1.0 / np.arange(1, n_terms + 1) ** s
+    return weights / weights.sum()
+
+
+def generate_corpus(n_docs, n_terms=50_000, avg_length=150, zipf_s=1.1, seed=0, chunk_size=1000):
+    """
+    Yield synthetic preprocessed documents whose terms follow a Zipf law.
+
+    Document lengths are Poisson around avg_length. Documents are drawn in
+    chunks, so corpora of any size stream in bounded memory.
+
+    Yields:
+        list[str]: tokens of each document.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = synthetic_vocabulary(n_terms)
+    weights = zipf_weights(n_terms, zipf_s)
+    for start in range(0, n_docs, chunk_size):
+        lengths = np.maximum(rng.poisson(avg_length, min(chunk_size, n_docs - start)), 1)
+        tokens = vocabulary[rng.choice(n_terms, size=int(lengths.sum()), p=weights)].tolist()
+        bounds = np.concatenate(([0], np.cumsum(lengths)))
+        for i in range(lengths.size):
+            yield tokens[bounds[i]:bounds[i + 1]]
+
+
+def generate_queries(n_queries, n_terms=50_000, zipf_s=1.1, seed=1, max_terms=3):
+    """
+    Synthetic keyword queries of 1 to max_terms terms.
+
+    Query terms follow the corpus Zipf law but skip the 20 most frequent
+    terms, which real users rarely type (they behave like stop words).
+
+    Returns:
+        list[list[str]]: query terms.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = synthetic_vocabulary(n_terms)
+    weights = zipf_weights(n_terms, zipf_s)[20:]
+    weights /= weights.sum()
+    lengths = rng.integers(1, max_terms + 1, n_queries)
+    return [vocabulary[20 + rng.choice(n_terms - 20, size=n, p=weights)].tolist() for n in lengths]
+
+
+def sample_phrases(documents, n_queries, seed=2, length=2):
+    """Phrase queries: runs of consecutive tokens taken from random documents."""
+    rng = np.random.default_rng(seed)
+    phrases = []
+    for doc in (documents[i] for i in rng.integers(0, len(documents), n_queries)):
+        start = int(rng.integers(0, max(1, len(doc) - length + 1)))
+        phrases.append(doc[start:start + length])
+    return phrases
+
+
+def percentiles(timings):
+    """p50/p95/p99/mean of per-query timings, in milliseconds."""
+    ms = np.asarray(timings) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+    }
+
+
+def time_queries(search, queries):
+    """Run search(query) for every query and return the per-query seconds."""
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def recall_at_k(approximate, exact):
+    """Mean fraction of the exact top-k results found by the approximate search, over queries with results."""
+    recalls = [
+        len({d for d, _ in a} & {d for d, _ in e}) / len(e)
+        for a, e in zip(approximate, exact) if e
+    ]
+    return float(np.mean(recalls)) if recalls else None
+
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def _bench_corpus(n_docs, n_terms, avg_length, n_queries, top_k, seed):
+    # runs in a fresh process, so peak RSS belongs to this corpus size alone
+    sys.path.insert(0, ROOT)
+    import retrival
+    from indexing import IndexBuilder
+    from index_store import write_index
+    from semantic import build_lsa_index
+    from impacts import impact_index_from_bm25
+
+    build_s = {}
+    start = time.perf_counter()
+    builder = IndexBuilder()
+    kept = []  # a few documents to draw phrase queries from
+    for doc in generate_corpus(n_docs, n_terms, avg_length, seed=seed):
+        builder.add_document(doc)
+        if len(kept) < 1000:
+            kept.append(doc)
+    build_s["postings"] = time.perf_counter() - start
+
+    stages = {
+        "analysis": lambda: builder.schema,
+        "vocabulary": builder.vocabulary,
+        "field_vocabulary": builder.field_vocabulary,
+        "term_doc_matrix": builder.term_doc_matrix,
+        "inverted_index": builder.inverted_index,
+        "positional_index": builder.positional_index,
+        "tfidf_index": builder.tfidf_index,
+        "bm25_index": builder.bm25_index,
+        "sentence_index": builder.sentence_index,
+        "lsa_index": lambda: build_lsa_index(indexes["tfidf_index"]),
+        "impact_index": lambda: impact_index_from_bm25(
+            indexes["bm25_index"], indexes["vocabulary"] + indexes["field_vocabulary"]),
+    }
+    indexes = {}
+    for name, build in stages.items():
+        start = time.perf_counter()
+        indexes[name] = build()
+        build_s[name] = time.perf_counter() - start
+    build_s["total"] = sum(build_s.values())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_dir = os.path.join(tmp, "index")
+        write_index(index_dir, [f"doc{i}" for i in range(n_docs)], [""] * n_docs, indexes)
+        index_bytes = folder_size(index_dir)
+
+    queries = generate_queries(n_queries, n_terms, seed=seed + 1)
+    phrases = sample_phrases(kept, n_queries, seed=seed + 2)
+    methods = {
+        "incidence": (lambda q: retrival.search_term_doc_incidence(q, indexes["term_doc_matrix"]), queries),
+        "inverted": (lambda q: retrival.search_inverted_index(q, indexes["inverted_index"]), queries),
+        "phrase": (lambda q: retrival.search_phrase(q, indexes["positional_index"]), phrases),
+        "proximity": (lambda q: retrival.search_proximity(q, indexes["positional_index"], 5), phrases),
+        "tfidf": (lambda q: retrival.search_tfidf(q, indexes["tfidf_index"], top_k), queries),
+        "bm25": (lambda q: retrival.search_bm25(q, indexes["bm25_index"], top_k), queries),
+        "lsa": (lambda q: retrival.search_lsa(q, indexes["lsa_index"], top_k), queries),
+        "lsa_exact": (lambda q: retrival.search_lsa(q, indexes["lsa_index"], top_k, exact=True), queries),
+        "impact": (lambda q: retrival.search_impact(q, indexes["impact_index"], top_k), queries),
+    }
+    latency = {name: percentiles(time_queries(search, qs)) for name, (search, qs) in methods.items()}
+    # recall of the IVF search against exact search, at the default n_probe and around it
+    lsa = indexes["lsa_index"]
+    exact = [retrival.search_lsa(q, lsa, top_k, exact=True) for q in queries]
+    recall = {
+        str(n_probe): recall_at_k([retrival.search_lsa(q, lsa, top_k, n_probe) for q in queries], exact)
+        for n_probe in sorted({1, lsa.n_probe, 2 * lsa.n_probe, 4 * lsa.n_probe})
+        if 0 < n_probe <= lsa.n_lists
+    }
+    start = time.perf_counter()
+    retrival.search_bm25_batch(queries, indexes["bm25_index"], top_k)
+    batch_s = time.perf_counter() - start
+
+    return {
+        "benchmark": "corpus",
+        "n_docs": n_docs,
+        "n_terms": len(indexes["vocabulary"]),
+        "n_tokens": int(indexes["bm25_index"].doc_lengths["body"].sum()),
+        "n_queries": n_queries,
+        "build_s": build_s,
+        "index_bytes": index_bytes,
+        "peak_rss_mb": peak_rss_mb(),
+        "latency": latency,
+        "bm25_batch_qps": n_queries / batch_s if batch_s else None,
+        "lsa": {"dims": lsa.dims, "n_lists": lsa.n_lists, "n_probe": lsa.n_probe, "recall_at_k": recall},
+    }
+
+
+def bench_corpus(sizes, n_terms=50_000, avg_length=150, n_queries=500, top_k=10, seed=0):
+    """
+    Index synthetic Zipfian corpora of the given sizes and time every retrieval method.
+
+    Each size runs in its own process, so its peak RSS is not inflated by
+    the previous ones.
+
+    Returns:
+        list[dict]: one result per corpus size.
+    """
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for n_docs in sizes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results.append(pool.submit(_bench_corpus, n_docs, n_terms, avg_length, n_queries, top_k, seed).result())
+    return results
+
+
+def _bench_sessions(n_sessions, shared, n_docs, n_terms, avg_length, queries_per_session, top_k, seed):
+    # runs in a fresh process, so peak RSS belongs to this configuration alone
+    sys.path.insert(0, ROOT)
+    import pickle
+    from indexing import IndexBuilder
+    from segments import Segment, SegmentSearcher
+
+    builder = IndexBuilder()
+    for doc in generate_corpus(n_docs, n_terms, avg_length, seed=seed):
+        builder.add_document(doc)
+    searcher = SegmentSearcher([Segment({
+        "filenames": [f"doc{i}" for i in range(n_docs)], "raw_docs": [""] * n_docs, **builder.build(),
+    })])
+    index_rss_mb = peak_rss_mb()
+    queries = generate_queries(queries_per_session, n_terms, seed=seed + 1)
+
+    timings = [[] for _ in range(n_sessions)]
+    setup_s = [0.0] * n_sessions
+    ready = threading.Barrier(n_sessions + 1)
+
+    def session(i):
+        # what a session gets from the Streamlit cache: the shared searcher
+        # (st.cache_resource), or its own unpickled copy (st.cache_data)
+        start = time.perf_counter()
+        own = searcher if shared else pickle.loads(pickle.dumps(searcher))
+        setup_s[i] = time.perf_counter() - start
+        ready.wait()
+        for j in range(queries_per_session):
+            query = queries[(i * 7 + j) % len(queries)]
+            search = own.search_bm25 if j % 2 else own.search_tfidf
+            start = time.perf_counter()
+            search(query, top_k)
+            timings[i].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(n_sessions)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall_s = time.perf_counter() - start
+
+    all_timings = [t for session_timings in timings for t in session_timings]
+    return {
+        "benchmark": "sessions",
+        "sessions": n_sessions,
+        "shared": shared,
+        "n_docs": n_docs,
+        "n_queries": len(all_timings),
+        "setup_ms": percentiles(setup_s),
+        "latency": percentiles(all_timings),
+        "qps": len(all_timings) / wall_s,
+        "index_rss_mb": index_rss_mb,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_sessions(session_counts, n_docs=5_000, n_terms=50_000, avg_length=150, queries_per_session=100,
+                   top_k=10, seed=0, copies=False):
+    """
+    Load test: many concurrent sessions (threads, as Streamlit runs them)
+    querying one in-memory index.
+
+    With copies, every session also runs against its own pickled copy of
+    the searcher, which is what caching it with st.cache_data did, to
+    compare memory and latency with the shared searcher.
+
+    Returns:
+        list[dict]: one result per session count (and sharing mode).
+    """
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for n_sessions in session_counts:
+        for shared in ((True, False) if copies else (True,)):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                results.append(pool.submit(
+                    _bench_sessions, n_sessions, shared, n_docs, n_terms, avg_length,
+                    queries_per_session, top_k, seed,
+                ).result())
+    return results
+
+
+def _bench_pruning(n_docs, n_terms, avg_length, n_queries, top_k, seed, ratios, budgets):
+    # runs in a fresh process, like _bench_corpus
+    sys.path.insert(0, ROOT)
+    import retrival
+    from indexing import IndexBuilder
+    from impacts import impact_index_from_bm25
+
+    builder = IndexBuilder()
+    for doc in generate_corpus(n_docs, n_terms, avg_length, seed=seed):
+        builder.add_document(doc)
+    bm25 = builder.bm25_index()
+    full = impact_index_from_bm25(bm25, builder.vocabulary())
+    queries = generate_queries(n_queries, n_terms, seed=seed + 1)
+    exact = [retrival.search_bm25(q, bm25, top_k) for q in queries]
+    exhaustive = percentiles(time_queries(lambda q: retrival.search_bm25(q, bm25, top_k), queries))
+
+    rows = []
+    for ratio in ratios:
+        impacts = full.pruned(ratio) if ratio else full
+        size = sum(a.nbytes for a in (impacts.docs, impacts.block_levels, impacts.block_offsets, impacts.term_blocks))
+        for budget in budgets:
+            def search(q):
+                return retrival.search_impact(q, impacts, top_k, posting_budget=budget)
+            rows.append({
+                "prune_ratio": ratio,
+                "posting_budget": budget,
+                "postings": int(impacts.n_postings),
+                "index_bytes": int(size),
+                "latency": percentiles(time_queries(search, queries)),
+                "recall_at_k": recall_at_k([search(q) for q in queries], exact),
+            })
+    return {"benchmark": "pruning", "n_docs": n_docs, "n_queries": n_queries, "top_k": top_k,
+            "bm25": exhaustive, "impact": rows}
+
+
+def bench_pruning(n_docs=20_000, n_terms=50_000, avg_length=150, n_queries=500, top_k=10, seed=0,
+                  ratios=(0.0, 0.25, 0.5, 0.75, 0.9), budgets=(None, 10_000, 1_000)):
+    """
+    Size, latency and quality of impact-ordered search as the index is
+    pruned and the per-query posting budget shrinks.
+
+    Quality is recall@k against exhaustive BM25 search over the unpruned
+    index.
+
+    Returns:
+        list[dict]: a single result, with one row per (prune ratio, budget).
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return [pool.submit(
+            _bench_pruning, n_docs, n_terms, avg_length, n_queries, top_k, seed, tuple(ratios), tuple(budgets),
+        ).result()]
+
+
+def _bench_ingest(file_mb, compressed, n_terms, seed):
+    # runs in a fresh process, like _bench_corpus
+    sys.path.insert(0, ROOT)
+    import gzip
+    from ingest import ingest
+    from preprocess import MissingResourceError
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        name = "corpus.log.gz" if compressed else "corpus.log"
+        opener = gzip.open if compressed else open
+        written = 0
+        with opener(os.path.join(data_dir, name), "wt", encoding="utf-8") as f:
+            for doc in generate_corpus(file_mb * 100_000, n_terms, avg_length=15, seed=seed):
+                line = " ".join(doc) + ".\n"
+                f.write(line)
+                written += len(line)
+                if written >= file_mb * 1_000_000:
+                    break
+        before = peak_rss_mb()
+        try:
+            names, _, _, stats = ingest(data_dir, workers=1)
+        except MissingResourceError as e:
+            return {"benchmark": "ingest", "file_mb": file_mb, "compressed": compressed, "error": str(e)}
+        return {
+            "benchmark": "ingest", "file_mb": file_mb, "compressed": compressed, "n_docs": len(names),
+            "seconds": stats.seconds, "mb_per_sec": stats.mb_per_sec,
+            "rss_before_mb": before, "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+def bench_ingest(sizes_mb=(16, 64, 256), n_terms=50_000, seed=0):
+    """
+    Throughput and peak memory of ingesting one large log file, plain and
+    gzipped: streamed in passages, peak RSS should grow with the index, not
+    with the file (needs the NLTK data).
+
+    Returns:
+        list[dict]: one result per (size, compression).
+    """
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for file_mb in sizes_mb:
+        for compressed in (False, True):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                results.append(pool.submit(_bench_ingest, file_mb, compressed, n_terms, seed).result())
+    return results
+
+
+def bench_preprocess(n_docs=200, avg_length=300, seed=0):
+    """preprocess vs preprocess_fast throughput on synthetic text (needs the NLTK data)."""
+    from preprocess import MissingResourceError, preprocess, preprocess_fast
+
+    texts = [" ".join(doc) + "." for doc in generate_corpus(n_docs, avg_length=avg_length, seed=seed)]
+    n_bytes = sum(len(t) for t in texts)
+    results = []
+    for name, fn in (("preprocess", preprocess), ("preprocess_fast", preprocess_fast)):
+        try:
+            start = time.perf_counter()
+            for text in texts:
+                fn(text)
+            seconds = time.perf_counter() - start
+        except MissingResourceError as e:
+            print(f"skipping {name}: {e}", file=sys.stderr)
+            continue
+        results.append({
+            "benchmark": "preprocess",
+            "function": name,
+            "n_docs": n_docs,
+            "seconds": seconds,
+            "mb_per_sec": n_bytes / 1e6 / seconds,
+        })
+    return results
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(baseline_file, current_file):
+    """Print the ratio current/baseline of every timing in two corpus result files."""
+    with open(baseline_file, encoding="utf-8") as f:
+        baseline = {r["n_docs"]: r for r in json.load(f)["results"] if r["benchmark"] == "corpus"}
+    with open(current_file, encoding="utf-8") as f:
+        current = [r for r in json.load(f)["results"] if r["benchmark"] == "corpus"]
+    for r in current:
+        base = baseline.get(r["n_docs"])
+        if base is None:
+            continue
+        print(f"{r['n_docs']} docs")
+        print(f"  build total   {base['build_s']['total']:9.3f}s -> {r['build_s']['total']:9.3f}s "
+              f"x{r['build_s']['total'] / base['build_s']['total']:.2f}")
+        print(f"  index size    {base['index_bytes'] / 1e6:9.1f}MB -> {r['index_bytes'] / 1e6:9.1f}MB")
+        print(f"  peak RSS      {base['peak_rss_mb']:9.1f}MB -> {r['peak_rss_mb']:9.1f}MB")
+        for method, lat in r["latency"].items():
+            if method in base["latency"]:
+                old = base["latency"][method]["p95_ms"]
+                print(f"  {method:<13} p95 {old:8.3f}ms -> {lat['p95_ms']:8.3f}ms x{lat['p95_ms'] / old:.2f}"
+                      if old else f"  {method:<13} p95 {lat['p95_ms']:8.3f}ms")
+
+
+def print_corpus_result(r):
+    print(f"{r['n_docs']} docs, {r['n_terms']} terms, {r['n_tokens']} tokens: "
+          f"build {r['build_s']['total']:.2f}s, index {r['index_bytes'] / 1e6:.1f} MB, peak RSS {r['peak_rss_mb']:.0f} MB")
+    for method, lat in r["latency"].items():
+        print(f"  {method:<10} p50 {lat['p50_ms']:8.3f} ms  p95 {lat['p95_ms']:8.3f} ms  p99 {lat['p99_ms']:8.3f} ms")
+    print(f"  bm25 batch {r['bm25_batch_qps']:.0f} queries/s")
+    lsa = r["lsa"]
+    recall = ", ".join(
+        f"{recall:.3f} probing {n_probe}" for n_probe, recall in lsa["recall_at_k"].items() if recall is not None
+    )
+    print(f"  lsa {lsa['dims']} dims, {lsa['n_lists']} lists (default probe {lsa['n_probe']}): recall@k {recall or 'n/a'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search engine benchmarks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    startup = sub.add_parser("startup", help="cold/warm import time of preprocess and app")
+    startup.add_argument("--runs", type=int, default=5)
+    corpus = sub.add_parser("corpus", help="build time, index size, memory and query latency on synthetic corpora")
+    corpus.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="corpus sizes in documents (up to 10^6)")
+    corpus.add_argument("--terms", type=int, default=50_000, help="vocabulary size")
+    corpus.add_argument("--avg-length", type=int, default=150, help="mean document length in tokens")
+    corpus.add_argument("--queries", type=int, default=500, help="queries per method")
+    corpus.add_argument("--top-k", type=int, default=10)
+    corpus.add_argument("--seed", type=int, default=0)
+    sessions = sub.add_parser("sessions", help="memory and latency of many concurrent sessions sharing one index")
+    sessions.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32], help="concurrent session counts")
+    sessions.add_argument("--docs", type=int, default=5_000, help="corpus size in documents")
+    sessions.add_argument("--queries", type=int, default=100, help="queries per session")
+    sessions.add_argument("--copies", action="store_true",
+                          help="also give every session its own pickled copy (the old st.cache_data behaviour)")
+    pruning = sub.add_parser("pruning", help="index size, latency and recall of pruned impact-ordered search")
+    pruning.add_argument("--docs", type=int, default=20_000, help="corpus size in documents")
+    pruning.add_argument("--queries", type=int, default=500)
+    pruning.add_argument("--top-k", type=int, default=10)
+    pruning.add_argument("--ratios", type=float, nargs="+", default=[0.0, 0.25, 0.5, 0.75, 0.9],
+                         help="fractions of every term's postings to prune")
+    pruning.add_argument("--budgets", type=int, nargs="+", default=[0, 10_000, 1_000],
+                         help="postings scored per query (0: no budget)")
+    ingest = sub.add_parser("ingest", help="throughput and peak memory of ingesting one large file")
+    ingest.add_argument("--sizes", type=int, nargs="+", default=[16, 64, 256], help="file sizes in MB")
+    sub.add_parser("preprocess", help="preprocess vs preprocess_fast throughput")
+    diff = sub.add_parser("compare", help="compare two --json result files")
+    diff.add_argument("baseline")
+    diff.add_argument("current")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        compare(args.baseline, args.current)
+        return
+
+    if args.command == "startup":
+        results = bench_startup(args.runs)
+        for r in results:
+            print(f"import {r['module']:<12} {r['mode']:<5} median {r['median_s'] * 1000:8.1f} ms "
+                  f"(min {r['min_s'] * 1000:.1f}, max {r['max_s'] * 1000:.1f}, {r['runs']} runs)")
+    elif args.command == "corpus":
+        results = bench_corpus(args.sizes, args.terms, args.avg_length, args.queries, args.top_k, args.seed)
+        for r in results:
+            print_corpus_result(r)
+    elif args.command == "sessions":
+        results = bench_sessions(args.sessions, args.docs, queries_per_session=args.queries, copies=args.copies)
+        for r in results:
+            lat = r["latency"]
+            print(f"{r['sessions']:>4} sessions {'shared' if r['shared'] else 'copied':<6} "
+                  f"p50 {lat['p50_ms']:8.3f} ms  p95 {lat['p95_ms']:8.3f} ms  p99 {lat['p99_ms']:8.3f} ms  "
+                  f"{r['qps']:8.0f} queries/s  setup p50 {r['setup_ms']['p50_ms']:8.1f} ms  "
+                  f"RSS {r['index_rss_mb']:.0f} -> {r['peak_rss_mb']:.0f} MB")
+    elif args.command == "pruning":
+        results = bench_pruning(args.docs, n_queries=args.queries, top_k=args.top_k, ratios=args.ratios,
+                                budgets=[b or None for b in args.budgets])
+        r = results[0]
+        print(f"{r['n_docs']} docs, exhaustive bm25 p50 {r['bm25']['p50_ms']:.3f} ms  p95 {r['bm25']['p95_ms']:.3f} ms")
+        for row in r["impact"]:
+            lat = row["latency"]
+            print(f"  pruned {row['prune_ratio']:4.2f} budget {row['posting_budget'] or '-':>6}  "
+                  f"{row['postings']:>10} postings {row['index_bytes'] / 1e6:7.1f} MB  "
+                  f"p50 {lat['p50_ms']:8.3f} ms  p95 {lat['p95_ms']:8.3f} ms  recall@k {row['recall_at_k']:.3f}")
+    elif args.command == "ingest":
+        results = bench_ingest(args.sizes)
+        for r in results:
+            kind = "gzipped" if r["compressed"] else "plain"
+            if "error" in r:
+                print(f"{r['file_mb']} MB {kind}: skipped ({r['error']})")
+                continue
+            print(f"{r['file_mb']:>5} MB {kind:<7} {r['n_docs']:>7} passages in {r['seconds']:.2f}s "
+                  f"({r['mb_per_sec']:.2f} MB/s), peak RSS {r['rss_before_mb']:.0f} -> {r['peak_rss_mb']:.0f} MB")
+    else:
+        sys.path.insert(0, ROOT)
+        results = bench_preprocess()
+        for r in results:
+            print(f"{r['function']:<16} {r['seconds']:.2f}s ({r['mb_per_sec']:.2f} MB/s)")
+
+    if args.json:
+        results = {"commit": git_commit(), "python": sys.version.split()[0], "results": results}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+import re
+
+import numpy as np
+
+TOKEN = re.compile(r"\(|\)|[^\s()]+")
+OPERATORS = {"AND", "OR", "NOT"}
+END = np.iinfo(np.int64).max  # doc ID of an exhausted iterator
+
+
+# --- Query tree ---
+
+class Term:
+    def __init__(self, term):
+        self.term = term
+
+    def __str__(self):
+        return self.term
+
+
+class And:
+    def __init__(self, children):
+        self.children = children
+
+    def __str__(self):
+        return "(" + " AND ".join(map(str, self.children)) + ")"
+
+
+class Or:
+    def __init__(self, children):
+        self.children = children
+
+    def __str__(self):
+        return "(" + " OR ".join(map(str, self.children)) + ")"
+
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+
+    def __str__(self):
+        return f"NOT {self.child}"
+
+
+def _combine(cls, children):
+    # drop operands that vanished in preprocessing (stop words) and flatten nesting
+    flat = []
+    for child in children:
+        if child is None:
+            continue
+        flat.extend(child.children if isinstance(child, cls) else [child])
+    if not flat:
+        return None
+    return flat[0] if len(flat) == 1 else cls(flat)
+
+
+def parse_boolean(query, analyze):
+    """
+    Parse a boolean query into a tree of Term/And/Or/Not nodes.
+
+    Operators are the uppercase words AND, OR and NOT; parentheses group.
+    Adjacent operands are ANDed, and NOT binds tighter than AND, which
+    binds tighter than OR. Every other word goes through analyze (the
+    document preprocessing); words it drops, like stop words, are left out.
+
+    Args:
+        query (str): e.g. "database AND (system OR model) NOT oracle".
+        analyze (callable): str -> list of processed terms.
+
+    Returns:
+        Term | And | Or | Not | None: the query tree, None if no term is left.
+
+    Raises:
+        ValueError: if the query is malformed.
+    """
+    tokens = TOKEN.findall(query)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def or_expr():
+        children = [and_expr()]
+        while peek() == "OR":
+            take()
+            children.append(and_expr())
+        return _combine(Or, children)
+
+    def and_expr():
+        children = [not_expr()]
+        while peek() is not None and peek() not in (")", "OR"):
+            if peek() == "AND":
+                take()
+            children.append(not_expr())
+        return _combine(And, children)
+
+    def not_expr():
+        if peek() == "NOT":
+            take()
+            child = not_expr()
+            return None if child is None else Not(child)
+        return primary()
+
+    def primary():
+        token = peek()
+        if token is None or token in OPERATORS or token == ")":
+            raise ValueError(f"Expected a term or '(' {'at the end' if token is None else f'before {token!r}'}")
+        take()
+        if token == "(":
+            node = or_expr()
+            if peek() != ")":
+                raise ValueError("Unbalanced parentheses in query")
+            take()
+            return node
+        return _combine(And, [Term(t) for t in analyze(token)])
+
+    tree = or_expr()
+    if peek() is not None:
+        raise ValueError("Unbalanced parentheses in query")
+    return tree
+
+
+# --- Lazy evaluation ---
+
+class PostingsIterator:
+    """Cursor over one sorted posting list; seek() skips ahead by binary search."""
+
+    def __init__(self, doc_ids):
+        self.doc_ids = doc_ids
+        self.pos = 0
+        self.cost = len(doc_ids)
+        self.doc = int(doc_ids[0]) if len(doc_ids) else END
+
+    def _at(self, pos):
+        self.pos = pos
+        self.doc = int(self.doc_ids[pos]) if pos < len(self.doc_ids) else END
+        return self.doc
+
+    def next(self):
+        return self._at(self.pos + 1)
+
+    def seek(self, target):
+        """Move to the first doc >= target and return it."""
+        if self.doc >= target:
+            return self.doc
+        return self._at(self.pos + int(np.searchsorted(self.doc_ids[self.pos:], target)))
+
+
+class RangeIterator:
+    """Every doc ID below n_docs: the universe a negation is taken against."""
+
+    def __init__(self, n_docs):
+        self.n_docs = n_docs
+        self.cost = n_docs
+        self.doc = 0 if n_docs else END
+
+    def next(self):
+        self.doc = self.doc + 1 if self.doc + 1 < self.n_docs else END
+        return self.doc
+
+    def seek(self, target):
+        if self.doc < target:
+            self.doc = target if target < self.n_docs else END
+        return self.doc
+
+
+class OrIterator:
+    """Union of iterators, in doc order without repeats."""
+
+    def __init__(self, children):
+        self.children = children
+        self.cost = sum(c.cost for c in children)
+        self.doc = min(c.doc for c in children)
+
+    def next(self):
+        for child in self.children:
+            if child.doc == self.doc:
+                child.next()
+        self.doc = min(c.doc for c in self.children)
+        return self.doc
+
+    def seek(self, target):
+        if self.doc < target:
+            self.doc = min(c.seek(target) for c in self.children)
+        return self.doc
+
+
+class AndIterator:
+    """
+    Intersection of iterators, minus the docs of the negated ones.
+
+    Positive children are ordered cheapest first: the first one proposes
+    candidates and the others only seek to them. Negated children are only
+    ever probed at those candidates, never enumerated.
+    """
+
+    def __init__(self, positives, negatives=()):
+        self.positives = sorted(positives, key=lambda c: c.cost)
+        self.negatives = list(negatives)
+        self.cost = self.positives[0].cost
+        self.doc = self._align(self.positives[0].doc)
+
+    def _align(self, doc):
+        lead = self.positives[0]
+        while doc != END:
+            for child in self.positives[1:]:
+                found = child.seek(doc)
+                if found != doc:
+                    doc = lead.seek(found)
+                    break
+            else:
+                if any(neg.seek(doc) == doc for neg in self.negatives):
+                    doc = lead.next()
+                    continue
+                return doc
+        return END
+
+    def next(self):
+        self.doc = self._align(self.positives[0].next())
+        return self.doc
+
+    def seek(self, target):
+        if self.doc < target:
+            self.doc = self._align(self.positives[0].seek(target))
+        return self.doc
+
+
+def build_iterator(node, get_postings, n_docs=None):
+    """
+    Turn a query tree into a lazy doc ID iterator.
+
+    Args:
+        node (Term | And | Or | Not): parsed query.
+        get_postings (callable): term -> sorted doc ID array.
+        n_docs (int): corpus size, only needed when a NOT has nothing positive
+            to filter (e.g. "NOT a" alone, or "a OR NOT b").
+
+    Returns:
+        PostingsIterator | RangeIterator | OrIterator | AndIterator
+    """
+    if isinstance(node, Term):
+        return PostingsIterator(get_postings(node.term))
+    if isinstance(node, Or):
+        return OrIterator([build_iterator(c, get_postings, n_docs) for c in node.children])
+    children = node.children if isinstance(node, And) else [node]
+    positives = [build_iterator(c, get_postings, n_docs) for c in children if not isinstance(c, Not)]
+    negatives = [build_iterator(c.child, get_postings, n_docs) for c in children if isinstance(c, Not)]
+    if not positives:
+        if n_docs is None:
+            raise ValueError("NOT needs a positive term to filter, e.g. 'a NOT b'")
+        positives = [RangeIterator(n_docs)]
+    return AndIterator(positives, negatives)
+
+
+def iter_docs(iterator):
+    """Yield the doc IDs of an iterator, lazily, in increasing order."""
+    doc = iterator.doc
+    while doc != END:
+        yield doc
+        doc = iterator.next()
+
+
+def map_terms(node, fn):
+    """Copy of a query tree with every Term's term replaced by fn(term)."""
+    if node is None:
+        return None
+    if isinstance(node, Term):
+        return Term(fn(node.term))
+    if isinstance(node, Not):
+        return Not(map_terms(node.child, fn))
+    return type(node)([map_terms(child, fn) for child in node.children])
+
+
+def query_terms(node):
+    """Every term of a query tree, in query order (for highlighting)."""
+    if node is None:
+        return []
+    if isinstance(node, Term):
+        return [node.term]
+    if isinstance(node, Not):
+        return query_terms(node.child)
+    return [t for child in node.children for t in query_terms(child)]
@@ -0,0 +1,230 @@
+import os
+import gzip
+import json
+import logging
+from typing import NamedTuple
+
+import numpy as np
+
+# plain text sources; any of them may also be gzip-compressed (".gz")
+TEXT_SUFFIXES = (".txt", ".log", ".md")
+JSONL_SUFFIXES = (".jsonl", ".ndjson")
+TEXT_KEYS = ("text", "body", "content")  # first string field of a JSONL record that is indexed
+PASSAGE_BYTES = 64 * 1024  # larger texts are split into passages of about this size
+READ_BYTES = 1 << 20  # read size when streaming a source
+
+
+def _kind(path):
+    """"text", "jsonl" or None for a source path."""
+    name = path.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    if name.endswith(TEXT_SUFFIXES):
+        return "text"
+    if name.endswith(JSONL_SUFFIXES):
+        return "jsonl"
+    return None
+
+
+def list_corpus_files(data_dir="Dataset"):
+    """
+    List the documents under data_dir, recursively: text files (.txt, .log,
+    .md) and JSONL exports (.jsonl, .ndjson), either of them gzip-compressed
+    or not. Hidden files and folders are skipped.
+
+    Args:
+        data_dir (str): folder holding the corpus.
+
+    Returns:
+        list[str]: sorted paths relative to data_dir, "/"-separated.
+    """
+    if not os.path.exists(data_dir):
+        raise FileNotFoundError(f"Dataset folder not found at: {data_dir}")
+    found = []
+    for root, dirs, files in os.walk(data_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for f in files:
+            if not f.startswith(".") and _kind(f) is not None:
+                found.append(os.path.relpath(os.path.join(root, f), data_dir).replace(os.sep, "/"))
+    return sorted(found)
+
+
+def open_source(file_path):
+    """Open a source for binary reading, decompressing it on the fly if it is gzipped."""
+    return gzip.open(file_path, "rb") if file_path.lower().endswith(".gz") else open(file_path, "rb")
+
+
+def read_document(file_path):
+    """Read one document whole, warning when it has no content."""
+    with open_source(file_path) as file:
+        content = file.read().decode("utf-8", errors="replace")
+        if not content.strip():
+            logging.warning(f"Empty file: {os.path.basename(file_path)}")
+        return content
+
+
+class Passage(NamedTuple):
+    """
+    One indexed document: a whole small file, a passage of a large one or a JSONL record.
+
+    Attributes:
+        name (str): display name: the path, with ":<line>" for a part of a
+            file and "@<byte>" for a passage that starts inside a line.
+        text (str): the text that is indexed.
+        path (str): source path, relative to the data folder.
+        start, end (int): byte offsets of the text in the decompressed source
+            (of the record's line, for JSONL).
+        line (int): 1-based line of the source the text starts at.
+    """
+    name: str
+    text: str
+    path: str
+    start: int
+    end: int
+    line: int
+
+
+def _cut(buffer, start, limit):
+    # length of the next passage of buffer[start:]: up to the last blank line
+    # or else line break in the second half of the window, else up to the
+    # last UTF-8 character boundary
+    for separator in (b"\n\n", b"\n"):
+        at = buffer.rfind(separator, start + limit // 2, start + limit)
+        if at >= 0:
+            return at + len(separator) - start
+    cut = limit
+    while cut > 0 and (buffer[start + cut] & 0xC0) == 0x80:
+        cut -= 1
+    return cut or limit
+
+
+def _text_passages(path, file, passage_bytes):
+    # the unread bytes are buffer[pos:]; the buffer is only compacted when it is refilled
+    buffer, pos = b"", 0
+    start, line = 0, 1
+    eof = split = False
+    line_start = True
+    while not eof or pos < len(buffer):
+        left = len(buffer) - pos
+        if not eof and left < 2 * passage_bytes:
+            chunk = file.read(max(READ_BYTES, passage_bytes))
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        size = left if left <= passage_bytes else _cut(buffer, pos, passage_bytes)
+        end = pos + size
+        split = split or end < len(buffer)
+        # a file of several passages names every passage by its first line, and
+        # by its byte offset too when it continues a line too long for one passage
+        name = (f"{path}:{line}" if line_start else f"{path}:{line}@{start}") if split else path
+        yield Passage(name, buffer[pos:end].decode("utf-8", errors="replace"), path, start, start + size, line)
+        start += size
+        line += buffer.count(b"\n", pos, end)
+        line_start = buffer[end - 1:end] == b"\n"
+        pos = end
+
+
+def _jsonl_passages(path, file):
+    start = 0
+    for line, record in enumerate(file, 1):
+        end = start + len(record)
+        try:
+            value = json.loads(record) if record.strip() else None
+        except ValueError:
+            logging.warning(f"Skipping invalid JSON at {path}:{line}")
+            value = None
+        if isinstance(value, dict):
+            text = next((value[k] for k in TEXT_KEYS if isinstance(value.get(k), str)), None)
+            if text is not None:
+                yield Passage(f"{path}:{line}", text, path, start, end, line)
+        start = end
+
+
+def iter_passages(data_dir, path, passage_bytes=PASSAGE_BYTES):
+    """
+    Stream the documents of one source without reading it whole.
+
+    A text file up to passage_bytes is one document, named by its path (an
+    empty file too, as an empty document); a larger one is split into
+    passages of at most passage_bytes, cut at a blank line or line break
+    where possible. Every JSONL record with a
+    "text", "body" or "content" string is one document. Gzipped sources are
+    decompressed as they are read, so memory stays bounded by the passage
+    size (or the longest JSONL line) whatever the size of the file.
+
+    Args:
+        data_dir (str): folder holding the corpus.
+        path (str): source path relative to data_dir (see list_corpus_files).
+        passage_bytes (int): largest passage, in bytes.
+
+    Yields:
+        Passage
+    """
+    with open_source(os.path.join(data_dir, path)) as file:
+        if _kind(path) == "jsonl":
+            yield from _jsonl_passages(path, file)
+            return
+        empty, any_passage = True, False
+        for passage in _text_passages(path, file, passage_bytes):
+            empty = empty and not passage.text.strip()
+            any_passage = True
+            yield passage
+        if empty:
+            logging.warning(f"Empty file: {path}")
+        if not any_passage:
+            yield Passage(path, "", path, 0, 0, 1)
+
+
+def read_region(data_dir, path, start, end):
+    """Bytes start:end of a (decompressed) source, decoded: where a document came from."""
+    with open_source(os.path.join(data_dir, path)) as file:
+        file.seek(start)  # gzip streams seek by decompressing up to start
+        return file.read(end - start).decode("utf-8", errors="replace")
+
+
+class SourceSpans:
+    """
+    Where every document of an index comes from.
+
+    Attributes:
+        paths (list[str]): source files, relative to the data folder.
+        doc_sources (np.ndarray): int64 index into paths, per document.
+        starts, ends (np.ndarray): int64 byte offsets of every document's
+            text in its decompressed source (see Passage).
+        lines (np.ndarray): int64 1-based first source line of every document.
+    """
+
+    def __init__(self, paths, doc_sources, starts, ends, lines):
+        self.paths = paths
+        self.doc_sources = doc_sources
+        self.starts = starts
+        self.ends = ends
+        self.lines = lines
+
+    def __len__(self):
+        return len(self.doc_sources)
+
+    def locate(self, doc_idx):
+        """(path, start, end, line) of a document."""
+        return (
+            self.paths[int(self.doc_sources[doc_idx])], int(self.starts[doc_idx]),
+            int(self.ends[doc_idx]), int(self.lines[doc_idx]),
+        )
+
+    @classmethod
+    def from_spans(cls, spans):
+        """SourceSpans of (path, start, end, line) tuples, one per document."""
+        ids = {}
+        doc_sources = [ids.setdefault(path, len(ids)) for path, _, _, _ in spans]
+        paths = sorted(ids, key=ids.get)
+        return cls(
+            paths, np.array(doc_sources, dtype=np.int64),
+            np.array([s[1] for s in spans], dtype=np.int64),
+            np.array([s[2] for s in spans], dtype=np.int64),
+            np.array([s[3] for s in spans], dtype=np.int64),
+        )
+
+    @classmethod
+    def whole_documents(cls, filenames, raw_docs):
+        """Spans of documents that are each a whole file (of an index built without sources)."""
+        return cls.from_spans([(name, 0, len(text.encode("utf-8")), 1) for name, text in zip(filenames, raw_docs)])
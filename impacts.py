@@ -0,0 +1,172 @@
+import threading
+from collections import Counter
+
+import numpy as np
+
+IMPACT_LEVELS = 255  # impacts are quantized to the uint8 levels 1..IMPACT_LEVELS
+
+
+class ImpactIndex:
+    """
+    Impact-ordered postings for score-at-a-time ranking.
+
+    Every posting's score contribution is quantized to an integer level.
+    A term's postings are grouped into blocks of equal level, blocks in
+    decreasing level order and doc IDs sorted inside each block, so the
+    postings that add most to a score are read first and evaluation can
+    stop at any block boundary with the best partial ranking so far.
+
+    Attributes:
+        term_to_index (dict[str, int]): term -> term ID.
+        term_blocks (np.ndarray): int64, the blocks of term t are
+            term_blocks[t]:term_blocks[t + 1].
+        block_levels (np.ndarray): uint8 impact level of every block.
+        block_offsets (np.ndarray): int64, the docs of block i are
+            docs[block_offsets[i]:block_offsets[i + 1]].
+        docs (np.ndarray): uint32 doc IDs of every block, back to back.
+        n_docs (int): number of documents.
+        scale (float): score of one impact level.
+        prune_ratio (float): fraction of every term's postings dropped at build time.
+    """
+
+    def __init__(self, term_to_index, term_blocks, block_levels, block_offsets, docs, n_docs, scale,
+                 prune_ratio=0.0):
+        self.term_to_index = term_to_index
+        self.term_blocks = term_blocks
+        self.block_levels = block_levels
+        self.block_offsets = block_offsets
+        self.docs = docs
+        self.n_docs = n_docs
+        self.scale = scale
+        self.prune_ratio = prune_ratio
+        self._buffers = threading.local()
+
+    def __getstate__(self):
+        # the per-thread buffers are scratch space, and thread-locals don't pickle
+        state = self.__dict__.copy()
+        del state["_buffers"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._buffers = threading.local()
+
+    @property
+    def n_postings(self):
+        return self.docs.size
+
+    def query_weights(self, query_terms):
+        """
+        Weights of the query terms in the index: the impacts are BM25
+        scores, so a repeated query term weighs its count.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: term IDs and their weights.
+        """
+        ids, weights = [], []
+        for term, n in Counter(query_terms).items():
+            term_id = self.term_to_index.get(term)
+            if term_id is not None:
+                ids.append(term_id)
+                weights.append(n)
+        return np.array(ids, dtype=np.int64), np.array(weights, dtype=np.float64)
+
+    def score_buffer(self):
+        """
+        Zeroed score accumulator of length n_docs, allocated once per thread.
+
+        Callers must zero the entries they touched before returning.
+        """
+        buffer = getattr(self._buffers, "scores", None)
+        if buffer is None:
+            buffer = self._buffers.scores = np.zeros(self.n_docs, dtype=np.float64)
+        return buffer
+
+    def pruned(self, prune_ratio):
+        """A copy keeping only the highest-impact 1 - prune_ratio of every term's postings."""
+        term_ids = np.repeat(
+            np.arange(self.term_blocks.size - 1), np.diff(self.block_offsets[self.term_blocks]))
+        levels = np.repeat(self.block_levels, np.diff(self.block_offsets))
+        return _from_postings(
+            self.term_to_index, term_ids, self.docs, levels, self.n_docs, self.scale,
+            prune_ratio, quantized=True,
+        )
+
+
+def _from_postings(term_to_index, term_ids, docs, values, n_docs, scale, prune_ratio, quantized=False):
+    n_terms = len(term_to_index)
+    if quantized:
+        levels = values.astype(np.uint8)
+    else:
+        levels = np.clip(np.rint(values / scale), 1, IMPACT_LEVELS).astype(np.uint8) if values.size \
+            else np.empty(0, np.uint8)
+    # by term, then highest level first, then doc ID
+    order = np.lexsort((docs, -levels.astype(np.int16), term_ids))
+    term_ids, docs, levels = term_ids[order], docs[order], levels[order]
+
+    term_starts = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=n_terms), out=term_starts[1:])
+    if prune_ratio > 0:
+        # term-centric static pruning: every term keeps its best postings, at least one
+        sizes = np.diff(term_starts)
+        keep = np.where(sizes > 0, np.maximum(1, np.ceil(sizes * (1 - prune_ratio))), 0).astype(np.int64)
+        rank = np.arange(term_ids.size) - term_starts[term_ids]
+        kept = rank < keep[term_ids]
+        term_ids, docs, levels = term_ids[kept], docs[kept], levels[kept]
+        term_starts[1:] = np.cumsum(keep)
+
+    # a block starts wherever the term or the level changes
+    new_block = np.ones(term_ids.size, dtype=bool)
+    new_block[1:] = (term_ids[1:] != term_ids[:-1]) | (levels[1:] != levels[:-1])
+    block_starts = np.flatnonzero(new_block)
+    block_offsets = np.append(block_starts, term_ids.size).astype(np.int64)
+    term_blocks = np.searchsorted(block_starts, term_starts).astype(np.int64)
+    return ImpactIndex(
+        term_to_index, term_blocks, levels[block_starts], block_offsets,
+        docs.astype(np.uint32), n_docs, scale, prune_ratio,
+    )
+
+
+def build_impact_index(term_to_index, term_ids, docs, impacts, n_docs, prune_ratio=0.0, scale=None):
+    """
+    Quantize postings and lay them out impact-ordered.
+
+    Impacts are mapped linearly onto the levels 1..IMPACT_LEVELS, the
+    largest impact of the index getting the top level unless scale is
+    given.
+
+    Args:
+        term_to_index (dict[str, int]): term -> term ID.
+        term_ids, docs, impacts (np.ndarray): one entry per posting.
+        n_docs (int): number of documents.
+        prune_ratio (float): fraction in [0, 1) of every term's lowest-impact
+            postings to drop.
+        scale (float | None): score of one impact level. Indexes searched
+            together (e.g. shards) must share one, so their quantized scores
+            compare; None derives it from this index's largest impact.
+
+    Returns:
+        ImpactIndex
+    """
+    if not 0 <= prune_ratio < 1:
+        raise ValueError("prune_ratio must be in [0, 1)")
+    impacts = np.asarray(impacts, dtype=np.float64)
+    if scale is None:
+        top = float(impacts.max()) if impacts.size else 0.0
+        scale = top / IMPACT_LEVELS if top > 0 else 1.0
+    return _from_postings(
+        term_to_index, np.asarray(term_ids, dtype=np.int64), np.asarray(docs), impacts,
+        n_docs, scale, prune_ratio,
+    )
+
+
+def impact_index_from_bm25(bm25_index, vocabulary, prune_ratio=0.0, scale=None):
+    """ImpactIndex of the precomputed BM25 scores of every posting."""
+    lists = [bm25_index.postings.get(t) for t in vocabulary]
+    lists = [(i, p) for i, p in enumerate(lists) if p is not None and p.doc_ids.size]
+    term_ids = np.repeat([i for i, _ in lists], [p.doc_ids.size for _, p in lists]).astype(np.int64)
+    docs = np.concatenate([p.doc_ids for _, p in lists]) if lists else np.empty(0, np.uint32)
+    impacts = np.concatenate([p.impacts for _, p in lists]) if lists else np.empty(0, np.float32)
+    term_to_index = {term: i for i, term in enumerate(vocabulary)}
+    return build_impact_index(term_to_index, term_ids, docs, impacts, bm25_index.n_docs, prune_ratio, scale)
+
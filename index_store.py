@@ -0,0 +1,308 @@
+import os
+import json
+import shutil
+import logging
+from collections.abc import Mapping
+
+import numpy as np
+from scipy.sparse import csc_matrix
+
+from indexing import (
+    IncidenceMatrix,
+    PositionalPostings,
+    Bm25Postings,
+    Bm25Index,
+    TfidfIndex,
+    SentenceIndex,
+)
+from semantic import LsaIndex
+from impacts import ImpactIndex
+from analysis import Schema
+from corpus import SourceSpans
+
+FORMAT_VERSION = 7
+MANIFEST = "manifest.json"
+
+
+class TermMap(Mapping):
+    """
+    Read-only term -> postings mapping over the flat on-disk arrays.
+
+    Postings objects are created on lookup as views into the memory-mapped
+    arrays, so opening an index does not touch the postings at all.
+    """
+
+    def __init__(self, term_to_index, factory):
+        self._term_to_index = term_to_index
+        self._factory = factory
+
+    def __getitem__(self, term):
+        return self._factory(self._term_to_index[term])
+
+    def __contains__(self, term):
+        return term in self._term_to_index
+
+    def __iter__(self):
+        return iter(self._term_to_index)
+
+    def __len__(self):
+        return len(self._term_to_index)
+
+
+class RawDocs:
+    """Sequence of document texts decoded on access from one UTF-8 blob."""
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __getitem__(self, i):
+        return bytes(self._blob[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8")
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def packed(self):
+        """The (blob, offsets) arrays, to write the texts without decoding them."""
+        return self._blob, self._offsets
+
+
+def _pack_strings(strings):
+    """Concatenate strings as UTF-8 and return (blob, int64 offsets)."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _concat(arrays, dtype):
+    return np.concatenate(arrays).astype(dtype, copy=False) if arrays else np.empty(0, dtype=dtype)
+
+
+def write_index(index_dir, filenames, raw_docs, indexes):
+    """
+    Write the index structures to index_dir in the binary format.
+
+    Every array is saved as its own .npy file, postings laid out flat in
+    vocabulary order with offset arrays, so open_index can memory-map them;
+    the BM25 postings of extra fields follow those of the vocabulary. The
+    analysis configuration goes into the manifest. Without indexes["sources"]
+    every document is taken to be a whole file named by its filename. The directory is written
+    next to its target and swapped in at the end.
+
+    Args:
+        index_dir (str): destination folder.
+        filenames (list of str): document names, in doc ID order.
+        raw_docs (list of str or RawDocs): document texts, in doc ID order.
+        indexes (dict): output of indexing.build_indexes, optionally with
+            "sources" (see ingest.ingest).
+    """
+    vocabulary = indexes["vocabulary"]
+    field_vocabulary = indexes["field_vocabulary"]
+    schema = indexes["analysis"]
+    bm25 = indexes["bm25_index"]
+    positional = indexes["positional_index"]
+    tfidf = indexes["tfidf_index"]
+    sentences = indexes["sentence_index"]
+    lsa = indexes["lsa_index"]
+    impact = indexes["impact_index"]
+    sources = indexes.get("sources")
+    if sources is None:
+        sources = SourceSpans.whole_documents(filenames, raw_docs)
+
+    # a shard's vocabulary is the whole corpus's, so some terms have no postings here
+    empty = Bm25Postings(np.empty(0, np.uint32), np.empty(0, np.uint32), np.empty(0, np.float32))
+    postings = [bm25.postings.get(t, empty) for t in vocabulary + field_vocabulary]
+    postings_offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+    np.cumsum([p.doc_ids.size for p in postings], out=postings_offsets[1:])
+    # positions are stored per posting, in the same order as postings_docs
+    positions = []
+    position_counts = []
+    for t in vocabulary:
+        entry = positional.get(t)
+        if entry is not None:
+            positions.append(entry.positions)
+            position_counts.append(np.diff(entry.offsets))
+    positions_offsets = np.zeros(postings_offsets[len(vocabulary)] + 1, dtype=np.int64)
+    np.cumsum(_concat(position_counts, np.int64), out=positions_offsets[1:])
+
+    lexicon, lexicon_offsets = _pack_strings(vocabulary)
+    field_lexicon, field_lexicon_offsets = _pack_strings(field_vocabulary)
+    docs, docs_offsets = raw_docs.packed() if isinstance(raw_docs, RawDocs) else _pack_strings(raw_docs)
+    source_paths, source_paths_offsets = _pack_strings(sources.paths)
+    arrays = {
+        "lexicon": lexicon,
+        "lexicon_offsets": lexicon_offsets,
+        "field_lexicon": field_lexicon,
+        "field_lexicon_offsets": field_lexicon_offsets,
+        "postings_offsets": postings_offsets,
+        "postings_docs": _concat([p.doc_ids for p in postings], np.uint32),
+        "postings_tfs": _concat([p.tfs for p in postings], np.uint32),
+        "postings_impacts": _concat([p.impacts for p in postings], np.float32),
+        "max_impacts": np.array([p.max_impact for p in postings], dtype=np.float32),
+        "positions_offsets": positions_offsets,
+        "positions": _concat(positions, np.uint32),
+        "doc_lengths": bm25.doc_lengths["body"].astype(np.uint32),
+        "field_doc_lengths": np.array(
+            [bm25.doc_lengths[name] for name in schema.fields], dtype=np.uint32).reshape(len(schema.fields), len(filenames)),
+        "incidence_words": indexes["term_doc_matrix"].words,
+        "tfidf_idf": tfidf.idf.astype(np.float64),
+        "tfidf_data": tfidf.doc_matrix.data.astype(np.float64),
+        "tfidf_indices": tfidf.doc_matrix.indices,
+        "tfidf_indptr": tfidf.doc_matrix.indptr,
+        "tfidf_max_weights": tfidf.max_weights.astype(np.float64),
+        "docs": docs,
+        "docs_offsets": docs_offsets,
+        "source_paths": source_paths,
+        "source_paths_offsets": source_paths_offsets,
+        "source_ids": sources.doc_sources.astype(np.int64),
+        "source_starts": sources.starts.astype(np.int64),
+        "source_ends": sources.ends.astype(np.int64),
+        "source_lines": sources.lines.astype(np.int64),
+        "sentence_offsets": sentences.doc_offsets,
+        "sentence_char_starts": sentences.char_starts,
+        "sentence_char_ends": sentences.char_ends,
+        "sentence_token_starts": sentences.token_starts,
+        "lsa_term_vectors": lsa.term_vectors.astype(np.float32),
+        "lsa_centroids": lsa.centroids.astype(np.float32),
+        "lsa_list_offsets": lsa.list_offsets.astype(np.int64),
+        "lsa_list_docs": lsa.list_docs.astype(np.uint32),
+        "lsa_embeddings": lsa.embeddings.astype(np.float32),
+        "impact_term_blocks": impact.term_blocks.astype(np.int64),
+        "impact_block_levels": impact.block_levels.astype(np.uint8),
+        "impact_block_offsets": impact.block_offsets.astype(np.int64),
+        "impact_docs": impact.docs.astype(np.uint32),
+    }
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "n_docs": len(filenames),
+        "n_terms": len(vocabulary),
+        "filenames": list(filenames),
+        "analysis": schema.config,
+        "bm25": {"k1": bm25.k1, "b": bm25.b},
+        "lsa": {"n_probe": lsa.n_probe},
+        "impact": {"scale": impact.scale, "prune_ratio": impact.prune_ratio},
+    }
+
+    tmp_dir = index_dir.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(array))
+    # the manifest goes last: a folder without one is never opened
+    with open(os.path.join(tmp_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    old_dir = index_dir.rstrip(os.sep) + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def index_exists(index_dir):
+    """Return True if index_dir holds a complete index."""
+    return os.path.exists(os.path.join(index_dir, MANIFEST))
+
+
+def open_index(index_dir):
+    """
+    Open an index written by write_index, memory-mapping its arrays.
+
+    Only the manifest and lexicon are read eagerly; postings, positions,
+    TF-IDF weights and document texts are paged in by the OS on access and
+    shared between processes that open the same index.
+
+    Args:
+        index_dir (str): folder written by write_index.
+
+    Returns:
+        dict: the same keys as load_and_index in app.py.
+    """
+    with open(os.path.join(index_dir, MANIFEST), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(
+            f"Index at {index_dir} has format version {manifest.get('format_version')}, "
+            f"expected {FORMAT_VERSION}; rebuild it with `python segments.py --rebuild`"
+        )
+
+    def load(name):
+        return np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+
+    lexicon = RawDocs(load("lexicon"), load("lexicon_offsets"))
+    vocabulary = list(lexicon)
+    term_to_index = {term: i for i, term in enumerate(vocabulary)}
+    field_vocabulary = list(RawDocs(load("field_lexicon"), load("field_lexicon_offsets")))
+    # BM25 and impact postings: the vocabulary's, then the extra fields'
+    all_terms_to_index = {term: i for i, term in enumerate(vocabulary + field_vocabulary)}
+    n_docs = manifest["n_docs"]
+    schema = Schema.from_config(manifest["analysis"])
+    field_doc_lengths = load("field_doc_lengths")
+
+    postings_offsets = load("postings_offsets")
+    postings_docs = load("postings_docs")
+    postings_tfs = load("postings_tfs")
+    postings_impacts = load("postings_impacts")
+    max_impacts = load("max_impacts")
+    positions_offsets = load("positions_offsets")
+    positions = load("positions")
+
+    def doc_ids(i):
+        return postings_docs[postings_offsets[i]:postings_offsets[i + 1]]
+
+    def positional(i):
+        start, end = postings_offsets[i], postings_offsets[i + 1]
+        return PositionalPostings(postings_docs[start:end], positions_offsets[start:end + 1], positions)
+
+    def bm25(i):
+        start, end = postings_offsets[i], postings_offsets[i + 1]
+        return Bm25Postings(
+            postings_docs[start:end], postings_tfs[start:end], postings_impacts[start:end], float(max_impacts[i])
+        )
+
+    tfidf_matrix = csc_matrix(
+        (load("tfidf_data"), load("tfidf_indices"), load("tfidf_indptr")),
+        shape=(n_docs, len(vocabulary)),
+        copy=False,
+    )
+    tfidf_index = TfidfIndex(term_to_index, load("tfidf_idf"), tfidf_matrix, load("tfidf_max_weights"))
+    logging.info(f"Opened index at {index_dir} ({n_docs} documents, {len(vocabulary)} terms)")
+    return {
+        "filenames": manifest["filenames"],
+        "raw_docs": RawDocs(load("docs"), load("docs_offsets")),
+        "sources": SourceSpans(
+            list(RawDocs(load("source_paths"), load("source_paths_offsets"))), load("source_ids"),
+            load("source_starts"), load("source_ends"), load("source_lines"),
+        ),
+        "analysis": schema,
+        "vocabulary": vocabulary,
+        "field_vocabulary": field_vocabulary,
+        "term_doc_matrix": IncidenceMatrix(term_to_index, load("incidence_words"), n_docs),
+        "inverted_index": TermMap(term_to_index, doc_ids),
+        "positional_index": TermMap(term_to_index, positional),
+        "tfidf_index": tfidf_index,
+        "bm25_index": Bm25Index(
+            TermMap(all_terms_to_index, bm25),
+            {"body": load("doc_lengths"), **{name: field_doc_lengths[i] for i, name in enumerate(schema.fields)}},
+            manifest["bm25"]["k1"], manifest["bm25"]["b"],
+        ),
+        "sentence_index": SentenceIndex(
+            load("sentence_offsets"), load("sentence_char_starts"),
+            load("sentence_char_ends"), load("sentence_token_starts"),
+        ),
+        "lsa_index": LsaIndex(
+            tfidf_index, load("lsa_term_vectors"), load("lsa_centroids"), load("lsa_list_offsets"),
+            load("lsa_list_docs"), load("lsa_embeddings"), manifest["lsa"]["n_probe"],
+        ),
+        "impact_index": ImpactIndex(
+            all_terms_to_index, load("impact_term_blocks"), load("impact_block_levels"),
+            load("impact_block_offsets"), load("impact_docs"), n_docs,
+            manifest["impact"]["scale"], manifest["impact"]["prune_ratio"],
+        ),
+    }
+
@@ -1,5 +1,11 @@
+import threading
 import numpy as np
-from collections import defaultdict
+from array import array
+from collections import Counter, defaultdict
+from scipy.sparse import csr_matrix
+from semantic import build_lsa_index
+from impacts import impact_index_from_bm25
+from analysis import DEFAULT_SCHEMA, Schema, field_term
 
 
 def build_vocabulary(preprocessed_docs):
@@ -18,41 +24,696 @@ def build_vocabulary(preprocessed_docs):
     return sorted(vocab)
 
 
+class IncidenceMatrix:
+    """
+    Bit-packed term-document incidence matrix.
+
+    Each term row is stored as ceil(|documents| / 64) uint64 words, bit j of
+    word w set when the term occurs in document w * 64 + j.
+
+    Attributes:
+        term_to_index (dict[str, int]): term -> row in words, built once.
+        words (np.ndarray): uint64 array of shape (|vocabulary|, n_words).
+        n_docs (int): number of documents (columns).
+    """
+
+    def __init__(self, term_to_index, words, n_docs):
+        self.term_to_index = term_to_index
+        self.words = words
+        self.n_docs = n_docs
+
+    def row(self, term):
+        """Return the packed row for term, or None if it is not in the vocabulary."""
+        idx = self.term_to_index.get(term)
+        return None if idx is None else self.words[idx]
+
+    def to_doc_ids(self, packed_row, first_word=0):
+        """
+        Unpack a row of uint64 words into the sorted indices of its set bits;
+        for a slice of a row starting at word first_word, the indices are
+        those of the whole row.
+        """
+        bits = np.unpackbits(packed_row.astype("<u8").view(np.uint8), bitorder="little")
+        return np.flatnonzero(bits[:max(0, self.n_docs - first_word * 64)]) + first_word * 64
+
+
 def build_term_doc_matrix(preprocessed_docs, vocabulary):
     """
-    Build the term-document incidence matrix (binary).
+    Build the term-document incidence matrix (binary, bit-packed).
 
     Args:
         preprocessed_docs (list of list of str): Tokenized documents.
         vocabulary (list of str): List of all terms.
 
     Returns:
-        np.ndarray: 2D binary matrix of shape (|vocabulary|, |documents|).
+        IncidenceMatrix: packed rows of shape (|vocabulary|, ceil(|documents| / 64)).
+    """
+    return IndexBuilder.from_documents(preprocessed_docs).term_doc_matrix(vocabulary)
+
+
+def encode_postings(doc_ids):
+    """
+    Compress a sorted posting list with delta + varint encoding.
+
+    Args:
+        doc_ids (array-like of int): sorted, unique document indices.
+
+    Returns:
+        bytes: gaps between consecutive doc IDs, 7 bits per byte, high bit set
+        on every byte except the last one of each gap.
+    """
+    out = bytearray()
+    prev = 0
+    for doc_id in doc_ids:
+        gap = int(doc_id) - prev
+        prev = int(doc_id)
+        while gap >= 0x80:
+            out.append((gap & 0x7F) | 0x80)
+            gap >>= 7
+        out.append(gap)
+    return bytes(out)
+
+
+def decode_postings(data):
+    """
+    Decode a posting list produced by encode_postings.
+
+    Args:
+        data (bytes): delta + varint encoded posting list.
+
+    Returns:
+        np.ndarray: sorted uint32 document indices.
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if raw.size == 0:
+        return np.empty(0, dtype=np.uint32)
+    is_last = raw < 0x80
+    starts = np.flatnonzero(np.concatenate(([True], is_last[:-1])))
+    # byte position inside its varint -> shift of its 7-bit payload
+    group = np.cumsum(np.concatenate(([0], is_last[:-1]))).astype(np.intp)
+    shift = (np.arange(raw.size) - starts[group]) * 7
+    gaps = np.add.reduceat((raw & 0x7F).astype(np.uint64) << shift.astype(np.uint64), starts)
+    return np.cumsum(gaps).astype(np.uint32)
+
+
+def build_inverted_index(preprocessed_docs, compress=False):
+    """
+    Build an inverted index mapping terms to sorted posting lists.
+
+    Args:
+        preprocessed_docs (list of list of str): Tokenized documents.
+        compress (bool): store each posting list delta + varint encoded.
+
+    Returns:
+        dict[str, np.ndarray | bytes]: Inverted index of uint32 doc IDs
+        (or their encode_postings bytes when compress is True).
+    """
+    return IndexBuilder.from_documents(preprocessed_docs).inverted_index(compress)
+
+
+class PositionalPostings:
+    """
+    Positions of one term, stored in three flat arrays (CSR layout).
+
+    Attributes:
+        doc_ids (np.ndarray): sorted uint32 doc IDs containing the term.
+        offsets (np.ndarray): int64 array of length len(doc_ids) + 1; the
+            positions in doc_ids[i] are positions[offsets[i]:offsets[i + 1]].
+        positions (np.ndarray): uint32 token positions, sorted within each doc.
+    """
+
+    def __init__(self, doc_ids, offsets, positions):
+        self.doc_ids = doc_ids
+        self.offsets = offsets
+        self.positions = positions
+
+    def positions_in(self, slot):
+        """Return the positions for the doc stored at index slot of doc_ids."""
+        return self.positions[self.offsets[slot]:self.offsets[slot + 1]]
+
+
+def build_positional_index(preprocessed_docs):
+    """
+    Build a positional inverted index: term -> doc -> token positions.
+
+    Positions count tokens after preprocessing, so phrase queries must be
+    preprocessed with the same pipeline.
+
+    Args:
+        preprocessed_docs (list of list of str): Tokenized documents.
+
+    Returns:
+        dict[str, PositionalPostings]: Positional index.
+    """
+    return IndexBuilder.from_documents(preprocessed_docs).positional_index()
+
+
+class Bm25Postings:
+    """
+    Postings of one term for BM25 ranking.
+
+    Attributes:
+        doc_ids (np.ndarray): sorted uint32 doc IDs containing the term.
+        tfs (np.ndarray): uint32 term frequency of each posting.
+        impacts (np.ndarray): float32 BM25 score contribution of each posting.
+        max_impact (float): upper bound of impacts, used for top-k pruning.
+    """
+
+    def __init__(self, doc_ids, tfs, impacts, max_impact=None):
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.impacts = impacts
+        if max_impact is None:
+            max_impact = float(impacts.max()) if impacts.size else 0.0
+        self.max_impact = max_impact
+
+
+class Bm25Index:
+    """
+    BM25 ranking statistics over the preprocessed corpus.
+
+    Per-posting scores are precomputed at index time from the stored term
+    frequencies and document lengths. Lengths are kept per field: the
+    postings of a field other than the body (see analysis.Schema) are keyed
+    by analysis.field_term, scored against that field's own lengths and
+    multiplied by its boost, so a query scores fields by adding their terms.
+
+    Attributes:
+        postings (dict[str, Bm25Postings]): term (or field term) -> postings.
+        doc_lengths (dict[str, np.ndarray]): field -> uint32 length of each doc.
+        avg_doc_length (float): mean body length.
+        k1 (float): term frequency saturation.
+        b (float): length normalization.
+    """
+
+    def __init__(self, postings, doc_lengths, k1, b):
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.avg_doc_length = float(doc_lengths["body"].mean()) if doc_lengths["body"].size else 0.0
+        self.k1 = k1
+        self.b = b
+
+    @property
+    def n_docs(self):
+        return len(self.doc_lengths["body"])
+
+
+def bm25_idf(n_docs, doc_freq):
+    """BM25 IDF, smoothed so it stays positive for very common terms."""
+    return np.log(1.0 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+def build_bm25_index(preprocessed_docs, k1=1.2, b=0.75):
+    """
+    Build the BM25 index: per-posting term frequencies, document lengths and
+    precomputed posting scores.
+
+    Args:
+        preprocessed_docs (list of list of str): Tokenized documents.
+        k1 (float): term frequency saturation.
+        b (float): length normalization.
+
+    Returns:
+        Bm25Index: postings and statistics for BM25 ranking.
     """
-    term_to_index = {term: i for i, term in enumerate(vocabulary)}
-    matrix = np.zeros((len(vocabulary), len(preprocessed_docs)), dtype=int)
-    for doc_idx, tokens in enumerate(preprocessed_docs):
-        for term in set(tokens):
-            if term in term_to_index:
-                matrix[term_to_index[term], doc_idx] = 1
-    return matrix
+    return IndexBuilder.from_documents(preprocessed_docs).bm25_index(k1, b)
 
 
-def build_inverted_index(preprocessed_docs):
+class TfidfIndex:
     """
-    Build an inverted index mapping terms to lists of document indices.
+    TF-IDF model fitted once over the preprocessed corpus.
+
+    The weights are stored column by column (CSC), so the documents and
+    weights of one term are a contiguous slice: term-at-a-time scoring
+    reads only the postings of the query terms.
+
+    Attributes:
+        term_to_index (dict[str, int]): term -> column in doc_matrix.
+        idf (np.ndarray): IDF weight for each term column.
+        doc_matrix (scipy.sparse.csc_matrix): L2-normalized TF-IDF weights,
+            shape (|documents|, |vocabulary|).
+        max_weights (np.ndarray): largest weight of each column, to bound
+            what a term can add to a score.
+    """
+
+    def __init__(self, term_to_index, idf, doc_matrix, max_weights=None):
+        self.term_to_index = term_to_index
+        self.idf = idf
+        self.doc_matrix = doc_matrix
+        if max_weights is None:
+            max_weights = np.zeros(doc_matrix.shape[1], dtype=np.float64)
+            nonempty = np.diff(doc_matrix.indptr) > 0
+            if doc_matrix.nnz:
+                max_weights[nonempty] = np.maximum.reduceat(doc_matrix.data, doc_matrix.indptr[:-1][nonempty])
+        self.max_weights = max_weights
+        self._buffers = threading.local()
+
+    def __getstate__(self):
+        # the per-thread buffers are scratch space, and thread-locals don't pickle
+        state = self.__dict__.copy()
+        del state["_buffers"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._buffers = threading.local()
+
+    def column(self, col):
+        """(doc IDs, weights) of one term column, as views into doc_matrix."""
+        start, end = self.doc_matrix.indptr[col], self.doc_matrix.indptr[col + 1]
+        return self.doc_matrix.indices[start:end], self.doc_matrix.data[start:end]
+
+    def query_weights(self, query_terms):
+        """
+        L2-normalized TF-IDF weights of the query terms in the vocabulary.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: term columns and their weights.
+        """
+        cols, weights = [], []
+        for term, count in Counter(query_terms).items():
+            col = self.term_to_index.get(term)
+            if col is not None:
+                cols.append(col)
+                weights.append(count * self.idf[col])
+        weights = np.array(weights, dtype=np.float64)
+        norm = np.linalg.norm(weights)
+        if norm > 0:
+            weights /= norm
+        return np.array(cols, dtype=np.int64), weights
+
+    def score_buffer(self):
+        """
+        Zeroed score accumulator of length |documents|, allocated once per thread.
+
+        Callers must zero the entries they touched before returning.
+        """
+        buffer = getattr(self._buffers, "scores", None)
+        if buffer is None:
+            buffer = self._buffers.scores = np.zeros(self.doc_matrix.shape[0], dtype=np.float64)
+        return buffer
+
+    def vectorize(self, query_terms):
+        """
+        Turn preprocessed query tokens into an L2-normalized TF-IDF vector.
+
+        Args:
+            query_terms (list of str): preprocessed query tokens.
+
+        Returns:
+            np.ndarray: dense vector of length |vocabulary|.
+        """
+        vec = np.zeros(len(self.idf), dtype=np.float64)
+        for term, count in Counter(query_terms).items():
+            col = self.term_to_index.get(term)
+            if col is not None:
+                vec[col] = count * self.idf[col]
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec /= norm
+        return vec
+
+    def vectorize_batch(self, queries):
+        """
+        Turn many preprocessed queries into L2-normalized TF-IDF rows at once.
+
+        Args:
+            queries (list of list of str): preprocessed query tokens, one list per query.
+
+        Returns:
+            scipy.sparse.csr_matrix: shape (|queries|, |vocabulary|), one row per query.
+        """
+        indptr = [0]
+        indices, data = [], []
+        for query_terms in queries:
+            cols, weights = [], []
+            for term, count in Counter(query_terms).items():
+                col = self.term_to_index.get(term)
+                if col is not None:
+                    cols.append(col)
+                    weights.append(count * self.idf[col])
+            norm = np.linalg.norm(weights) if weights else 0.0
+            indices.extend(cols)
+            data.extend(w / norm for w in weights)
+            indptr.append(len(indices))
+        return csr_matrix(
+            (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(queries), len(self.idf)),
+        )
+
+
+def build_tfidf_index(preprocessed_docs, vocabulary):
+    """
+    Fit the TF-IDF model once over the preprocessed documents.
+
+    Uses the same weighting as sklearn's TfidfVectorizer defaults (raw term
+    counts, smoothed IDF, L2 normalization) but on the tokens produced by
+    preprocess(), so queries and documents share one analyzer.
 
     Args:
         preprocessed_docs (list of list of str): Tokenized documents.
+        vocabulary (list of str): List of all terms.
 
     Returns:
-        dict[str, list[int]]: Inverted index.
+        TfidfIndex: fitted vocabulary, IDF vector and CSR document matrix.
+    """
+    return IndexBuilder.from_documents(preprocessed_docs).tfidf_index(vocabulary)
+
+
+class SentenceIndex:
+    """
+    Sentence boundaries of every document, in flat arrays.
+
+    The sentences of doc d are rows doc_offsets[d]:doc_offsets[d + 1].
+    token_starts holds the position of the first token of each sentence,
+    so the positional index maps straight to sentences.
+
+    Attributes:
+        doc_offsets (np.ndarray): int64 array of length |documents| + 1.
+        char_starts (np.ndarray): int64 start offset of each sentence in the raw text.
+        char_ends (np.ndarray): int64 end offset of each sentence in the raw text.
+        token_starts (np.ndarray): int64 first token position of each sentence.
+    """
+
+    def __init__(self, doc_offsets, char_starts, char_ends, token_starts):
+        self.doc_offsets = doc_offsets
+        self.char_starts = char_starts
+        self.char_ends = char_ends
+        self.token_starts = token_starts
+
+    def sentence_spans(self, doc_idx):
+        """(start, end) character offsets of every sentence of a document."""
+        rows = slice(self.doc_offsets[doc_idx], self.doc_offsets[doc_idx + 1])
+        return list(zip(self.char_starts[rows].tolist(), self.char_ends[rows].tolist()))
+
+    def sentences_at(self, doc_idx, positions):
+        """
+        Sentences of a document holding the given token positions.
+
+        Returns:
+            np.ndarray: sorted, unique row indices into char_starts/char_ends.
+        """
+        first, last = self.doc_offsets[doc_idx], self.doc_offsets[doc_idx + 1]
+        if first == last or len(positions) == 0:
+            return np.empty(0, dtype=np.int64)
+        rows = np.searchsorted(self.token_starts[first:last], positions, side="right") - 1
+        return first + np.unique(np.maximum(rows, 0))
+
+    def sentences_for_doc(self, doc_idx):
+        """(start, end, n_tokens) triples of a document, as accepted by IndexBuilder.add_document."""
+        first, last = self.doc_offsets[doc_idx], self.doc_offsets[doc_idx + 1]
+        token_starts = self.token_starts[first:last].tolist()
+        token_ends = token_starts[1:] + [None]
+        sentences = []
+        for start, end, tok_start, tok_end in zip(
+            self.char_starts[first:last].tolist(), self.char_ends[first:last].tolist(), token_starts, token_ends
+        ):
+            sentences.append((start, end, tok_end - tok_start if tok_end is not None else None))
+        return sentences
+
+
+class CorpusStats:
+    """
+    Collection statistics the ranking weights depend on.
+
+    Shards of one corpus build their TF-IDF and BM25 weights from the
+    combined statistics of every shard, so their scores match those of a
+    single index over the whole corpus.
+
+    Attributes:
+        n_docs (int): number of documents.
+        total_length (int): number of tokens over all documents.
+        doc_freq (dict[str, int]): term -> number of documents containing it.
+        fields (dict[str, CorpusStats]): the same statistics for every extra field.
+    """
+
+    def __init__(self, n_docs, total_length, doc_freq, fields=None):
+        self.n_docs = n_docs
+        self.total_length = total_length
+        self.doc_freq = doc_freq
+        self.fields = fields or {}
+
+    @property
+    def avg_doc_length(self):
+        return self.total_length / self.n_docs if self.n_docs else 1.0
+
+    @classmethod
+    def combine(cls, stats):
+        """Statistics of the union of disjoint document sets."""
+        n_docs, total_length, doc_freq, fields = 0, 0, Counter(), defaultdict(list)
+        for s in stats:
+            n_docs += s.n_docs
+            total_length += s.total_length
+            doc_freq.update(s.doc_freq)
+            for name, field_stats in s.fields.items():
+                fields[name].append(field_stats)
+        return cls(n_docs, total_length, dict(doc_freq), {name: cls.combine(f) for name, f in fields.items()})
+
+
+class IndexBuilder:
+    """
+    Single-pass builder for every index structure.
+
+    Documents are added one token list at a time and only their postings
+    (doc IDs, term frequencies and positions, in compact arrays) are kept,
+    so callers can stream documents in and drop each token list as soon as
+    it has been added. The terms of every extra field of the schema go to a
+    builder of their own, which only feeds the BM25 index.
+
+    Attributes:
+        schema (analysis.Schema): how the documents were analyzed, recorded
+            with the index.
+    """
+
+    def __init__(self, schema=None):
+        self.schema = schema if schema is not None else DEFAULT_SCHEMA
+        self._fields = {name: IndexBuilder(Schema()) for name in self.schema.fields}
+        # term -> (doc IDs, term frequency per doc, positions of all docs back to back)
+        self._postings = {}
+        self._doc_lengths = array("I")
+        # sentence boundaries: char offsets and first token position, per sentence
+        self._sentence_offsets = array("q", [0])
+        self._sentence_chars = (array("q"), array("q"))
+        self._sentence_tokens = array("q")
+
+    @classmethod
+    def from_documents(cls, preprocessed_docs):
+        builder = cls()
+        for tokens in preprocessed_docs:
+            builder.add_document(tokens)
+        return builder
+
+    @property
+    def n_docs(self):
+        return len(self._doc_lengths)
+
+    def add_document(self, tokens, sentences=None, fields=None):
+        """
+        Add the next document.
+
+        Args:
+            tokens (list of str): preprocessed tokens of the document.
+            sentences (list of tuple[int, int, int]): optional (start, end,
+                n_tokens) of each sentence, as returned by analysis.Analyzer.analyze.
+            fields (dict[str, list[str]]): optional terms of the schema's
+                extra fields (see analysis.Schema.analyze_document); a
+                missing field is empty.
+
+        Returns:
+            int: doc ID assigned to the document.
+        """
+        doc_idx = len(self._doc_lengths)
+        for name, builder in self._fields.items():
+            builder.add_document((fields or {}).get(name, ()))
+        token_start = 0
+        for start, end, n_tokens in sentences or ():
+            self._sentence_chars[0].append(start)
+            self._sentence_chars[1].append(end)
+            self._sentence_tokens.append(token_start)
+            token_start += n_tokens or 0
+        self._sentence_offsets.append(len(self._sentence_tokens))
+        term_positions = defaultdict(list)
+        for pos, term in enumerate(tokens):
+            term_positions[term].append(pos)
+        for term, positions in term_positions.items():
+            entry = self._postings.get(term)
+            if entry is None:
+                entry = self._postings[term] = (array("I"), array("I"), array("I"))
+            entry[0].append(doc_idx)
+            entry[1].append(len(positions))
+            entry[2].extend(positions)
+        self._doc_lengths.append(len(tokens))
+        return doc_idx
+
+    def vocabulary(self):
+        """Sorted list of every term added so far."""
+        return sorted(self._postings)
+
+    def field_vocabulary(self):
+        """Sorted field_term keys of every extra field term added so far."""
+        return sorted(field_term(name, term) for name, builder in self._fields.items() for term in builder._postings)
+
+    def corpus_stats(self):
+        """CorpusStats of the documents added so far."""
+        return CorpusStats(
+            self.n_docs, sum(self._doc_lengths), {term: len(entry[0]) for term, entry in self._postings.items()},
+            {name: builder.corpus_stats() for name, builder in self._fields.items()},
+        )
+
+    def _doc_ids(self, term):
+        return np.array(self._postings[term][0], dtype=np.uint32)
+
+    def _tfs(self, term):
+        return np.array(self._postings[term][1], dtype=np.uint32)
+
+    def term_doc_matrix(self, vocabulary=None):
+        """IncidenceMatrix over vocabulary (terms outside it are ignored)."""
+        if vocabulary is None:
+            vocabulary = self.vocabulary()
+        term_to_index = {term: i for i, term in enumerate(vocabulary)}
+        n_words = (self.n_docs + 63) // 64
+        words = np.zeros((len(vocabulary), n_words), dtype=np.uint64)
+        for term, row in term_to_index.items():
+            if term in self._postings:
+                cols = self._doc_ids(term).astype(np.uint64)
+                # set bit (doc % 64) of word (doc // 64) in the term's row
+                np.bitwise_or.at(words[row], (cols >> np.uint64(6)).astype(np.intp), np.uint64(1) << (cols & np.uint64(63)))
+        return IncidenceMatrix(term_to_index, words, self.n_docs)
+
+    def inverted_index(self, compress=False):
+        """term -> sorted uint32 doc IDs (encode_postings bytes if compress)."""
+        if compress:
+            return {term: encode_postings(entry[0]) for term, entry in self._postings.items()}
+        return {term: self._doc_ids(term) for term in self._postings}
+
+    def positional_index(self):
+        """term -> PositionalPostings."""
+        positional = {}
+        for term, (docs, tfs, positions) in self._postings.items():
+            # a doc holds exactly tf positions of the term
+            offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+            np.cumsum(tfs, out=offsets[1:])
+            positional[term] = PositionalPostings(
+                np.array(docs, dtype=np.uint32), offsets, np.array(positions, dtype=np.uint32)
+            )
+        return positional
+
+    def bm25_index(self, k1=1.2, b=0.75, stats=None):
+        """Bm25Index with precomputed posting scores (IDF and average length from stats if given)."""
+        if stats is None:
+            stats = self.corpus_stats()
+        doc_lengths = np.array(self._doc_lengths, dtype=np.uint32)
+        avg_doc_length = stats.avg_doc_length
+        # length normalization of the tf saturation, one value per document
+        norms = k1 * (1.0 - b + b * doc_lengths / max(avg_doc_length, 1e-9))
+
+        postings = {}
+        for term in self._postings:
+            doc_ids = self._doc_ids(term)
+            tfs = self._tfs(term)
+            idf = bm25_idf(stats.n_docs, stats.doc_freq[term])
+            impacts = (idf * tfs * (k1 + 1.0) / (tfs + norms[doc_ids])).astype(np.float32)
+            postings[term] = Bm25Postings(doc_ids, tfs, impacts)
+        lengths = {"body": doc_lengths}
+        for name, builder in self._fields.items():
+            field = builder.bm25_index(k1, b, stats.fields.get(name))
+            boost = self.schema.fields[name].boost
+            for term, p in field.postings.items():
+                postings[field_term(name, term)] = Bm25Postings(p.doc_ids, p.tfs, (p.impacts * boost).astype(np.float32))
+            lengths[name] = field.doc_lengths["body"]
+        return Bm25Index(postings, lengths, k1, b)
+
+    def tfidf_index(self, vocabulary=None, stats=None):
+        """TfidfIndex fitted on the raw term counts (IDF from stats if given)."""
+        if vocabulary is None:
+            vocabulary = self.vocabulary()
+        if stats is None:
+            stats = self.corpus_stats()
+        term_to_index = {term: i for i, term in enumerate(vocabulary)}
+        rows, cols, counts = [], [], []
+        for term, col in term_to_index.items():
+            if term in self._postings:
+                docs = self._doc_ids(term)
+                rows.append(docs)
+                cols.append(np.full(docs.size, col, dtype=np.int32))
+                counts.append(self._tfs(term))
+        if rows:
+            rows, cols, counts = np.concatenate(rows), np.concatenate(cols), np.concatenate(counts)
+        tf = csr_matrix(
+            (np.asarray(counts, dtype=np.float64), (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int32))),
+            shape=(self.n_docs, len(vocabulary)),
+        )
+        tf.sort_indices()
+        from sklearn.feature_extraction.text import TfidfTransformer  # heavy import, only needed to build
+
+        # smoothed IDF, as TfidfTransformer.fit computes it, but from stats
+        doc_freq = np.array([stats.doc_freq.get(term, 0) for term in vocabulary], dtype=np.float64)
+        transformer = TfidfTransformer()
+        transformer.idf_ = np.log((stats.n_docs + 1) / (doc_freq + 1)) + 1
+        # a segment of empty documents has no terms, which the transformer rejects
+        doc_matrix = (transformer.transform(tf) if vocabulary else tf).tocsc()
+        return TfidfIndex(term_to_index, transformer.idf_, doc_matrix)
+
+    def sentence_index(self):
+        """SentenceIndex of the documents added with sentence boundaries."""
+        return SentenceIndex(
+            np.array(self._sentence_offsets, dtype=np.int64),
+            np.array(self._sentence_chars[0], dtype=np.int64),
+            np.array(self._sentence_chars[1], dtype=np.int64),
+            np.array(self._sentence_tokens, dtype=np.int64),
+        )
+
+    def build(self, vocabulary=None, stats=None, prune_ratio=0.0, lsa_term_vectors=None, impact_scale=None):
+        """
+        Every index structure, as returned by build_indexes.
+
+        Args:
+            vocabulary (list of str): terms of the TF-IDF columns and incidence
+                rows; defaults to the terms added. A shard passes the whole
+                corpus vocabulary, which may include terms it has no postings for.
+            stats (CorpusStats): statistics to weight TF-IDF and BM25 with;
+                defaults to those of the documents added.
+            prune_ratio (float): fraction of every term's lowest-impact
+                postings left out of the impact-ordered index.
+            lsa_term_vectors (np.ndarray): LSA term embeddings fitted over the
+                whole corpus, one row per vocabulary term, to embed the
+                documents with (see semantic.build_lsa_index); by default
+                LSA is fitted on the documents added.
+            impact_scale (float): BM25 score of one quantized impact level,
+                shared by every shard (see impacts.build_impact_index); by
+                default derived from the documents added.
+        """
+        if vocabulary is None:
+            vocabulary = self.vocabulary()
+        field_vocabulary = self.field_vocabulary()
+        tfidf = self.tfidf_index(vocabulary, stats)
+        bm25 = self.bm25_index(stats=stats)
+        return {
+            "analysis": self.schema,
+            "vocabulary": vocabulary,
+            "field_vocabulary": field_vocabulary,
+            "term_doc_matrix": self.term_doc_matrix(vocabulary),
+            "inverted_index": self.inverted_index(),
+            "positional_index": self.positional_index(),
+            "tfidf_index": tfidf,
+            "bm25_index": bm25,
+            "sentence_index": self.sentence_index(),
+            "lsa_index": build_lsa_index(tfidf, term_vectors=lsa_term_vectors),
+            "impact_index": impact_index_from_bm25(bm25, vocabulary + field_vocabulary, prune_ratio, impact_scale),
+        }
+
+
+def build_indexes(preprocessed_docs):
     """
-    #Creates a dictionary where each key is a term and the value is a list of document indices (i.e. term → [doc1, doc3, ...])
-    index = defaultdict(list) 
-    for doc_idx, tokens in enumerate(preprocessed_docs):
-        for term in set(tokens):
-            index[term].append(doc_idx)
-    return dict(index) #Converts the defaultdict back to a regular dictionary before returning.
+    Build every index structure used by the retrieval layer.
 
+    Args:
+        preprocessed_docs (list of list of str): Tokenized documents.
 
+    Returns:
+        dict: analysis (the analysis.Schema), vocabulary, field_vocabulary
+        (the field_term keys of the BM25 postings of extra fields),
+        term_doc_matrix, inverted_index, positional_index, tfidf_index,
+        bm25_index, sentence_index, lsa_index and impact_index.
+    """
+    return IndexBuilder.from_documents(preprocessed_docs).build()
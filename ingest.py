@@ -0,0 +1,183 @@
+import os
+import time
+import logging
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from corpus import list_corpus_files, iter_passages, SourceSpans, PASSAGE_BYTES
+from indexing import IndexBuilder
+from index_store import RawDocs
+from analysis import DEFAULT_SCHEMA
+
+CHUNK_SIZE = 16
+
+
+class IngestStats:
+    """Throughput counters of one ingestion run."""
+
+    def __init__(self):
+        self.docs = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def docs_per_sec(self):
+        return self.docs / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_sec(self):
+        return self.bytes / 1e6 / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.docs} docs, {self.bytes / 1e6:.2f} MB in {self.seconds:.2f}s "
+            f"({self.docs_per_sec:.1f} docs/s, {self.mb_per_sec:.2f} MB/s)"
+        )
+
+
+def iter_documents(data_dir, filenames, passage_bytes=PASSAGE_BYTES):
+    """
+    Yield the documents of the sources one passage at a time, reading each
+    source only when it is reached (see corpus.iter_passages).
+
+    Yields:
+        corpus.Passage
+    """
+    for f in filenames:
+        yield from iter_passages(data_dir, f, passage_bytes)
+
+
+class DocSpool:
+    """Document texts appended to an anonymous temporary file instead of kept in memory."""
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self._sizes = []
+
+    def append(self, text):
+        encoded = text.encode("utf-8")
+        self._file.write(encoded)
+        self._sizes.append(len(encoded))
+
+    def raw_docs(self):
+        """The texts so far as RawDocs over a memory map of the file."""
+        self._file.flush()
+        offsets = np.zeros(len(self._sizes) + 1, dtype=np.int64)
+        np.cumsum(self._sizes, out=offsets[1:])
+        blob = np.memmap(self._file, dtype=np.uint8, mode="r") if offsets[-1] else np.empty(0, dtype=np.uint8)
+        return RawDocs(blob, offsets)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def preprocess_stream(documents, workers=None, chunk_size=CHUNK_SIZE, stats=None, schema=None):
+    """
+    Analyze a stream of documents, in order, across a process pool.
+
+    At most two chunks per worker are in flight at any time, so memory stays
+    bounded however long the stream is. With workers=1 everything runs in
+    this process.
+
+    Args:
+        documents (iterable of corpus.Passage): documents to analyze; their
+            field terms come from the source path.
+        workers (int): pool size; defaults to the CPU count.
+        chunk_size (int): documents sent to a worker per task.
+        stats (IngestStats): optional counters to update.
+        schema (analysis.Schema): how to analyze the documents; defaults to
+            analysis.DEFAULT_SCHEMA.
+
+    Yields:
+        tuple[corpus.Passage, list[str], list[tuple], dict]: the document,
+        its body terms, sentence boundaries and field terms (see
+        analysis.Schema.analyze_document).
+    """
+    workers = workers or os.cpu_count() or 1
+    schema = schema if schema is not None else DEFAULT_SCHEMA
+    started = time.perf_counter()
+
+    def done(chunk, analyzed):
+        for passage, (tokens, sentences, fields) in zip(chunk, analyzed):
+            if stats is not None:
+                stats.docs += 1
+                stats.bytes += passage.end - passage.start
+                stats.seconds = time.perf_counter() - started
+            yield passage, tokens, sentences, fields
+
+    def batch(chunk):
+        return [(passage.path, passage.text) for passage in chunk]
+
+    if workers == 1:
+        for chunk in _chunks(documents, chunk_size):
+            yield from done(chunk, schema.analyze_batch(batch(chunk)))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for chunk in _chunks(documents, chunk_size):
+            in_flight.append((chunk, pool.submit(schema.analyze_batch, batch(chunk))))
+            if len(in_flight) >= 2 * workers:
+                chunk, future = in_flight.popleft()
+                yield from done(chunk, future.result())
+        while in_flight:
+            chunk, future = in_flight.popleft()
+            yield from done(chunk, future.result())
+
+
+def ingest(data_dir="Dataset", filenames=None, workers=None, chunk_size=CHUNK_SIZE, schema=None,
+           passage_bytes=PASSAGE_BYTES, prune_ratio=0.0):
+    """
+    Read, preprocess and index documents in one streaming pass.
+
+    Sources are streamed a passage at a time and token lists go straight
+    into an IndexBuilder and are dropped right after; the raw texts (needed
+    for snippets) are spooled to a temporary file, so only the postings stay
+    in memory however large the sources are.
+
+    Args:
+        data_dir (str): folder holding the corpus.
+        filenames (list of str): sources to ingest, relative to data_dir;
+            defaults to every source found by corpus.list_corpus_files.
+        workers (int): preprocessing processes; small corpora run inline.
+        chunk_size (int): documents per preprocessing task.
+        schema (analysis.Schema): analyzers and fields; recorded with the index.
+        passage_bytes (int): larger text files are split into passages of at
+            most this size, each its own document.
+        prune_ratio (float): fraction of every term's lowest-impact postings
+            left out of the impact-ordered index (see IndexBuilder.build).
+
+    Returns:
+        tuple[list[str], RawDocs, dict, IngestStats]: document names, raw
+        texts, the index structures (see indexing.build_indexes, plus
+        "sources", the corpus.SourceSpans of the documents) and throughput.
+    """
+    if filenames is None:
+        filenames = list_corpus_files(data_dir)
+        if not filenames:
+            raise ValueError(f"No documents found in {data_dir}")
+    if workers is None and len(filenames) <= chunk_size:
+        workers = 1  # not worth starting a pool
+
+    stats = IngestStats()
+    builder = IndexBuilder(schema)
+    names, spans, spool = [], [], DocSpool()
+    documents = iter_documents(data_dir, filenames, passage_bytes)
+    for passage, tokens, sentences, fields in preprocess_stream(
+        documents, workers, chunk_size, stats, builder.schema
+    ):
+        builder.add_document(tokens, sentences, fields)
+        names.append(passage.name)
+        spans.append((passage.path, passage.start, passage.end, passage.line))
+        spool.append(passage.text)
+    indexes = builder.build(prune_ratio=prune_ratio)
+    indexes["sources"] = SourceSpans.from_spans(spans)
+    logging.info(f"Ingested {stats}")
+    return names, spool.raw_docs(), indexes, stats
@@ -0,0 +1,150 @@
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+# the trace of the query running in this thread/task, if it is being traced
+_current = ContextVar("trace", default=None)
+_NOOP = nullcontext()
+
+
+class Trace:
+    """
+    Timings and counters of one traced query.
+
+    Attributes:
+        name (str): what was traced, e.g. the search method.
+        spans (dict[str, list]): stage -> [total seconds, times entered];
+            stages entered several times (once per segment, say) add up.
+        counters (dict[str, int]): e.g. postings_scanned, docs_scored.
+        seconds (float): wall time of the whole trace.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = {}
+        self.counters = {}
+        self.seconds = 0.0
+
+    def add_span(self, stage, seconds):
+        entry = self.spans.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "seconds": self.seconds,
+            "spans": {stage: {"seconds": s, "calls": n} for stage, (s, n) in self.spans.items()},
+            "counters": dict(self.counters),
+        }
+
+
+class Metrics:
+    """Thread-safe totals over every finished trace, for export."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = {}
+        self.spans = {}
+        self.counters = {}
+
+    def record(self, trace):
+        with self._lock:
+            entry = self.queries.setdefault(trace.name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += trace.seconds
+            for stage, (seconds, calls) in trace.spans.items():
+                total = self.spans.setdefault(stage, [0.0, 0])
+                total[0] += seconds
+                total[1] += calls
+            for name, value in trace.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "queries": {name: {"count": n, "seconds": s} for name, (n, s) in self.queries.items()},
+                "spans": {stage: {"seconds": s, "calls": n} for stage, (s, n) in self.spans.items()},
+                "counters": dict(self.counters),
+            }
+
+    def to_prometheus(self):
+        """Metrics in the Prometheus text exposition format."""
+        snap = self.snapshot()
+        lines = [
+            "# TYPE search_queries_total counter",
+            *(f'search_queries_total{{method="{m}"}} {q["count"]}' for m, q in snap["queries"].items()),
+            "# TYPE search_query_seconds_total counter",
+            *(f'search_query_seconds_total{{method="{m}"}} {q["seconds"]}' for m, q in snap["queries"].items()),
+            "# TYPE search_stage_seconds_total counter",
+            *(f'search_stage_seconds_total{{stage="{s}"}} {v["seconds"]}' for s, v in snap["spans"].items()),
+            "# TYPE search_stage_calls_total counter",
+            *(f'search_stage_calls_total{{stage="{s}"}} {v["calls"]}' for s, v in snap["spans"].items()),
+        ]
+        for name, value in snap["counters"].items():
+            lines += [f"# TYPE search_{name}_total counter", f"search_{name}_total {value}"]
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Write the current totals to path as JSON."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def trace(name):
+    """
+    Trace everything run inside the block, and add it to METRICS at the end.
+
+    Yields:
+        Trace: filled in as the block runs.
+    """
+    current = Trace(name)
+    token = _current.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - start
+        _current.reset(token)
+        METRICS.record(current)
+
+
+class _Span:
+    __slots__ = ("trace", "stage", "start")
+
+    def __init__(self, trace, stage):
+        self.trace = trace
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.trace.add_span(self.stage, time.perf_counter() - self.start)
+
+
+def span(stage):
+    """Time a stage of the current trace; a shared no-op when nothing is traced."""
+    current = _current.get()
+    return _NOOP if current is None else _Span(current, stage)
+
+
+def enabled():
+    """
+    Whether anything is traced here: hot paths check it before working out
+    a counter's value, which count would throw away otherwise.
+    """
+    return _current.get() is not None
+
+
+def count(name, n=1):
+    """Add n to a counter of the current trace, if any."""
+    current = _current.get()
+    if current is not None:
+        current.counters[name] = current.counters.get(name, 0) + n
@@ -0,0 +1,194 @@
+import re
+import bisect
+import fnmatch
+
+import numpy as np
+
+# query words kept as patterns instead of being preprocessed:
+# wildcards like "algo*" or "c?mputer", and fuzzy terms like "databse~" or "databse~1"
+WILDCARD = re.compile(r"^[\w*?]*[*?][\w*?]*$")
+FUZZY = re.compile(r"^(\w+)~([0-2]?)$")
+MAX_EXPANSIONS = 64
+
+
+def is_pattern(term):
+    """Return True if a query term is a wildcard or fuzzy pattern."""
+    return isinstance(term, str) and (WILDCARD.match(term) is not None or FUZZY.match(term) is not None)
+
+
+def parse_query(query, analyze):
+    """
+    Preprocess a query, keeping wildcard and fuzzy words as patterns.
+
+    Words like "algo*" are only lowercased (normalizing a word fragment
+    would mangle it); the word of a fuzzy "databse~" is normalized like any
+    other query word, so it is matched against the same kind of terms.
+
+    Args:
+        query (str): the raw query.
+        analyze (callable): str -> list of processed terms (e.g. preprocess_fast).
+
+    Returns:
+        list[str]: processed terms and patterns, in query order.
+    """
+    terms = []
+    for word in query.lower().split():
+        if "*" not in word:
+            word = word.rstrip("?")  # a question mark ends a question, it is no wildcard
+        fuzzy = FUZZY.match(word)
+        if WILDCARD.match(word):
+            terms.append(word)
+        elif fuzzy:
+            terms.extend(f"{t}~{fuzzy.group(2)}" for t in analyze(fuzzy.group(1)))
+        else:
+            terms.extend(analyze(word))
+    return terms
+
+
+def default_max_edits(term):
+    """Edits allowed by a bare "term~": one for short terms, two otherwise."""
+    return 1 if len(term) <= 4 else 2
+
+
+def edit_distance(a, b, max_dist):
+    """
+    Levenshtein distance between a and b, or max_dist + 1 once it is
+    certain to exceed max_dist.
+    """
+    if abs(len(a) - len(b)) > max_dist:
+        return max_dist + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > max_dist:
+            return max_dist + 1
+        previous = current
+    return previous[-1]
+
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class Lexicon:
+    """
+    Prefix, wildcard and fuzzy lookups over a sorted vocabulary.
+
+    Prefixes are a binary search into the vocabulary itself. Wildcard and
+    fuzzy lookups go through a bigram index of the terms padded with "$"
+    ("$db$" has the bigrams $d, db and b$): the bigrams of a pattern narrow
+    the vocabulary down to a few candidates, which are then checked exactly.
+    Posting lists of the bigram index are uint32 term IDs in one flat
+    array, so it stays compact for large vocabularies.
+
+    Attributes:
+        terms (list of str): the sorted vocabulary (shared, not copied).
+        lengths (np.ndarray): length of every term.
+    """
+
+    def __init__(self, terms):
+        self.terms = terms
+        self.lengths = np.fromiter((len(t) for t in terms), dtype=np.int32, count=len(terms))
+        postings = {}
+        for term_id, term in enumerate(terms):
+            for gram in _bigrams(f"${term}$"):
+                postings.setdefault(gram, []).append(term_id)
+        self._grams = {}
+        offsets = [0]
+        for i, (gram, ids) in enumerate(postings.items()):
+            self._grams[gram] = i
+            offsets.append(offsets[-1] + len(ids))
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self._term_ids = np.fromiter(
+            (t for ids in postings.values() for t in ids), dtype=np.uint32, count=offsets[-1])
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _gram_postings(self, gram):
+        i = self._grams.get(gram)
+        if i is None:
+            return np.empty(0, dtype=np.uint32)
+        return self._term_ids[self._offsets[i]:self._offsets[i + 1]]
+
+    def prefix_range(self, prefix):
+        """[lo, hi) term IDs of the terms starting with prefix."""
+        lo = bisect.bisect_left(self.terms, prefix)
+        hi = bisect.bisect_left(self.terms, prefix + "\U0010ffff", lo)
+        return lo, hi
+
+    def prefix(self, prefix, limit=MAX_EXPANSIONS):
+        """Terms starting with prefix, in sorted order, at most limit of them."""
+        lo, hi = self.prefix_range(prefix)
+        return self.terms[lo:min(hi, lo + limit)]
+
+    def wildcard(self, pattern, limit=MAX_EXPANSIONS):
+        """
+        Terms matching a pattern where * stands for any run of characters
+        and ? for exactly one, in sorted order, at most limit of them.
+        """
+        head = re.split(r"[*?]", pattern, maxsplit=1)[0]
+        if pattern == head + "*":
+            return self.prefix(head, limit)
+        lo, hi = self.prefix_range(head)
+        # every literal piece of the padded pattern contributes its bigrams
+        grams = set()
+        for piece in re.split(r"[*?]+", f"${pattern}$"):
+            grams |= _bigrams(piece)
+        candidates = None
+        for gram in sorted(grams, key=lambda g: self._gram_postings(g).size):
+            postings = self._gram_postings(gram)
+            candidates = postings if candidates is None else np.intersect1d(candidates, postings, assume_unique=True)
+            if candidates.size == 0:
+                return []
+        if candidates is None:
+            candidates = np.arange(lo, hi, dtype=np.uint32)
+        else:
+            candidates = candidates[(candidates >= lo) & (candidates < hi)]
+        regex = re.compile(fnmatch.translate(pattern))
+        matches = []
+        for term_id in candidates:
+            term = self.terms[term_id]
+            if regex.match(term):
+                matches.append(term)
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def fuzzy(self, term, max_edits=None, limit=MAX_EXPANSIONS):
+        """
+        Terms within max_edits insertions, deletions or substitutions of
+        term, closest first (ties in sorted order), at most limit of them.
+
+        Returns:
+            list[tuple[str, int]]: (term, edit distance) pairs.
+        """
+        if max_edits is None:
+            max_edits = default_max_edits(term)
+        # one edit destroys at most two bigrams, so a match keeps at least
+        # len(grams) - 2 * max_edits of the term's bigrams
+        grams = _bigrams(f"${term}$")
+        needed = len(grams) - 2 * max_edits
+        close_length = np.abs(self.lengths - len(term)) <= max_edits
+        if needed > 0:
+            shared = np.bincount(
+                np.concatenate([self._gram_postings(g) for g in grams]), minlength=len(self.terms))
+            close_length &= shared >= needed
+        matches = []
+        for term_id in np.flatnonzero(close_length):
+            candidate = self.terms[term_id]
+            distance = edit_distance(term, candidate, max_edits)
+            if distance <= max_edits:
+                matches.append((candidate, distance))
+        matches.sort(key=lambda m: (m[1], m[0]))
+        return matches[:limit]
+
+    def expand(self, pattern, limit=MAX_EXPANSIONS):
+        """Vocabulary terms matching a wildcard or fuzzy query term (see is_pattern)."""
+        fuzzy = FUZZY.match(pattern)
+        if fuzzy:
+            max_edits = int(fuzzy.group(2)) if fuzzy.group(2) else None
+            return [t for t, _ in self.fuzzy(fuzzy.group(1), max_edits, limit)]
+        return self.wildcard(pattern, limit)
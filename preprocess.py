@@ -1,21 +1,95 @@
-import nltk
 import re
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer, PorterStemmer
-from nltk.tokenize import word_tokenize
+from functools import lru_cache
 
 
-# Download required NLTK resources (run once)
-nltk.download('stopwords')
-nltk.download('punkt_tab')
-nltk.download('wordnet')
-nltk.download('omw-1.4')
-nltk.download('punkt_tab')
+# NLTK resources the pipeline needs; install them once with
+#   python -m nltk.downloader stopwords punkt_tab wordnet
+# Nothing is downloaded or loaded at import time: resources are verified once
+# and loaded on first use.
+REQUIRED_RESOURCES = {
+    "stopwords": "corpora/stopwords",
+    "punkt_tab": "tokenizers/punkt_tab/english/",
+    "wordnet": "corpora/wordnet",
+}
 
-# Initialize tools
-STOPWORDS = set(stopwords.words('english'))
-lemmatizer = WordNetLemmatizer()
-stemmer = PorterStemmer()
+
+class MissingResourceError(LookupError):
+    """Raised when NLTK resources needed for preprocessing are not installed."""
+
+
+@lru_cache(maxsize=None)
+def ensure_resources():
+    """
+    Check once that every NLTK resource is installed locally.
+
+    Never touches the network: raises MissingResourceError listing what is
+    missing and the command that installs it.
+    """
+    import nltk
+
+    missing = []
+    for name, path in REQUIRED_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(name)
+    if missing:
+        raise MissingResourceError(
+            f"Missing NLTK resources: {', '.join(missing)}. "
+            f"Install them with: python -m nltk.downloader {' '.join(missing)}"
+        )
+
+
+@lru_cache(maxsize=None)
+def get_stopwords():
+    """English stop words, loaded on first use."""
+    ensure_resources()
+    from nltk.corpus import stopwords
+
+    return frozenset(stopwords.words('english'))
+
+
+@lru_cache(maxsize=None)
+def get_lemmatizer():
+    """WordNet lemmatizer, loaded on first use."""
+    ensure_resources()
+    from nltk.corpus import wordnet
+    from nltk.stem import WordNetLemmatizer
+
+    wordnet.ensure_loaded()
+    return WordNetLemmatizer()
+
+
+def __getattr__(name):
+    # keep the old module-level names working without loading them at import
+    if name == "STOPWORDS":
+        return get_stopwords()
+    if name == "lemmatizer":
+        return get_lemmatizer()
+    if name == "stemmer":
+        from nltk.stem import PorterStemmer
+
+        return PorterStemmer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Fast path: one compiled regex reproducing where word_tokenize splits words
+# (after punctuation is stripped, only the split points matter)
+LEMMA_CACHE_SIZE = 1 << 16
+_SEPARATORS = "\\s;@#$%&?!*()\\[\\]{}<>\"`«“‘„»”’"
+TOKEN_SPLIT = re.compile(
+    rf"""
+    [{_SEPARATORS}]+                     # whitespace and the punctuation word_tokenize pads
+    | [,:](?!\d)                         # commas/colons, unless inside a number
+    | -{{2,}} | \.{{2,}}                   # double dashes, ellipses
+    | (?<=[^'\s])(?=(?:n't|'(?:s|m|d|ll|re|ve))(?:[{_SEPARATORS}]|[,:](?!\d)|\.*$|\.+\s))  # clitics
+    | '(?=(?!re|ve|ll|m|t|s|d|n)\w\b)     # opening single quote
+    | (?<=\bcan)(?=not\b) | (?<=\bgim)(?=me\b) | (?<=\bgon)(?=na\b) | (?<=\bgot)(?=ta\b)
+    | (?<=\blem)(?=me\b) | (?<=\bmore)(?='n\b) | (?<=\bwan)(?=na\s) | (?<=\bd)(?='ye\b)
+    | (?<='t)(?=(?:is|was)\b)
+    """,
+    re.VERBOSE,
+)
+PUNCTUATION = re.compile(r"[^\w\s]")
 
 
 def preprocess(text: str) -> list[str]:
@@ -34,7 +108,12 @@ def preprocess(text: str) -> list[str]:
     text = text.lower()
 
     # 2. Tokenization (splits into words)
+    ensure_resources()
+    from nltk.tokenize import word_tokenize
+
     tokens = word_tokenize(text)
+    stop_words = get_stopwords()
+    lemmatizer = get_lemmatizer()
 
     processed_tokens = []
     for token in tokens:
@@ -44,7 +123,7 @@ def preprocess(text: str) -> list[str]:
             continue
 
         # 4. Stop-word removal
-        if token in STOPWORDS:
+        if token in stop_words:
             continue
 
         # 5. Lemmatization
@@ -56,3 +135,44 @@ def preprocess(text: str) -> list[str]:
         processed_tokens.append(lemma)
 
     return processed_tokens
+
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def normalize_token(token: str):
+    """
+    Steps 3-5 of preprocess() for one lowercased token, memoized.
+
+    Returns the lemma, or None if the token is dropped (punctuation only
+    or a stop word).
+    """
+    token = PUNCTUATION.sub("", token)
+    if not token or token in get_stopwords():
+        return None
+    return get_lemmatizer().lemmatize(token)
+
+
+def preprocess_fast(text: str) -> list[str]:
+    """
+    Same output as preprocess(), without word_tokenize: the text is split
+    with the compiled TOKEN_SPLIT regex and every token is normalized
+    through the normalize_token cache.
+
+    Returns a list of processed tokens.
+    """
+    processed_tokens = []
+    for token in TOKEN_SPLIT.split(text.lower()):
+        if token:
+            term = normalize_token(token)
+            if term is not None:
+                processed_tokens.append(term)
+    return processed_tokens
+
+
+@lru_cache(maxsize=None)
+def get_sentence_tokenizer():
+    """Punkt sentence tokenizer (the one behind nltk.sent_tokenize), loaded on first use."""
+    ensure_resources()
+    from nltk.tokenize.punkt import PunktTokenizer
+
+    return PunktTokenizer("english")
+
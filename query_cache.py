@@ -0,0 +1,196 @@
+import sys
+import time
+import threading
+
+from cachetools import TTLCache
+
+from instrument import count
+from retrival import PAGE_SIZE, paginate
+
+# how query terms are normalized into the cache key, per search method
+ORDER_SENSITIVE = {"phrase", "proximity", "boolean", "boolean_page"}  # term order and repeats matter
+TERM_SETS = {"incidence", "inverted", "incidence_page", "inverted_page"}  # implicit AND: order and repeats don't
+
+
+def normalize_terms(method, query_terms):
+    """Canonical form of query_terms for method, so equivalent queries share a key."""
+    if method in ORDER_SENSITIVE:
+        return tuple(query_terms)
+    if method in TERM_SETS:
+        return tuple(sorted(set(query_terms)))
+    # ranked methods weigh repeated terms, so keep the repeats
+    return tuple(sorted(query_terms))
+
+
+def result_size(result):
+    """Approximate memory held by a cached result, in bytes."""
+    size = sys.getsizeof(result)
+    for item in result:
+        size += sys.getsizeof(item)
+        if isinstance(item, tuple):
+            size += sum(sys.getsizeof(x) for x in item)
+    return size
+
+
+class QueryCache:
+    """
+    Thread-safe LRU + TTL cache of search results.
+
+    Keys are (method, normalized terms, top_k, extra args, index version).
+    The cache holds at most max_entries results and max_bytes of them;
+    least recently used entries go first, and entries expire after ttl
+    seconds. Seeing a new index version clears everything.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, ttl=300.0, timer=time.monotonic):
+        self.max_entries = max_entries
+        self._cache = TTLCache(maxsize=max_bytes, ttl=ttl, timer=timer, getsizeof=lambda entry: entry[1])
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._cache.clear()
+            self._version = version
+
+    def get_or_compute(self, method, query_terms, compute, version, top_k=None, args=()):
+        """
+        Return the cached result for this query, or compute and cache it.
+
+        Args:
+            method (str): search method name.
+            query_terms (list of str): preprocessed query tokens.
+            compute (callable): produces the result on a miss.
+            version: identifies the index the result was computed on.
+            top_k (int): result count for ranked methods.
+            args (tuple): any other search arguments (e.g. NEAR distance).
+
+        Returns:
+            tuple: the search result.
+        """
+        key = (method, normalize_terms(method, query_terms), top_k, args)
+        with self._lock:
+            self._check_version(version)
+            entry = self._cache.get(key)
+            if entry is not None:
+                self.hits += 1
+                count("cache_hits")
+                return entry[0]
+            self.misses += 1
+
+        result = compute()
+        if not isinstance(result, tuple):  # results are shared, so never mutable
+            result = tuple(result)
+        size = result_size(result)
+        with self._lock:
+            if version == self._version and size <= self._cache.maxsize:
+                if key not in self._cache:
+                    while len(self._cache) >= self.max_entries:
+                        self._cache.popitem()  # least recently used
+                self._cache[key] = (result, size)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """Hit/miss counters and current usage."""
+        with self._lock:
+            self._cache.expire()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hit_rate,
+                "entries": len(self._cache),
+                "bytes": self._cache.currsize,
+            }
+
+
+class CachedSearcher:
+    """
+    Wraps a searcher (see segments.SegmentSearcher) so every search goes
+    through a QueryCache, keyed on the given index version.
+    """
+
+    def __init__(self, searcher, cache, version):
+        self.searcher = searcher
+        self.cache = cache
+        self.version = version
+
+    def __getattr__(self, name):
+        # filenames, raw_docs, ... come straight from the searcher
+        return getattr(self.searcher, name)
+
+    def search_term_doc_incidence(self, query_terms):
+        return self.cache.get_or_compute(
+            "incidence", query_terms, lambda: self.searcher.search_term_doc_incidence(query_terms), self.version)
+
+    def search_inverted_index(self, query_terms):
+        return self.cache.get_or_compute(
+            "inverted", query_terms, lambda: self.searcher.search_inverted_index(query_terms), self.version)
+
+    def search_phrase(self, query_terms):
+        return self.cache.get_or_compute(
+            "phrase", query_terms, lambda: self.searcher.search_phrase(query_terms), self.version)
+
+    def search_boolean(self, query_tree):
+        return self.cache.get_or_compute(
+            "boolean", [str(query_tree)], lambda: self.searcher.search_boolean(query_tree), self.version)
+
+    def search_proximity(self, query_terms, distance):
+        return self.cache.get_or_compute(
+            "proximity", query_terms, lambda: self.searcher.search_proximity(query_terms, distance),
+            self.version, args=(distance,))
+
+    def page_term_doc_incidence(self, query_terms, cursor=None, page_size=PAGE_SIZE):
+        return self.cache.get_or_compute(
+            "incidence_page", query_terms,
+            lambda: self.searcher.page_term_doc_incidence(query_terms, cursor, page_size),
+            self.version, page_size, args=(cursor,))
+
+    def page_inverted_index(self, query_terms, cursor=None, page_size=PAGE_SIZE):
+        return self.cache.get_or_compute(
+            "inverted_page", query_terms,
+            lambda: self.searcher.page_inverted_index(query_terms, cursor, page_size),
+            self.version, page_size, args=(cursor,))
+
+    def page_boolean(self, query_tree, cursor=None, page_size=PAGE_SIZE):
+        return self.cache.get_or_compute(
+            "boolean_page", [str(query_tree)],
+            lambda: self.searcher.page_boolean(query_tree, cursor, page_size),
+            self.version, page_size, args=(cursor,))
+
+    def page_phrase(self, query_terms, cursor=None, page_size=PAGE_SIZE):
+        # paged from the cached complete result, so later pages cost no search
+        return paginate(self.search_phrase(query_terms), cursor, page_size)
+
+    def page_proximity(self, query_terms, distance, cursor=None, page_size=PAGE_SIZE):
+        return paginate(self.search_proximity(query_terms, distance), cursor, page_size)
+
+    def search_tfidf(self, query_terms, top_k=6, min_score=None):
+        return self.cache.get_or_compute(
+            "tfidf", query_terms, lambda: self.searcher.search_tfidf(query_terms, top_k, min_score),
+            self.version, top_k, args=(min_score,))
+
+    def search_bm25(self, query_terms, top_k=6):
+        return self.cache.get_or_compute(
+            "bm25", query_terms, lambda: self.searcher.search_bm25(query_terms, top_k), self.version, top_k)
+
+    def search_impact(self, query_terms, top_k=6, posting_budget=None, time_budget=None):
+        return self.cache.get_or_compute(
+            "impact", query_terms,
+            lambda: self.searcher.search_impact(query_terms, top_k, posting_budget, time_budget),
+            self.version, top_k, args=(posting_budget, time_budget))
+
+    def search_lsa(self, query_terms, top_k=6, n_probe=None):
+        return self.cache.get_or_compute(
+            "lsa", query_terms, lambda: self.searcher.search_lsa(query_terms, top_k, n_probe),
+            self.version, top_k, args=(n_probe,))
@@ -1,29 +1,98 @@
+import time
+import heapq
+from itertools import islice
+from typing import NamedTuple
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy.sparse import csc_matrix
+from indexing import decode_postings
+from instrument import count, enabled, span
+from boolean_query import build_iterator, iter_docs
 
+PAGE_SIZE = 20  # hits per page of the paged search functions
 
-def search_term_doc_incidence(query_terms, term_doc_matrix, vocabulary):
+
+def search_term_doc_incidence(query_terms, term_doc_matrix):
     """
     Document-Term Incidence: return doc indices where ALL query_terms appear.
 
     Args:
         query_terms (list of str): preprocessed query tokens.
-        term_doc_matrix (np.ndarray): binary matrix shape (|vocab|, |docs|).
-        vocabulary (list of str): list of terms matching matrix rows.
+        term_doc_matrix (IncidenceMatrix): bit-packed rows, one per vocabulary term.
 
     Returns:
         List[int]: sorted list of document indices containing all terms.
     """
-    # map terms to row indices
-    term_to_idx = {t: i for i, t in enumerate(vocabulary)}
-    # find rows for query terms
-    rows = [term_doc_matrix[term_to_idx[t]] for t in query_terms if t in term_to_idx]
+    # find packed rows for query terms (the term -> row map is built at index time)
+    rows = [row for row in (_incidence_row(term_doc_matrix, t) for t in query_terms) if row is not None]
     if not rows:
         return []
-    # intersect document columns where (all) rows == 1
-    docs = np.all(np.vstack(rows) == 1, axis=0)
-    return list(np.nonzero(docs)[0]) #This gets the indices of documents where docs == True
+    # intersect document columns with a bitwise AND across the packed rows
+    with span("candidates"):
+        docs = np.bitwise_and.reduce(rows, axis=0) if len(rows) > 1 else rows[0]
+        return term_doc_matrix.to_doc_ids(docs).tolist()
+
+
+def _incidence_row(term_doc_matrix, term):
+    # an expanded pattern (tuple of terms) matches the docs of any of its terms
+    if not isinstance(term, tuple):
+        return term_doc_matrix.row(term)
+    rows = [row for row in (term_doc_matrix.row(t) for t in term) if row is not None]
+    return np.bitwise_or.reduce(rows, axis=0) if rows else None
+
+
+def intersect_postings(postings):
+    """
+    Intersect sorted posting lists, smallest list first.
+
+    Each candidate from the running result is binary searched into the next
+    (longer) list, so the cost is O(m log n) per step with m the size of the
+    running result, and the loop stops as soon as the result is empty.
+
+    Args:
+        postings (list of np.ndarray): sorted uint32 doc ID arrays.
+
+    Returns:
+        np.ndarray: sorted doc IDs present in every list.
+    """
+    if not postings:
+        return np.empty(0, dtype=np.uint32)
+    postings = sorted(postings, key=len)
+    result = postings[0]
+    for other in postings[1:]:
+        if result.size == 0:
+            break
+        pos = np.searchsorted(other, result)
+        found = pos < other.size
+        found[found] = other[pos[found]] == result[found]
+        result = result[found]
+    return result
+
+
+def union_postings(postings):
+    """Sorted doc IDs present in any of the sorted posting lists."""
+    if not postings:
+        return np.empty(0, dtype=np.uint32)
+    if len(postings) == 1:
+        return postings[0]
+    return np.unique(np.concatenate(postings))
+
+
+def get_postings(inverted_index, term):
+    """
+    Return the posting list of term as a uint32 array (decoding it if compressed).
+
+    term may also be a tuple of terms, the expansion of a wildcard or fuzzy
+    query term (see lexicon.Lexicon.expand): its posting list is the union
+    of theirs.
+    """
+    if isinstance(term, tuple):
+        return union_postings([get_postings(inverted_index, t) for t in term])
+    postings = inverted_index.get(term)
+    if postings is None:
+        return np.empty(0, dtype=np.uint32)
+    if isinstance(postings, bytes):
+        return decode_postings(postings)
+    return postings
 
 
 def search_inverted_index(query_terms, inverted_index):
@@ -31,41 +100,576 @@ def search_inverted_index(query_terms, inverted_index):
     Inverted Index: return doc indices containing ALL query terms.
 
     Args:
-        query_terms (list of str): preprocessed query tokens.
-        inverted_index (dict): term -> list of doc IDs.
+        query_terms (list of str | tuple): preprocessed query tokens, or
+            tuples of alternative terms (see get_postings).
+        inverted_index (dict): term -> sorted posting list (array or encoded bytes).
 
     Returns:
         List[int]: sorted list of document indices containing all terms.
     """
     # get posting lists
-    postings = [set(inverted_index.get(t, [])) for t in query_terms]
+    postings = [get_postings(inverted_index, t) for t in dict.fromkeys(query_terms)]
     if not postings:
         return []
-    # intersect all sets
-    result = set.intersection(*postings)
-    return sorted(result)
+    # intersect all lists
+    if enabled():
+        count("postings_scanned", sum(p.size for p in postings))
+    with span("candidates"):
+        return intersect_postings(postings).tolist()
+
+
+def search_boolean(query_tree, inverted_index, n_docs=None):
+    """
+    Boolean search: return doc indices matching an AND / OR / NOT query tree.
+
+    The tree is evaluated lazily, one document at a time: every AND is led
+    by its shortest posting list and only seeks into the longer ones, and
+    NOT operands are only probed at the candidates of their AND.
+
+    Args:
+        query_tree: output of boolean_query.parse_boolean.
+        inverted_index (dict): term -> sorted posting list (array or encoded bytes).
+        n_docs (int): number of documents, for queries with a bare NOT.
+
+    Returns:
+        List[int]: sorted list of matching document indices.
+    """
+    if query_tree is None:
+        return []
+    with span("candidates"):
+        iterator = build_iterator(query_tree, lambda term: get_postings(inverted_index, term), n_docs)
+        return list(iter_docs(iterator))
+
+
+class ResultPage(NamedTuple):
+    """
+    One page of the hits of a matching (unranked) search.
+
+    Attributes:
+        hits (tuple[int]): doc IDs, in increasing order.
+        cursor (int | None): pass it back to get the next page; None on the
+            last page. It is the last doc ID of the page, so it stays valid
+            for as long as the index it came from.
+    """
+    hits: tuple
+    cursor: object
+
+
+def paginate(hits, cursor=None, page_size=PAGE_SIZE):
+    """
+    Cut the page after cursor out of a complete, sorted hit list, for
+    searches that have no paged variant.
+
+    Returns:
+        ResultPage
+    """
+    start = 0 if cursor is None else int(np.searchsorted(hits, cursor, side="right"))
+    page = tuple(hits[start:start + page_size])
+    return ResultPage(page, page[-1] if start + page_size < len(hits) else None)
+
+
+def page_term_doc_incidence(query_terms, term_doc_matrix, after=-1, limit=PAGE_SIZE):
+    """
+    The first limit doc IDs after `after` where ALL query_terms appear (see
+    search_term_doc_incidence).
+
+    Rows are ANDed over a window of words starting at the cursor, doubled
+    until the page is full, so a page costs about the words it spans
+    rather than the whole corpus.
+
+    Returns:
+        List[int]: sorted document indices.
+    """
+    rows = [row for row in (_incidence_row(term_doc_matrix, t) for t in query_terms) if row is not None]
+    if not rows:
+        return []
+    hits = []
+    word, step = (after + 1) // 64, max(1, limit // 64)
+    with span("candidates"):
+        while word < rows[0].size and len(hits) < limit:
+            end = min(word + step, rows[0].size)
+            block = np.bitwise_and.reduce([row[word:end] for row in rows], axis=0)
+            docs = term_doc_matrix.to_doc_ids(block, word)
+            hits.extend(docs[docs > after][:limit - len(hits)].tolist())
+            word, step = end, step * 2
+    return hits
+
+
+def page_inverted_index(query_terms, inverted_index, after=-1, limit=PAGE_SIZE):
+    """
+    The first limit doc IDs after `after` containing ALL query terms (see
+    search_inverted_index).
+
+    Only the part of the shortest posting list past the cursor is
+    intersected, in blocks doubling from limit candidates, so a page stops
+    scanning as soon as it is full.
+
+    Returns:
+        List[int]: sorted document indices.
+    """
+    postings = [get_postings(inverted_index, t) for t in dict.fromkeys(query_terms)]
+    if not postings:
+        return []
+    postings = sorted((p[np.searchsorted(p, after + 1):] for p in postings), key=len)
+    lead, others = postings[0], postings[1:]
+    hits = []
+    start, step = 0, max(1, limit)
+    with span("candidates"):
+        while start < lead.size and len(hits) < limit:
+            block = intersect_postings([lead[start:start + step]] + others)
+            hits.extend(block[:limit - len(hits)].tolist())
+            start, step = start + step, step * 2
+    if enabled():
+        count("postings_scanned", min(start, lead.size))
+    return hits
+
+
+def page_boolean(query_tree, inverted_index, n_docs=None, after=-1, limit=PAGE_SIZE):
+    """
+    The first limit doc IDs after `after` matching a boolean query tree
+    (see search_boolean): the lazy iterator seeks straight to the cursor
+    and stops once the page is full.
+
+    Returns:
+        List[int]: sorted document indices.
+    """
+    if query_tree is None:
+        return []
+    with span("candidates"):
+        iterator = build_iterator(query_tree, lambda term: get_postings(inverted_index, term), n_docs)
+        iterator.seek(after + 1)
+        return [int(doc) for doc in islice(iter_docs(iterator), limit)]
+
+
+def _candidate_slots(query_terms, positional_index):
+    """
+    Find the docs containing every query term and where each term stores them.
+
+    Returns:
+        tuple[np.ndarray, list[np.ndarray]]: candidate doc IDs, and for each
+        query term the index of every candidate inside that term's doc_ids.
+    """
+    entries = [positional_index.get(t) for t in query_terms]
+    if not entries or any(e is None for e in entries):
+        return np.empty(0, dtype=np.uint32), []
+    if enabled():
+        count("postings_scanned", sum(e.doc_ids.size for e in entries))
+    with span("candidates"):
+        docs = intersect_postings([e.doc_ids for e in entries])
+        slots = [np.searchsorted(e.doc_ids, docs) for e in entries]
+    if enabled():
+        count("docs_scored", docs.size)
+    return docs, slots
+
+
+def search_phrase(query_terms, positional_index):
+    """
+    Phrase search: return doc indices where query_terms appear consecutively.
+
+    Args:
+        query_terms (list of str): preprocessed query tokens, in phrase order.
+        positional_index (dict): term -> PositionalPostings.
+
+    Returns:
+        List[int]: sorted list of document indices containing the phrase.
+    """
+    docs, slots = _candidate_slots(query_terms, positional_index)
+    entries = [positional_index[t] for t in query_terms] if slots else []
+    hits = []
+    with span("positions"):
+        for n, doc_id in enumerate(docs):
+            # start positions of the phrase: p such that term i sits at p + i
+            starts = entries[0].positions_in(slots[0][n]).astype(np.int64)
+            for i in range(1, len(entries)):
+                shifted = entries[i].positions_in(slots[i][n]).astype(np.int64) - i
+                starts = np.intersect1d(starts, shifted, assume_unique=True)
+                if starts.size == 0:
+                    break
+            if starts.size:
+                hits.append(int(doc_id))
+    return hits
+
+
+def search_proximity(query_terms, positional_index, distance):
+    """
+    Proximity search (NEAR/k): return doc indices where every query term
+    occurs within `distance` positions of an occurrence of the first term.
+
+    Args:
+        query_terms (list of str): preprocessed query tokens.
+        positional_index (dict): term -> PositionalPostings.
+        distance (int): maximum distance in tokens (k in NEAR/k).
+
+    Returns:
+        List[int]: sorted list of matching document indices.
+    """
+    docs, slots = _candidate_slots(query_terms, positional_index)
+    entries = [positional_index[t] for t in query_terms] if slots else []
+    hits = []
+    with span("positions"):
+        for n, doc_id in enumerate(docs):
+            anchors = entries[0].positions_in(slots[0][n]).astype(np.int64)
+            for i in range(1, len(entries)):
+                positions = entries[i].positions_in(slots[i][n]).astype(np.int64)
+                # nearest occurrence at or after each anchor, and the one before it
+                pos = np.searchsorted(positions, anchors)
+                after = np.abs(positions[np.minimum(pos, positions.size - 1)] - anchors)
+                before = np.abs(positions[np.maximum(pos - 1, 0)] - anchors)
+                anchors = anchors[np.minimum(after, before) <= distance]
+                if anchors.size == 0:
+                    break
+            if anchors.size:
+                hits.append(int(doc_id))
+    return hits
+
+
+def _top_hits(docs, scores, top_k):
+    """
+    The top_k (doc_idx, score) pairs by descending score, ties going to the
+    lower doc ID: a partial selection keeps every document scoring at least
+    the top_k-th score, then only those are sorted.
+    """
+    if top_k <= 0 or docs.size == 0:
+        return []
+    if docs.size > top_k:
+        kth = np.partition(scores, docs.size - top_k)[docs.size - top_k]
+        keep = scores >= kth
+        docs, scores = docs[keep], scores[keep]
+    order = np.lexsort((docs, -scores))[:top_k]
+    return [(int(docs[i]), float(scores[i])) for i in order]
 
 
-def search_tfidf(raw_documents, query, top_k=6):
+def search_tfidf(query_terms, tfidf_index, top_k=6, min_score=None):
     """
     TF-IDF with cosine similarity: rank docs by similarity to query.
 
+    Scores are accumulated term at a time into the index's preallocated
+    buffer, reading only the postings of the query terms, so only documents
+    sharing a term with the query are scored (and returned).
+
+    With min_score, terms are taken in decreasing order of the most they can
+    add to a score. Once the terms left cannot lift an unseen document to
+    min_score, no new documents are admitted: the remaining terms are only
+    looked up (by binary search) for the candidates that can still reach it.
+
     Args:
-        raw_documents (list of str): original document texts.
-        query (str): raw query string.
+        query_terms (list of str): preprocessed query tokens.
+        tfidf_index (TfidfIndex): model fitted once at index time.
         top_k (int): number of top results to return.
+        min_score (float): only return documents scoring at least this much.
 
     Returns:
         List[tuple[int, float]]: list of (doc_idx, score) sorted by score desc.
     """
-    # vectorize documents and query
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform(raw_documents)
-    query_vec = vectorizer.transform([query])
-    # compute cosine similarities
-    scores = cosine_similarity(query_vec, tfidf_matrix).flatten()
-    # get top_k indices
-    top_indices = np.argsort(scores)[::-1][:top_k]
-    return [(int(i), float(scores[i])) for i in top_indices]
+    if top_k <= 0:
+        return []
+    cols, weights = tfidf_index.query_weights(query_terms)
+    if cols.size == 0:
+        return []
+    # both sides are L2-normalized, so the dot product is the cosine similarity
+    with span("scoring"):
+        bounds = weights * tfidf_index.max_weights[cols]
+        order = np.argsort(-bounds, kind="stable")
+        # remaining[i]: the most terms order[i:] can still add to any score
+        remaining = np.cumsum(bounds[order][::-1])[::-1]
+        if min_score is not None and remaining[0] < min_score:
+            return []
+        acc = tfidf_index.score_buffer()
+        touched = []
+        for i, n in enumerate(order):
+            if min_score is not None and remaining[i] < min_score:
+                # unseen documents can no longer qualify: finish the candidates that still can
+                candidates = np.unique(np.concatenate(touched))
+                alive = candidates[acc[candidates] + remaining[i] >= min_score]
+                for m in order[i:]:
+                    doc_ids, values = tfidf_index.column(cols[m])
+                    pos = np.searchsorted(doc_ids, alive)
+                    found = pos < doc_ids.size
+                    found[found] = doc_ids[pos[found]] == alive[found]
+                    acc[alive[found]] += weights[m] * values[pos[found]]
+                break
+            doc_ids, values = tfidf_index.column(cols[n])
+            acc[doc_ids] += weights[n] * values
+            touched.append(doc_ids)
+        candidates = np.unique(np.concatenate(touched)) if len(touched) > 1 else np.asarray(touched[0])
+        scores = acc[candidates]
+        acc[candidates] = 0.0  # leave the buffer zeroed for the next query
+    if enabled():
+        count("docs_scored", candidates.size)
+    if min_score is not None:
+        keep = scores >= min_score
+        candidates, scores = candidates[keep], scores[keep]
+    with span("top_k"):
+        return _top_hits(candidates, scores, top_k)
 
 
+def search_bm25(query_terms, bm25_index, top_k=6):
+    """
+    BM25 ranking with MaxScore dynamic pruning.
+
+    Query terms are ordered by their score upper bound. Terms whose bounds
+    together cannot lift a document into the current top_k are
+    "non-essential": documents are only generated from the essential
+    lists, and non-essential lists are probed (by binary search) just for
+    those candidates whose score can still make it.
+
+    Args:
+        query_terms (list of str): preprocessed query tokens.
+        bm25_index (Bm25Index): postings with precomputed BM25 scores.
+        top_k (int): number of top results to return.
+
+    Returns:
+        List[tuple[int, float]]: list of (doc_idx, score) sorted by score desc.
+    """
+    if top_k <= 0:
+        return []
+    # repeated query terms weigh their postings more
+    weights = {}
+    for t in query_terms:
+        if t in bm25_index.postings:
+            weights[t] = weights.get(t, 0) + 1
+    terms = sorted(weights, key=lambda t: weights[t] * bm25_index.postings[t].max_impact)
+    if not terms:
+        return []
+    lists = [bm25_index.postings[t] for t in terms]
+    doc_ids = [p.doc_ids for p in lists]
+    impacts = [p.impacts for p in lists]
+    scale = [weights[t] for t in terms]
+    # bounds[i]: best score reachable from lists[0..i]
+    bounds = np.cumsum([scale[i] * p.max_impact for i, p in enumerate(lists)])
+    cursors = [0] * len(lists)
+
+    heap = []  # (score, -doc_id) min-heap of the current top_k
+    threshold = 0.0
+    first_essential = 0
+    end = np.iinfo(np.int64).max
+    scored = 0
+    with span("scoring"):
+        while first_essential < len(lists):
+            # next candidate: the smallest current doc among essential lists
+            doc = end
+            for i in range(first_essential, len(lists)):
+                if cursors[i] < doc_ids[i].size:
+                    doc = min(doc, int(doc_ids[i][cursors[i]]))
+            if doc == end:
+                break
+
+            scored += 1
+            score = 0.0
+            for i in range(first_essential, len(lists)):
+                c = cursors[i]
+                if c < doc_ids[i].size and doc_ids[i][c] == doc:
+                    score += scale[i] * float(impacts[i][c])
+                    cursors[i] = c + 1
+
+            # probe non-essential lists, highest bound first, while still useful
+            for i in range(first_essential - 1, -1, -1):
+                if score + bounds[i] <= threshold:
+                    break
+                c = int(np.searchsorted(doc_ids[i], doc, side="left"))
+                cursors[i] = c
+                if c < doc_ids[i].size and doc_ids[i][c] == doc:
+                    score += scale[i] * float(impacts[i][c])
+
+            if len(heap) < top_k:
+                heapq.heappush(heap, (score, -doc))
+            elif (score, -doc) > heap[0]:
+                heapq.heapreplace(heap, (score, -doc))
+            else:
+                continue
+            if len(heap) == top_k:
+                threshold = heap[0][0]
+                # lists whose combined bound cannot beat the threshold stop driving candidates
+                while first_essential < len(lists) and bounds[first_essential] <= threshold:
+                    first_essential += 1
+    if enabled():
+        count("docs_scored", scored)
+        count("postings_scanned", sum(cursors))
+
+    with span("top_k"):
+        results = sorted(heap, reverse=True)
+    return [(-neg_doc, score) for score, neg_doc in results]
+
+
+def search_impact(query_terms, impact_index, top_k=6, posting_budget=None, time_budget=None):
+    """
+    Score-at-a-time ranking over impact-ordered postings.
+
+    The blocks of all query terms are read in decreasing order of what each
+    of their postings adds to a score, accumulating into the index's
+    preallocated buffer. Without a budget every block is read and the
+    ranking is exhaustive (up to impact quantization); with one, reading
+    stops at the first block boundary past it, and the highest-impact
+    postings have been scored by then.
+
+    Args:
+        query_terms (list of str): preprocessed query tokens.
+        impact_index (ImpactIndex): impact-ordered postings.
+        top_k (int): number of top results to return.
+        posting_budget (int): stop after scoring this many postings.
+        time_budget (float): stop after this many seconds of scoring.
+
+    Returns:
+        List[tuple[int, float]]: list of (doc_idx, score) sorted by score desc.
+    """
+    term_ids, weights = impact_index.query_weights(query_terms)
+    if term_ids.size == 0 or top_k <= 0:
+        return []
+    with span("candidates"):
+        first, last = impact_index.term_blocks[term_ids], impact_index.term_blocks[term_ids + 1]
+        blocks = np.concatenate([np.arange(f, l) for f, l in zip(first, last)])
+        if blocks.size == 0:
+            # the terms have IDs but no postings, e.g. in a shard that holds the whole vocabulary
+            return []
+        adds = np.repeat(weights, last - first) * impact_index.block_levels[blocks]
+        order = np.argsort(-adds, kind="stable")
+
+    scores = impact_index.score_buffer()
+    offsets = impact_index.block_offsets
+    deadline = time.perf_counter() + time_budget if time_budget is not None else None
+    touched = []
+    scanned = 0
+    with span("scoring"):
+        for i in order:
+            docs = impact_index.docs[offsets[blocks[i]]:offsets[blocks[i] + 1]]
+            scores[docs] += adds[i]  # doc IDs are unique within a block
+            touched.append(docs)
+            scanned += docs.size
+            if posting_budget is not None and scanned >= posting_budget:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+    if enabled():
+        count("postings_scanned", scanned)
+
+    if not touched:
+        return []
+    with span("top_k"):
+        candidates = np.unique(np.concatenate(touched))
+        values = scores[candidates] * impact_index.scale
+        scores[candidates] = 0.0
+        if enabled():
+            count("docs_scored", candidates.size)
+        return _top_hits(candidates, values, top_k)
+
+
+def search_lsa(query_terms, lsa_index, top_k=6, n_probe=None, exact=False):
+    """
+    Semantic search: rank docs by cosine similarity of LSA embeddings.
+
+    The query's TF-IDF vector is projected into the LSA space, then only
+    the n_probe IVF clusters whose centroids are closest to it are scored,
+    one matrix-vector product per cluster, so documents sharing no term
+    with the query can still be found.
+
+    Args:
+        query_terms (list of str): preprocessed query tokens.
+        lsa_index (LsaIndex): embeddings and IVF clusters built at index time.
+        top_k (int): number of top results to return.
+        n_probe (int): clusters to search; defaults to the index's n_probe.
+        exact (bool): score every document instead (for recall measurements).
+
+    Returns:
+        List[tuple[int, float]]: list of (doc_idx, score) sorted by score desc,
+        positive scores only.
+    """
+    query_vector = lsa_index.embed_query(query_terms)
+    if query_vector is None or top_k <= 0:
+        return []
+    with span("candidates"):
+        rows = [slice(0, lsa_index.list_docs.size)] if exact else lsa_index.probe(query_vector, n_probe)
+    with span("scoring"):
+        docs = np.concatenate([lsa_index.list_docs[r] for r in rows])
+        scores = np.concatenate([lsa_index.embeddings[r] @ query_vector for r in rows])
+    if enabled():
+        count("docs_scored", docs.size)
+    with span("top_k"):
+        keep = scores > 0
+        docs, scores = docs[keep], scores[keep]
+        return _top_hits(docs, scores, top_k)
+
+
+def top_k_per_query(scores, top_k):
+    """
+    Best documents of every column of a sparse (|documents|, |queries|) score matrix.
+
+    Only documents with a positive score are returned; ties go to the
+    lower doc ID, as in search_bm25.
+
+    Returns:
+        List[List[tuple[int, float]]]: (doc_idx, score) lists, one per query.
+    """
+    scores = scores.tocsc()
+    results = []
+    for q in range(scores.shape[1]):
+        start, end = scores.indptr[q], scores.indptr[q + 1]
+        docs, values = scores.indices[start:end], scores.data[start:end]
+        keep = values > 0
+        docs, values = docs[keep], values[keep]
+        results.append(_top_hits(docs, values, top_k))
+    return results
+
+
+def search_tfidf_batch(queries, tfidf_index, top_k=6):
+    """
+    TF-IDF cosine ranking of many queries with one sparse matrix product.
+
+    Args:
+        queries (list of list of str): preprocessed query tokens, one list per query.
+        tfidf_index (TfidfIndex): model fitted once at index time.
+        top_k (int): number of top results per query.
+
+    Returns:
+        List[List[tuple[int, float]]]: (doc_idx, score) lists sorted by score
+        desc, one per query; documents scoring zero are left out.
+    """
+    with span("scoring"):
+        scores = tfidf_index.doc_matrix @ tfidf_index.vectorize_batch(queries).T
+    with span("top_k"):
+        return top_k_per_query(scores, top_k)
+
+
+def search_bm25_batch(queries, bm25_index, top_k=6):
+    """
+    BM25 ranking of many queries with one sparse matrix product.
+
+    The precomputed impacts of every term used by the batch are laid out as
+    a (|documents|, |terms|) matrix and multiplied by the (|terms|, |queries|)
+    matrix of query term counts, so each posting list is read once per batch.
+
+    Args:
+        queries (list of list of str): preprocessed query tokens, one list per query.
+        bm25_index (Bm25Index): postings with precomputed BM25 scores.
+        top_k (int): number of top results per query.
+
+    Returns:
+        List[List[tuple[int, float]]]: (doc_idx, score) lists sorted by score
+        desc, one per query, same scores as search_bm25.
+    """
+    term_cols = {}
+    rows, cols, counts = [], [], []
+    for q, query_terms in enumerate(queries):
+        for term in query_terms:
+            if term in bm25_index.postings:
+                rows.append(term_cols.setdefault(term, len(term_cols)))
+                cols.append(q)
+                counts.append(1.0)
+    postings = [bm25_index.postings[t] for t in term_cols]
+    indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+    np.cumsum([p.doc_ids.size for p in postings], out=indptr[1:])
+    impacts = csc_matrix(
+        (
+            np.concatenate([p.impacts for p in postings]).astype(np.float64) if postings else np.empty(0),
+            np.concatenate([p.doc_ids for p in postings]).astype(np.int64) if postings else np.empty(0, np.int64),
+            indptr,
+        ),
+        shape=(bm25_index.n_docs, len(postings)),
+    )
+    # duplicate (term, query) entries add up, so repeated query terms weigh more
+    query_matrix = csc_matrix((counts, (rows, cols)), shape=(len(postings), len(queries)))
+    if enabled():
+        count("postings_scanned", impacts.nnz)
+    with span("scoring"):
+        scores = impacts @ query_matrix
+    with span("top_k"):
+        return top_k_per_query(scores, top_k)
@@ -0,0 +1,817 @@
+import os
+import re
+import json
+import time
+import heapq
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+from functools import cached_property
+
+import numpy as np
+from scipy.sparse import csr_matrix, diags, vstack
+
+from corpus import list_corpus_files, SourceSpans
+from indexing import IndexBuilder, TfidfIndex
+from semantic import build_lsa_index
+from index_store import write_index, open_index
+from ingest import DocSpool, ingest
+import retrival
+from snippets import make_snippet
+from lexicon import MAX_EXPANSIONS, Lexicon, is_pattern
+from boolean_query import map_terms
+from instrument import count, span
+from analysis import DEFAULT_SCHEMA, load_schema, split_field_term
+
+STATE_FILE = "segments.json"
+STATE_VERSION = 1
+SEGMENT_NAME = re.compile(r"^seg_(\d+)")
+
+
+class Segment:
+    """
+    One immutable index segment and the tombstones of its deleted documents.
+
+    Attributes:
+        data (dict): index structures of the segment (see indexing.build_indexes),
+            plus its "filenames", "raw_docs" and "sources" (corpus.SourceSpans),
+            all using segment-local doc IDs.
+        live (np.ndarray): bool mask, False for tombstoned documents.
+    """
+
+    def __init__(self, data, deleted=()):
+        self.data = data
+        self.live = np.ones(len(data["filenames"]), dtype=bool)
+        self.live[list(deleted)] = False
+        self.live.setflags(write=False)
+
+    @property
+    def n_docs(self):
+        return self.live.size
+
+    @property
+    def n_deleted(self):
+        return int(self.n_docs - np.count_nonzero(self.live))
+
+
+class _ConcatDocs:
+    """Global doc ID -> raw text over all segments."""
+
+    def __init__(self, segments, bases):
+        self._segments = segments
+        self._bases = bases
+
+    def locate(self, doc_id):
+        """(segment, segment-local doc ID) of a global doc ID."""
+        seg = int(np.searchsorted(self._bases, doc_id, side="right")) - 1
+        return self._segments[seg], int(doc_id - self._bases[seg])
+
+    def __getitem__(self, doc_id):
+        seg, local = self.locate(doc_id)
+        return seg.data["raw_docs"][local]
+
+
+def _has_term(term_doc_matrix, term):
+    # a pattern's expansion (tuple) is in the vocabulary if any of its terms is
+    return any(term_doc_matrix.row(t) is not None for t in (term if isinstance(term, tuple) else (term,)))
+
+
+class SegmentSearcher:
+    """
+    Runs the retrival functions over every segment and merges the results.
+
+    Global doc IDs number the documents of all segments in segment order,
+    tombstoned documents included, so filenames[i] and raw_docs[i] always
+    resolve. Tombstoned documents never appear in results. Ranking
+    statistics (IDF, average length) are per segment until segments merge,
+    except for LSA: cosines in the latent spaces of different segments do
+    not compare, so one LSA model is fitted over the live documents of all
+    segments (see lsa_index).
+
+    Wildcard and fuzzy query terms (see lexicon.parse_query) are expanded
+    against the vocabulary of every segment before searching: the boolean
+    modes match the union of their postings, the ranked modes score every
+    expansion as a query term.
+
+    A searcher never changes once built (a new index generation gets a new
+    searcher, see LiveIndex), so one instance can serve any number of
+    threads at once.
+
+    Queries must be analyzed with the schema the segments were built with
+    (see the schema attribute), adding schema.field_terms to BM25 queries
+    for field-weighted ranking.
+    """
+
+    def __init__(self, segments):
+        self.segments = tuple(segments)
+        sizes = [seg.n_docs for seg in segments]
+        self.bases = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64) if sizes else np.zeros(0, np.int64)
+        self.filenames = [name for seg in segments for name in seg.data["filenames"]]
+        self.raw_docs = _ConcatDocs(segments, self.bases)
+        # every segment of an index is built with one schema (see IncrementalIndexer)
+        self.schema = segments[0].data.get("analysis", DEFAULT_SCHEMA) if segments else DEFAULT_SCHEMA
+        self._lsa_lock = threading.Lock()
+
+    def _search_segments(self, search_fn, key, query, segment_args):
+        # search_fn(query, data[key], *args) for every (segment index, args)
+        # pair of segment_args, in order; ShardedSearcher runs them in parallel
+        return [search_fn(query, self.segments[i].data[key], *args) for i, args in segment_args]
+
+    def _matches(self, search_fn, key, query, *args, segment_args=None):
+        # segment_args: (segment index, args) of the segments to search, if not all with args
+        if segment_args is None:
+            segment_args = [(i, args) for i in range(len(self.segments))]
+        hits = []
+        for (i, _), matches in zip(segment_args, self._search_segments(search_fn, key, query, segment_args)):
+            seg, base = self.segments[i], int(self.bases[i])
+            hits.extend(base + d for d in matches if seg.live[d])
+        return hits
+
+    def _paged(self, page_fn, key, query, cursor, page_size, segment_args=None):
+        # page_fn(query, data[key], *args, after, limit) -> a segment's next local
+        # doc IDs after `after`; segment_args as in _matches, args () by default
+        if segment_args is None:
+            segment_args = [(i, ()) for i in range(len(self.segments))]
+        after = -1 if cursor is None else int(cursor)
+        hits = []
+        for i, args in segment_args:
+            seg, base = self.segments[i], int(self.bases[i])
+            local = max(after - base, -1)
+            while local + 1 < seg.n_docs and len(hits) <= page_size:
+                # one extra hit tells whether there is a next page
+                want = page_size + 1 - len(hits)
+                docs = page_fn(query, seg.data[key], *args, local, want)
+                hits.extend(base + d for d in docs if seg.live[d])
+                if len(docs) < want:
+                    break
+                local = docs[-1]
+            if len(hits) > page_size:
+                break
+        return retrival.ResultPage(tuple(hits[:page_size]), hits[page_size - 1] if len(hits) > page_size else None)
+
+    def _ranked(self, search_fn, key, query_terms, top_k, *args):
+        # ask every segment for enough extra hits to cover its tombstones
+        segment_args = [(i, (top_k + seg.n_deleted, *args)) for i, seg in enumerate(self.segments)]
+        results = []
+        for (i, _), hits in zip(segment_args, self._search_segments(search_fn, key, query_terms, segment_args)):
+            seg, base = self.segments[i], int(self.bases[i])
+            results.extend((base + d, score) for d, score in hits if seg.live[d])
+        return heapq.nlargest(top_k, results, key=lambda r: (r[1], -r[0]))
+
+    def _ranked_batch(self, search_fn, key, queries, top_k):
+        segment_args = [(i, (top_k + seg.n_deleted,)) for i, seg in enumerate(self.segments)]
+        merged = [[] for _ in queries]
+        for (i, _), per_query in zip(segment_args, self._search_segments(search_fn, key, queries, segment_args)):
+            seg, base = self.segments[i], int(self.bases[i])
+            for results, hits in zip(merged, per_query):
+                results.extend((base + d, score) for d, score in hits if seg.live[d])
+        return [heapq.nlargest(top_k, results, key=lambda r: (r[1], -r[0])) for results in merged]
+
+    @cached_property
+    def lexicons(self):
+        """Lexicon of every segment's vocabulary, built on first use."""
+        return [Lexicon(seg.data["vocabulary"]) for seg in self.segments]
+
+    def expand(self, pattern, limit=MAX_EXPANSIONS):
+        """Sorted tuple of the terms of any segment matching a wildcard or fuzzy pattern."""
+        terms = set()
+        for lexicon in self.lexicons:
+            terms.update(lexicon.expand(pattern, limit))
+        count("terms_expanded", len(terms))
+        return tuple(sorted(terms)[:limit])
+
+    def expand_terms(self, query_terms):
+        """query_terms with every pattern replaced by the tuple of terms it matches."""
+        if not any(is_pattern(t) for t in query_terms):
+            return query_terms
+        with span("expand"):
+            return [self.expand(t) if is_pattern(t) else t for t in query_terms]
+
+    def _flat_terms(self, query_terms):
+        return [t for term in self.expand_terms(query_terms) for t in (term if isinstance(term, tuple) else (term,))]
+
+    def doc_freq(self, term):
+        """Number of documents containing term, over all segments (tombstones included)."""
+        return sum(retrival.get_postings(seg.data["inverted_index"], term).size for seg in self.segments)
+
+    def suggest(self, term, max_edits=None):
+        """
+        "Did you mean" for a query term: the closest vocabulary term by
+        edit distance, the most frequent one among equally close terms.
+
+        Returns:
+            str | None: the suggestion, None if no term is close enough.
+        """
+        with span("suggest"):
+            distances = {}
+            for lexicon in self.lexicons:
+                for candidate, distance in lexicon.fuzzy(term, max_edits):
+                    distances[candidate] = min(distance, distances.get(candidate, distance))
+            candidates = [(d, -self.doc_freq(t), t) for t, d in distances.items() if t != term]
+            candidates = [c for c in candidates if c[1] < 0]
+        return min(candidates)[2] if candidates else None
+
+    def _incidence_terms(self, query_terms):
+        # like one index, the incidence mode ignores the terms (and patterns)
+        # no segment has; a segment without one of the others matches nothing
+        terms, found = [], []
+        for term in self.expand_terms(query_terms):
+            in_segments = [_has_term(seg.data["term_doc_matrix"], term) for seg in self.segments]
+            if any(in_segments):
+                terms.append(term)
+                found.append(in_segments)
+        complete = [all(column) for column in zip(*found)] if found else [True] * len(self.segments)
+        return terms, [(i, ()) for i, ok in enumerate(complete) if ok]
+
+    def search_term_doc_incidence(self, query_terms):
+        terms, segment_args = self._incidence_terms(query_terms)
+        return self._matches(retrival.search_term_doc_incidence, "term_doc_matrix", terms, segment_args=segment_args)
+
+    def search_inverted_index(self, query_terms):
+        return self._matches(retrival.search_inverted_index, "inverted_index", self.expand_terms(query_terms))
+
+    def search_phrase(self, query_terms):
+        return self._matches(retrival.search_phrase, "positional_index", query_terms)
+
+    def search_boolean(self, query_tree):
+        query_tree = map_terms(query_tree, lambda t: self.expand(t) if is_pattern(t) else t)
+        # a bare NOT matches within each segment's own documents
+        segment_args = [(i, (seg.n_docs,)) for i, seg in enumerate(self.segments)]
+        return self._matches(retrival.search_boolean, "inverted_index", query_tree, segment_args=segment_args)
+
+    def search_proximity(self, query_terms, distance):
+        return self._matches(retrival.search_proximity, "positional_index", query_terms, distance)
+
+    def page_term_doc_incidence(self, query_terms, cursor=None, page_size=retrival.PAGE_SIZE):
+        """
+        One page of search_term_doc_incidence's hits: the first page_size
+        after cursor (None for the first page). Only as much of every
+        segment is scanned as the page needs.
+
+        Returns:
+            retrival.ResultPage: the hits and the cursor of the next page.
+        """
+        terms, segment_args = self._incidence_terms(query_terms)
+        return self._paged(
+            retrival.page_term_doc_incidence, "term_doc_matrix", terms, cursor, page_size, segment_args)
+
+    def page_inverted_index(self, query_terms, cursor=None, page_size=retrival.PAGE_SIZE):
+        """One page of search_inverted_index's hits (see page_term_doc_incidence)."""
+        return self._paged(
+            retrival.page_inverted_index, "inverted_index", self.expand_terms(query_terms), cursor, page_size)
+
+    def page_boolean(self, query_tree, cursor=None, page_size=retrival.PAGE_SIZE):
+        """One page of search_boolean's hits (see page_term_doc_incidence)."""
+        query_tree = map_terms(query_tree, lambda t: self.expand(t) if is_pattern(t) else t)
+        segment_args = [(i, (seg.n_docs,)) for i, seg in enumerate(self.segments)]
+        return self._paged(retrival.page_boolean, "inverted_index", query_tree, cursor, page_size, segment_args)
+
+    def page_phrase(self, query_terms, cursor=None, page_size=retrival.PAGE_SIZE):
+        """One page of search_phrase's hits, cut from the complete result (see retrival.paginate)."""
+        return retrival.paginate(self.search_phrase(query_terms), cursor, page_size)
+
+    def page_proximity(self, query_terms, distance, cursor=None, page_size=retrival.PAGE_SIZE):
+        """One page of search_proximity's hits, cut from the complete result (see retrival.paginate)."""
+        return retrival.paginate(self.search_proximity(query_terms, distance), cursor, page_size)
+
+    def search_tfidf(self, query_terms, top_k=6, min_score=None):
+        return self._ranked(retrival.search_tfidf, "tfidf_index", self._flat_terms(query_terms), top_k, min_score)
+
+    def search_bm25(self, query_terms, top_k=6):
+        return self._ranked(retrival.search_bm25, "bm25_index", self._flat_terms(query_terms), top_k)
+
+    def search_impact(self, query_terms, top_k=6, posting_budget=None, time_budget=None):
+        return self._ranked(
+            retrival.search_impact, "impact_index", self._flat_terms(query_terms), top_k, posting_budget, time_budget)
+
+    def _tfidf_rows(self):
+        # TF-IDF rows of the live documents of every segment, weighted as one
+        # index would: a segment's rows are its term counts times its IDF,
+        # L2-normalized, so dividing its IDF out leaves the counts up to the
+        # row's norm, which the final normalization cancels
+        vocabulary = sorted(set().union(*(seg.data["tfidf_index"].term_to_index for seg in self.segments)))
+        term_to_index = {term: i for i, term in enumerate(vocabulary)}
+        blocks = []
+        for seg in self.segments:
+            tfidf = seg.data["tfidf_index"]
+            columns = np.empty(len(tfidf.term_to_index), dtype=np.int64)
+            for term, col in tfidf.term_to_index.items():
+                columns[col] = term_to_index[term]
+            rows = tfidf.doc_matrix.tocoo()
+            live = seg.live[rows.row]
+            blocks.append(csr_matrix(
+                (rows.data[live] / tfidf.idf[rows.col[live]], (rows.row[live], columns[rows.col[live]])),
+                shape=(seg.n_docs, len(vocabulary)),
+            ))
+        counts = vstack(blocks, format="csr")
+        n_docs = sum(seg.n_docs - seg.n_deleted for seg in self.segments)
+        # smoothed IDF, as IndexBuilder.tfidf_index computes it
+        idf = np.log((n_docs + 1) / (np.bincount(counts.indices, minlength=len(vocabulary)) + 1)) + 1
+        weights = counts @ diags(idf)
+        norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+        weights = diags(1 / np.where(norms > 0, norms, 1)) @ weights
+        return TfidfIndex(term_to_index, idf, weights.tocsc())
+
+    @property
+    def lsa_index(self):
+        """
+        LsaIndex over global doc IDs: the segment's own for a single segment,
+        else one fitted over the live documents of every segment, on first
+        use (tombstoned documents get no embedding). A new generation opens a
+        new searcher, so the model is refitted whenever the index changes.
+        """
+        if len(self.segments) == 1:
+            return self.segments[0].data["lsa_index"]
+        with self._lsa_lock:
+            if getattr(self, "_lsa_index", None) is None:
+                with span("lsa_fit"):
+                    self._lsa_index = build_lsa_index(self._tfidf_rows())
+            return self._lsa_index
+
+    def search_lsa(self, query_terms, top_k=6, n_probe=None):
+        query_terms = self._flat_terms(query_terms)
+        if len(self.segments) == 1:
+            return self._ranked(retrival.search_lsa, "lsa_index", query_terms, top_k, n_probe)
+        if not self.segments:
+            return []
+        # tombstoned documents have no embedding, so never score above 0
+        return retrival.search_lsa(query_terms, self.lsa_index, top_k, n_probe)
+
+    def search_tfidf_batch(self, queries, top_k=6):
+        queries = [self._flat_terms(q) for q in queries]
+        return self._ranked_batch(retrival.search_tfidf_batch, "tfidf_index", queries, top_k)
+
+    def search_bm25_batch(self, queries, top_k=6):
+        queries = [self._flat_terms(q) for q in queries]
+        return self._ranked_batch(retrival.search_bm25_batch, "bm25_index", queries, top_k)
+
+    def snippet(self, doc_id, query_terms):
+        """Highlighted snippet of a result (see snippets.make_snippet)."""
+        seg, local = self.raw_docs.locate(doc_id)
+        return make_snippet(seg.data["raw_docs"][local], seg.data, local, query_terms)
+
+    def source(self, doc_id):
+        """
+        Where a result comes from (see corpus.SourceSpans.locate).
+
+        Returns:
+            tuple[str, int, int, int]: source path relative to the data
+            folder, start and end byte offsets in it, and first line.
+        """
+        seg, local = self.raw_docs.locate(doc_id)
+        return seg.data["sources"].locate(local)
+
+
+def segment_tokens(data, doc_ids):
+    """
+    Rebuild the preprocessed token lists of some documents from the
+    positional index of their segment, so merging never re-runs preprocess.
+
+    Args:
+        data (dict): segment index structures.
+        doc_ids (list of int): segment-local doc IDs to rebuild.
+
+    Returns:
+        list[list[str]]: tokens of each requested document.
+    """
+    lengths = np.asarray(data["bm25_index"].doc_lengths["body"], dtype=np.int64)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    term_ids = np.empty(int(lengths.sum()), dtype=np.int64)
+    vocabulary = data["vocabulary"]
+    for term_id, term in enumerate(vocabulary):
+        entry = data["positional_index"][term]
+        counts = np.diff(entry.offsets)
+        docs = np.repeat(entry.doc_ids.astype(np.int64), counts)
+        positions = entry.positions[entry.offsets[0]:entry.offsets[-1]]
+        term_ids[starts[docs] + positions] = term_id
+    return [[vocabulary[t] for t in term_ids[starts[d]:starts[d] + lengths[d]]] for d in doc_ids]
+
+
+def segment_field_tokens(data, doc_ids):
+    """
+    Rebuild the field terms of some documents from the BM25 postings of
+    their segment. Fields keep no positions, so every term comes back as
+    many times as it occurred, in no particular order, which is all BM25 needs.
+
+    Returns:
+        list[dict[str, list[str]]]: field -> terms, for each requested document.
+    """
+    slots = {d: i for i, d in enumerate(doc_ids)}
+    fields = [{} for _ in doc_ids]
+    for key in data["field_vocabulary"]:
+        name, term = split_field_term(key)
+        entry = data["bm25_index"].postings[key]
+        for d, tf in zip(entry.doc_ids.tolist(), entry.tfs.tolist()):
+            i = slots.get(d)
+            if i is not None:
+                fields[i].setdefault(name, []).extend([term] * tf)
+    return fields
+
+
+def file_fingerprint(path):
+    """Cheap change check: modification time and size."""
+    stat = os.stat(path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def content_hash(path):
+    """SHA-1 of the file content, to tell real edits from touched files."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def segments_exist(index_dir):
+    """Return True if index_dir holds a segmented index."""
+    return os.path.exists(os.path.join(index_dir, STATE_FILE))
+
+
+def _empty_state(generation=0, next_segment=0):
+    return {"format_version": STATE_VERSION, "generation": generation, "next_segment": next_segment,
+            "segments": [], "files": {}, "deleted": {}}
+
+
+def _read_counters(index_dir):
+    """
+    Generation and next segment number of index_dir, also from an outdated
+    or unreadable manifest, so a rebuild keeps counting up from them.
+    """
+    try:
+        with open(os.path.join(index_dir, STATE_FILE), encoding="utf-8") as f:
+            state = json.load(f)
+        generation, next_segment = int(state.get("generation", 0)), int(state.get("next_segment", 0))
+    except (OSError, ValueError, AttributeError):
+        generation, next_segment = 0, 0
+    # never reuse the name of a segment folder that is still there
+    existing = [int(m.group(1)) for m in map(SEGMENT_NAME.match, os.listdir(index_dir)) if m]
+    return generation, max([next_segment] + [n + 1 for n in existing])
+
+
+def read_state(index_dir):
+    """
+    Read the segment manifest of index_dir.
+
+    Returns:
+        dict: generation, segments (in order), per-file fingerprints and
+        locations, and tombstoned doc IDs per segment.
+    """
+    path = os.path.join(index_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return _empty_state()
+    with open(path, encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("format_version") != STATE_VERSION:
+        raise ValueError(f"Unsupported segment manifest version in {index_dir}; rebuild with `python segments.py --rebuild`")
+    return state
+
+
+def _write_state(index_dir, state):
+    # readers only ever see a complete manifest
+    tmp_path = os.path.join(index_dir, STATE_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, os.path.join(index_dir, STATE_FILE))
+
+
+class IncrementalIndexer:
+    """
+    Keeps a segmented index in index_dir in sync with the files in data_dir.
+
+    update() indexes new and changed files into a new segment and
+    tombstones the old copies of changed and deleted files; merge() folds
+    small segments together, dropping tombstoned documents. Segments are
+    never modified in place, so readers keep working during both.
+
+    Every segment is analyzed with the same schema, recorded in the segment
+    manifest: updating an index with a different schema raises ValueError
+    until it is rebuilt. prune_ratio is the fraction of every term's
+    lowest-impact postings left out of the impact-ordered index of the
+    segments it writes.
+    """
+
+    def __init__(self, index_dir="index", data_dir="Dataset", max_segments=4, schema=None, prune_ratio=0.0):
+        if not 0 <= prune_ratio < 1:
+            raise ValueError("prune_ratio must be in [0, 1)")
+        self.index_dir = index_dir
+        self.data_dir = data_dir
+        self.max_segments = max_segments
+        self.schema = schema if schema is not None else DEFAULT_SCHEMA
+        self.prune_ratio = prune_ratio
+        self._lock = threading.Lock()
+
+    def _segment_dir(self, name):
+        return os.path.join(self.index_dir, name)
+
+    def _new_segment(self, state, filenames, raw_docs, indexes):
+        name = f"seg_{state['next_segment']:06d}"
+        state["next_segment"] += 1
+        write_index(self._segment_dir(name), filenames, raw_docs, indexes)
+        state["segments"].append({"name": name, "n_docs": len(filenames)})
+        return name
+
+    def _drop_empty_segments(self, state):
+        """Forget segments whose documents are all tombstoned; return their names."""
+        dropped = [s["name"] for s in state["segments"] if len(state["deleted"].get(s["name"], [])) >= s["n_docs"]]
+        state["segments"] = [s for s in state["segments"] if s["name"] not in dropped]
+        for name in dropped:
+            state["deleted"].pop(name, None)
+        return dropped
+
+    def update(self):
+        """
+        Index new and changed files and tombstone changed and deleted ones.
+
+        Returns:
+            dict[str, list[str]]: filenames that were added, updated and deleted.
+        """
+        with self._lock:
+            os.makedirs(self.index_dir, exist_ok=True)
+            state = read_state(self.index_dir)
+            if state["segments"] and state.get("analysis") != self.schema.config:
+                raise ValueError(
+                    f"The index in {self.index_dir} was built with another analysis configuration; "
+                    "rebuild it with `python segments.py --rebuild`"
+                )
+            return self._sync(state)
+
+    def _sync(self, state, new_generation=False):
+        # index what changed in data_dir since state, then publish the new manifest
+        state["analysis"] = self.schema.config
+        current = list_corpus_files(self.data_dir)
+        changes = {"added": [], "updated": [], "deleted": []}
+
+        pending = []
+        for f in current:
+            path = os.path.join(self.data_dir, f)
+            fingerprint = file_fingerprint(path)
+            known = state["files"].get(f)
+            if known and known["mtime_ns"] == fingerprint["mtime_ns"] and known["size"] == fingerprint["size"]:
+                continue
+            digest = content_hash(path)
+            if known and known["sha1"] == digest:
+                known.update(fingerprint)  # touched but unchanged
+                continue
+            pending.append((f, fingerprint, digest))
+            changes["updated" if known else "added"].append(f)
+        changes["deleted"] = sorted(set(state["files"]) - set(current))
+
+        for f in changes["updated"] + changes["deleted"]:
+            # a file is the run of documents doc .. doc + n_docs - 1 of its segment
+            old = state["files"].pop(f)
+            if old.get("n_docs", 1):
+                state["deleted"].setdefault(old["segment"], []).extend(
+                    range(old["doc"], old["doc"] + old.get("n_docs", 1)))
+
+        if pending:
+            filenames, raw_docs, indexes, _ = ingest(
+                self.data_dir, [f for f, _, _ in pending], schema=self.schema, prune_ratio=self.prune_ratio)
+            name = self._new_segment(state, filenames, raw_docs, indexes)
+            sources = indexes["sources"]
+            counts = np.bincount(sources.doc_sources, minlength=len(sources.paths))
+            n_docs = {path: int(n) for path, n in zip(sources.paths, counts)}
+            doc = 0
+            for f, fingerprint, digest in pending:
+                entry = {**fingerprint, "sha1": digest, "segment": name, "doc": doc, "n_docs": n_docs.get(f, 0)}
+                state["files"][f] = entry
+                doc += entry["n_docs"]
+
+        dropped = self._drop_empty_segments(state)
+        if new_generation or any(changes.values()):
+            state["generation"] += 1
+        _write_state(self.index_dir, state)
+        for name in dropped:
+            shutil.rmtree(self._segment_dir(name), ignore_errors=True)
+
+        if any(changes.values()):
+            logging.info(
+                f"Index updated: {len(changes['added'])} added, "
+                f"{len(changes['updated'])} updated, {len(changes['deleted'])} deleted"
+            )
+        return changes
+
+    def merge(self, max_segments=None):
+        """
+        Merge the smallest segments until at most max_segments remain.
+
+        Tokens are rebuilt from the segments' positional indexes (field terms
+        from their BM25 postings) and sentence boundaries are carried over,
+        so nothing is preprocessed again; the raw texts are spooled to a
+        temporary file rather than held in memory. Tombstoned documents are
+        left out of the merged segment, which keeps the segments' schema.
+
+        Returns:
+            bool: True if a merge happened.
+        """
+        max_segments = max(1, max_segments or self.max_segments)
+        with self._lock:
+            state = read_state(self.index_dir)
+            if len(state["segments"]) <= max_segments:
+                return False
+            by_size = sorted(state["segments"], key=lambda s: s["n_docs"] - len(state["deleted"].get(s["name"], [])))
+            victims = [s["name"] for s in by_size[:len(state["segments"]) - max_segments + 1]]
+
+            builder = None
+            filenames, raw_docs, spans, moved = [], DocSpool(), [], {}
+            for name in victims:
+                data = open_index(self._segment_dir(name))
+                if builder is None:
+                    builder = IndexBuilder(data["analysis"])
+                deleted = set(state["deleted"].get(name, []))
+                live = [d for d in range(len(data["filenames"])) if d not in deleted]
+                for d, tokens, fields in zip(live, segment_tokens(data, live), segment_field_tokens(data, live)):
+                    builder.add_document(tokens, data["sentence_index"].sentences_for_doc(d), fields)
+                    moved[(name, d)] = len(filenames)
+                    filenames.append(data["filenames"][d])
+                    raw_docs.append(data["raw_docs"][d])
+                    spans.append(data["sources"].locate(d))
+
+            state["segments"] = [s for s in state["segments"] if s["name"] not in victims]
+            for name in victims:
+                state["deleted"].pop(name, None)
+            if filenames:
+                indexes = builder.build(prune_ratio=self.prune_ratio)
+                indexes["sources"] = SourceSpans.from_spans(spans)
+                merged = self._new_segment(state, filenames, raw_docs.raw_docs(), indexes)
+                # a file's documents are all live or all tombstoned, and stay contiguous
+                for entry in state["files"].values():
+                    key = (entry["segment"], entry["doc"])
+                    if entry.get("n_docs", 1) and key in moved:
+                        entry["segment"], entry["doc"] = merged, moved[key]
+            state["generation"] += 1
+            _write_state(self.index_dir, state)
+            # open readers keep their memory maps; the files go once they close them
+            for name in victims:
+                shutil.rmtree(self._segment_dir(name), ignore_errors=True)
+            logging.info(f"Merged {len(victims)} segments ({len(filenames)} live documents)")
+            return True
+
+    def merge_in_background(self):
+        """Run merge() on a daemon thread and return the thread."""
+        thread = threading.Thread(target=self.merge, name="segment-merge", daemon=True)
+        thread.start()
+        return thread
+
+    def rebuild(self):
+        """
+        Re-index every file into one new segment and swap it in for the old ones.
+
+        The old segments stay readable until the new manifest replaces
+        theirs, and the generation and segment numbers keep counting up, so
+        a LiveIndex serving the old index swaps in the rebuilt one like any
+        other new generation (and its query cache is cleared).
+
+        Returns:
+            dict[str, list[str]]: filenames that were added (all of them),
+            updated and deleted (none).
+        """
+        with self._lock:
+            os.makedirs(self.index_dir, exist_ok=True)
+            changes = self._sync(_empty_state(*_read_counters(self.index_dir)), new_generation=True)
+            live = {s["name"] for s in read_state(self.index_dir)["segments"]}
+            for entry in os.listdir(self.index_dir):
+                if SEGMENT_NAME.match(entry) and entry not in live:
+                    shutil.rmtree(self._segment_dir(entry), ignore_errors=True)
+            return changes
+
+    def open_searcher(self):
+        """Open every live segment and return a SegmentSearcher over them."""
+        state = read_state(self.index_dir)
+        return SegmentSearcher([
+            Segment(open_index(self._segment_dir(s["name"])), state["deleted"].get(s["name"], []))
+            for s in state["segments"]
+        ])
+
+    def watch(self, interval=2.0):
+        """
+        Keep the index in sync with data_dir until interrupted, using
+        watchdog events (batched every `interval` seconds) to trigger updates.
+        """
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        dirty = threading.Event()
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if not event.is_directory:
+                    dirty.set()
+
+        observer = Observer()
+        observer.schedule(_Handler(), self.data_dir, recursive=True)
+        observer.start()
+        try:
+            while True:
+                time.sleep(interval)
+                if dirty.is_set():
+                    dirty.clear()
+                    self.update()
+                    self.merge_in_background()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            observer.stop()
+            observer.join()
+
+
+class LiveIndex:
+    """
+    The searcher of the newest index generation, shared by every thread.
+
+    get() checks, at most every check_interval seconds, whether update(),
+    merge() or rebuild() (in this process or another) wrote a new
+    generation; if so, one caller opens it and swaps it in while the others
+    keep searching the previous searcher, and queries already running finish
+    on the searcher they started with. Without an index on disk the corpus
+    is indexed in memory, until an index appears.
+    """
+
+    IN_MEMORY = "in-memory"
+
+    def __init__(self, index_dir="index", data_dir="Dataset", check_interval=1.0, timer=time.monotonic):
+        self.index_dir = index_dir
+        self.data_dir = data_dir
+        self.check_interval = check_interval
+        self.timer = timer
+        self._lock = threading.Lock()
+        self._current = (None, None)  # (generation, searcher), replaced as a whole
+        self._checked = None
+
+    def _latest_generation(self):
+        if not segments_exist(self.index_dir):
+            return self.IN_MEMORY
+        return read_state(self.index_dir)["generation"]
+
+    def _open(self, generation):
+        if generation == self.IN_MEMORY:
+            filenames, raw_docs, indexes, _ = ingest(self.data_dir)
+            return SegmentSearcher([Segment({"filenames": filenames, "raw_docs": raw_docs, **indexes})])
+        return IncrementalIndexer(self.index_dir, self.data_dir).open_searcher()
+
+    def get(self):
+        """
+        Return the current searcher, swapping in a newer generation if there is one.
+
+        Returns:
+            tuple[SegmentSearcher, int | str]: the searcher and its index
+            generation ("in-memory" for an in-memory index), usable as a
+            query cache version.
+        """
+        generation, searcher = self._current
+        now = self.timer()
+        if searcher is not None and now - self._checked < self.check_interval:
+            return searcher, generation
+        # the first caller blocks until there is a searcher; later ones never wait for a swap
+        if not self._lock.acquire(blocking=searcher is None):
+            return searcher, generation
+        try:
+            generation, searcher = self._current
+            self._checked = now
+            try:
+                latest = self._latest_generation()
+                if searcher is None or latest != generation:
+                    searcher = self._open(latest)
+                    self._current = (latest, searcher)
+                    if generation is not None:
+                        logging.info(f"Swapped in index generation {latest} (was {generation})")
+                    generation = latest
+            except Exception as e:
+                if searcher is None:
+                    raise
+                # e.g. a merge removed a segment while it was being opened; retry on the next check
+                logging.warning(f"Opening the new index generation failed ({e}), still serving generation {generation}")
+            return searcher, generation
+        finally:
+            self._lock.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the on-disk search index.")
+    parser.add_argument("--data-dir", default="Dataset", help="folder with the corpus (searched recursively)")
+    parser.add_argument("--index-dir", default="index", help="where to keep the index")
+    parser.add_argument("--max-segments", type=int, default=4, help="merge when there are more segments")
+    parser.add_argument("--rebuild", action="store_true", help="re-index everything from scratch")
+    parser.add_argument("--watch", action="store_true", help="keep watching the dataset for changes")
+    parser.add_argument("--analysis", help="JSON file with the analyzers and fields to index with "
+                                           "(an analysis.Schema config); changing it needs --rebuild")
+    parser.add_argument("--prune-ratio", type=float, default=0.0,
+                        help="fraction of every term's lowest-impact postings to drop from the impact index")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    indexer = IncrementalIndexer(
+        args.index_dir, args.data_dir, args.max_segments, load_schema(args.analysis), args.prune_ratio)
+    if args.rebuild:
+        indexer.rebuild()
+    else:
+        indexer.update()
+    indexer.merge()
+    if args.watch:
+        indexer.watch()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+LSA_DIMS = 100
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 256  # training points per IVF list, at most
+CHUNK_ROWS = 8192  # rows per block when scoring many vectors against the centroids
+
+
+class LsaIndex:
+    """
+    Latent semantic index: TF-IDF vectors projected onto their top singular
+    vectors, searched through an inverted file (IVF) of k-means clusters.
+
+    Document embeddings are L2-normalized float32 rows stored contiguously
+    in cluster order, so probing a cluster is one dense matrix-vector
+    product over a slice, and exact search is one over the whole array.
+
+    Attributes:
+        tfidf (TfidfIndex): gives the query its TF-IDF weights.
+        term_vectors (np.ndarray): float32 embedding of every vocabulary term
+            (the transposed SVD components), shape (|vocabulary|, dims).
+        centroids (np.ndarray): float32 unit cluster centroids, shape (n_lists, dims).
+        list_offsets (np.ndarray): int64, embeddings of cluster c are rows
+            list_offsets[c]:list_offsets[c + 1].
+        list_docs (np.ndarray): uint32 doc ID of every embedding row.
+        embeddings (np.ndarray): float32 unit document embeddings, shape (|documents|, dims).
+        n_probe (int): clusters searched per query by default.
+    """
+
+    def __init__(self, tfidf, term_vectors, centroids, list_offsets, list_docs, embeddings, n_probe):
+        self.tfidf = tfidf
+        self.term_vectors = term_vectors
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_docs = list_docs
+        self.embeddings = embeddings
+        self.n_probe = n_probe
+
+    @property
+    def dims(self):
+        return self.term_vectors.shape[1]
+
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+
+    def embed_query(self, query_terms):
+        """Unit embedding of the query's TF-IDF vector, or None if no query term is indexed."""
+        cols, weights = self.tfidf.query_weights(query_terms)
+        if cols.size == 0 or self.dims == 0:
+            return None
+        vector = weights.astype(np.float32) @ self.term_vectors[cols]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def probe(self, query_vector, n_probe=None):
+        """
+        Embedding rows of the n_probe clusters closest to query_vector.
+
+        Returns:
+            list[slice]: row ranges of embeddings / list_docs.
+        """
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        closeness = self.centroids @ query_vector
+        nearest = np.argpartition(-closeness, n_probe - 1)[:n_probe] if n_probe < self.n_lists \
+            else np.arange(self.n_lists)
+        return [slice(self.list_offsets[c], self.list_offsets[c + 1]) for c in np.sort(nearest)]
+
+
+def _nearest_centroids(vectors, centroids):
+    # blocked so the (rows x lists) similarity matrix stays small
+    nearest = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], CHUNK_ROWS):
+        block = vectors[start:start + CHUNK_ROWS]
+        nearest[start:start + CHUNK_ROWS] = np.argmax(block @ centroids.T, axis=1)
+    return nearest
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1)
+
+
+def spherical_kmeans(vectors, n_lists, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Cluster unit vectors by cosine similarity (k-means on the sphere).
+
+    Trains on a sample of at most KMEANS_SAMPLE_PER_LIST points per cluster;
+    a cluster left empty keeps its previous centroid.
+
+    Returns:
+        np.ndarray: float32 unit centroids, shape (n_lists, dims).
+    """
+    rng = np.random.default_rng(seed)
+    if vectors.shape[0] > n_lists * KMEANS_SAMPLE_PER_LIST:
+        vectors = vectors[rng.choice(vectors.shape[0], n_lists * KMEANS_SAMPLE_PER_LIST, replace=False)]
+    centroids = vectors[rng.choice(vectors.shape[0], n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest_centroids(vectors, centroids)
+        members = csr_matrix(
+            (np.ones(assignment.size, dtype=np.float32), (assignment, np.arange(assignment.size))),
+            shape=(n_lists, vectors.shape[0]),
+        )
+        sums = np.asarray(members @ vectors)
+        filled = np.diff(members.indptr) > 0
+        centroids[filled] = _normalize_rows(sums[filled])
+    return centroids.astype(np.float32)
+
+
+def fit_term_vectors(doc_matrix, dims=LSA_DIMS, seed=0):
+    """
+    Fit LSA on TF-IDF rows: the embedding of every term.
+
+    Args:
+        doc_matrix (scipy.sparse matrix): TF-IDF weights, shape (|documents|, |vocabulary|).
+        dims (int): embedding size, capped by the corpus and vocabulary sizes.
+        seed (int): for the SVD.
+
+    Returns:
+        np.ndarray: float32 transposed SVD components, shape (|vocabulary|, dims).
+    """
+    n_docs, n_terms = doc_matrix.shape
+    dims = max(0, min(dims, n_docs - 1, n_terms - 1))
+    if dims == 0 or doc_matrix.nnz == 0:
+        return np.zeros((n_terms, 0), np.float32)
+    from sklearn.decomposition import TruncatedSVD  # heavy import, only needed to build
+
+    svd = TruncatedSVD(n_components=dims, algorithm="randomized", random_state=seed)
+    svd.fit(doc_matrix.tocsr())
+    return np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+
+
+def build_lsa_index(tfidf, dims=LSA_DIMS, n_lists=None, n_probe=None, seed=0, term_vectors=None):
+    """
+    Fit LSA on a TF-IDF index and cluster the documents for IVF search.
+
+    Args:
+        tfidf (TfidfIndex): the documents' TF-IDF weights.
+        dims (int): embedding size, capped by the corpus and vocabulary sizes.
+        n_lists (int): IVF clusters; defaults to about sqrt(|documents|).
+        n_probe (int): clusters searched per query; defaults to a tenth of
+            them (at least 4).
+        seed (int): for the SVD and the k-means initialization.
+        term_vectors (np.ndarray): term embeddings fitted on a larger corpus
+            (see fit_term_vectors) to project the documents with instead of
+            fitting them here, so that indexes of parts of that corpus
+            share one latent space and their cosine scores compare.
+
+    Returns:
+        LsaIndex
+    """
+    doc_matrix = tfidf.doc_matrix
+    n_docs, n_terms = doc_matrix.shape
+    if term_vectors is None:
+        term_vectors = fit_term_vectors(doc_matrix, dims, seed)
+    if term_vectors.shape[1] == 0 or doc_matrix.nnz == 0:
+        return LsaIndex(
+            tfidf, np.zeros((n_terms, 0), np.float32), np.zeros((0, 0), np.float32),
+            np.zeros(1, np.int64), np.zeros(0, np.uint32), np.zeros((0, 0), np.float32), 0,
+        )
+    embeddings = _normalize_rows(doc_matrix.tocsr() @ term_vectors).astype(np.float32)
+
+    n_lists = max(1, min(n_lists or int(round(np.sqrt(n_docs))), n_docs))
+    centroids = spherical_kmeans(embeddings, n_lists, seed=seed)
+    assignment = _nearest_centroids(embeddings, centroids)
+    order = np.argsort(assignment, kind="stable")
+    list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignment, minlength=n_lists), out=list_offsets[1:])
+    n_probe = min(n_lists, n_probe or max(4, n_lists // 10))
+    return LsaIndex(
+        tfidf, term_vectors, centroids, list_offsets,
+        order.astype(np.uint32), np.ascontiguousarray(embeddings[order]), n_probe,
+    )
@@ -0,0 +1,330 @@
+import json
+import time
+import asyncio
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.web
+
+from preprocess import ensure_resources
+from ingest import ingest
+from segments import IncrementalIndexer, Segment, SegmentSearcher, segments_exist
+from shards import ShardedSearcher
+from query_cache import normalize_terms
+from instrument import METRICS, trace
+from boolean_query import parse_boolean, query_terms as boolean_terms
+from lexicon import parse_query
+
+MODES = ("incidence", "inverted", "boolean", "phrase", "proximity", "tfidf", "bm25", "lsa")
+RANKED = ("tfidf", "bm25", "lsa")
+BATCHED = ("tfidf", "bm25")
+POSITIONAL = ("phrase", "proximity")  # no wildcard or fuzzy terms in these modes
+MAX_BATCH = 1000
+
+
+def load_searcher(index_dir="index", data_dir="Dataset", shards_dir=None):
+    """
+    Open the sharded index in shards_dir if given (see `python shards.py`),
+    else the segmented index in index_dir, or index data_dir in memory if
+    there is none yet (see `python segments.py`).
+
+    Returns:
+        SegmentSearcher: searcher over the whole corpus.
+    """
+    if shards_dir is not None:
+        return ShardedSearcher(shards_dir)
+    if segments_exist(index_dir):
+        return IncrementalIndexer(index_dir, data_dir).open_searcher()
+    filenames, raw_docs, indexes, stats = ingest(data_dir)
+    return SegmentSearcher([Segment({"filenames": filenames, "raw_docs": raw_docs, **indexes})])
+
+
+class SearchService:
+    """
+    Runs searches on a thread pool, off the event loop.
+
+    Concurrent requests for the same query (same mode, normalized terms and
+    options) share one execution: the first starts it and the others await
+    its result. With trace_all every query is traced into instrument.METRICS;
+    otherwise only the requests asking for a trace are.
+    """
+
+    def __init__(self, searcher, workers=4, trace_all=False):
+        self.searcher = searcher
+        self.trace_all = trace_all
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+        self._in_flight = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def query_terms(self, mode, query):
+        """
+        Analyze a query with the analyzer the index was built with: wildcard
+        and fuzzy words are kept for expansion (except in the positional
+        modes), and BM25 queries get the schema's field terms.
+        """
+        schema = self.searcher.schema
+        query_terms = schema.body(query) if mode in POSITIONAL else parse_query(query, schema.body)
+        if mode == "bm25":
+            query_terms += schema.field_terms(query)
+        return query_terms
+
+    async def analyze(self, fn, *args):
+        """Run query analysis fn(*args) on the search threads rather than the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def query_terms_batch(self, mode, queries):
+        """query_terms of many queries, analyzed on the search threads."""
+        return await self.analyze(lambda: [self.query_terms(mode, q) for q in queries])
+
+    def _run(self, mode, query_terms, top_k, distance, min_score=None):
+        if mode == "incidence":
+            return [(d, None) for d in self.searcher.search_term_doc_incidence(query_terms)]
+        if mode == "inverted":
+            return [(d, None) for d in self.searcher.search_inverted_index(query_terms)]
+        if mode == "boolean":
+            return [(d, None) for d in self.searcher.search_boolean(query_terms)]
+        if mode == "phrase":
+            return [(d, None) for d in self.searcher.search_phrase(query_terms)]
+        if mode == "proximity":
+            return [(d, None) for d in self.searcher.search_proximity(query_terms, distance)]
+        if mode == "tfidf":
+            return self.searcher.search_tfidf(query_terms, top_k, min_score)
+        if mode == "lsa":
+            return self.searcher.search_lsa(query_terms, top_k)
+        return self.searcher.search_bm25(query_terms, top_k)
+
+    @staticmethod
+    def _execute(name, traced, fn, *args):
+        # runs on a worker thread, so the trace is opened there
+        if not traced:
+            return fn(*args), None
+        with trace(name) as query_trace:
+            result = fn(*args)
+        return result, query_trace.to_dict()
+
+    async def _coalesce(self, key, name, traced, fn, *args):
+        traced = traced or self.trace_all
+        key = key + (traced,)
+        future = self._in_flight.get(key)
+        if future is None:
+            self.executed += 1
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, self._execute, name, traced, fn, *args)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # a cancelled request must not cancel the requests sharing its result
+        return await asyncio.shield(future)
+
+    async def search(self, mode, query_terms, top_k=10, distance=None, traced=False, min_score=None):
+        """
+        Run one query.
+
+        Args:
+            query_terms: preprocessed query tokens, or the parse_boolean
+                tree in boolean mode.
+            min_score (float): TF-IDF only, drop results scoring below it.
+
+        Returns:
+            tuple[list, dict]: (doc_id, score) results, score None for
+            unranked modes, and the query trace (None unless traced).
+        """
+        terms = (str(query_terms),) if mode == "boolean" else normalize_terms(mode, query_terms)
+        key = (mode, terms, top_k if mode in RANKED else None, distance, min_score)
+        return await self._coalesce(key, mode, traced, self._run, mode, query_terms, top_k, distance, min_score)
+
+    async def search_batch(self, mode, queries, top_k=10, traced=False):
+        """(doc_id, score) results of many ranked queries, scored in one matrix product, and their trace."""
+        fn = self.searcher.search_tfidf_batch if mode == "tfidf" else self.searcher.search_bm25_batch
+        key = ("batch", mode, tuple(normalize_terms(mode, q) for q in queries), top_k)
+        return await self._coalesce(key, f"{mode}_batch", traced, fn, queries, top_k)
+
+    def stats(self):
+        return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        if isinstance(self.searcher, ShardedSearcher):
+            self.searcher.close()
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, service):
+        self.service = service
+
+    def write_error(self, status_code, **kwargs):
+        exc = kwargs.get("exc_info", (None, None, None))[1]
+        message = exc.log_message if isinstance(exc, tornado.web.HTTPError) and exc.log_message else self._reason
+        self.finish({"error": message})
+
+    def body_json(self):
+        try:
+            return json.loads(self.request.body or b"{}")
+        except json.JSONDecodeError:
+            raise tornado.web.HTTPError(400, "request body is not valid JSON")
+
+    def options_from(self, params):
+        """Validate mode, top_k and distance of a request."""
+        mode = params.get("mode", "bm25")
+        if mode not in MODES:
+            raise tornado.web.HTTPError(400, f"mode must be one of {', '.join(MODES)}")
+        try:
+            top_k = int(params.get("top_k", 10))
+            distance = int(params["distance"]) if params.get("distance") is not None else None
+        except (TypeError, ValueError):
+            raise tornado.web.HTTPError(400, "top_k and distance must be integers")
+        if mode == "proximity" and distance is None:
+            raise tornado.web.HTTPError(400, "proximity mode needs a distance")
+        return mode, max(0, top_k), distance
+
+    def traced(self, params):
+        return str(params.get("trace", "")).lower() in ("1", "true", "yes")
+
+    def hits(self, results):
+        searcher = self.service.searcher
+        return [
+            {"doc": int(d), "filename": searcher.filenames[d], "source": self.source(searcher, d), "score": score}
+            for d, score in results
+        ]
+
+    @staticmethod
+    def source(searcher, doc_id):
+        """Source file and byte range of a document (see SegmentSearcher.source)."""
+        path, start, end, line = searcher.source(doc_id)
+        return {"path": path, "start": start, "end": end, "line": line}
+
+
+class SearchHandler(BaseHandler):
+    """GET /search?q=...&mode=bm25&top_k=10 (&min_score=0.1 for tfidf) or POST the same fields as JSON."""
+
+    async def get(self):
+        params = {k: self.get_argument(k) for k in self.request.arguments}
+        await self.respond(params)
+
+    async def post(self):
+        await self.respond(self.body_json())
+
+    async def respond(self, params):
+        query = params.get("q", params.get("query"))
+        if not isinstance(query, str) or not query.strip():
+            raise tornado.web.HTTPError(400, "missing query")
+        mode, top_k, distance = self.options_from(params)
+        started = time.perf_counter()
+        if mode == "boolean":
+            analyze = self.service.searcher.schema.body  # the analyzer the index was built with
+            try:
+                query_tree = await self.service.analyze(parse_boolean, query, lambda word: parse_query(word, analyze))
+            except ValueError as e:
+                raise tornado.web.HTTPError(400, str(e))
+            query_terms = boolean_terms(query_tree)
+            results, query_trace = await self.service.search(mode, query_tree, top_k, None, self.traced(params))
+        else:
+            query_terms = await self.service.analyze(self.service.query_terms, mode, query)
+            try:
+                min_score = float(params["min_score"]) if params.get("min_score") is not None else None
+            except (TypeError, ValueError):
+                raise tornado.web.HTTPError(400, "min_score must be a number")
+            results, query_trace = await self.service.search(
+                mode, query_terms, top_k, distance, self.traced(params), min_score)
+        response = {
+            "query": query,
+            "terms": query_terms,
+            "mode": mode,
+            "results": self.hits(results),
+            "took_ms": (time.perf_counter() - started) * 1000,
+        }
+        if query_trace is not None and self.traced(params):
+            response["trace"] = query_trace
+        self.write(response)
+
+
+class BatchHandler(BaseHandler):
+    """POST /batch {"queries": [...], "mode": "bm25" | "tfidf", "top_k": 10}"""
+
+    async def post(self):
+        params = self.body_json()
+        queries = params.get("queries")
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            raise tornado.web.HTTPError(400, "queries must be a list of strings")
+        if len(queries) > MAX_BATCH:
+            raise tornado.web.HTTPError(413, f"at most {MAX_BATCH} queries per batch")
+        mode, top_k, _ = self.options_from(params)
+        if mode not in BATCHED:
+            raise tornado.web.HTTPError(400, "batch mode must be tfidf or bm25")
+        started = time.perf_counter()
+        term_lists = await self.service.query_terms_batch(mode, queries)
+        batch, query_trace = await self.service.search_batch(mode, term_lists, top_k, self.traced(params)) \
+            if queries else ([], None)
+        response = {
+            "mode": mode,
+            "results": [
+                {"query": q, "terms": terms, "results": self.hits(results)}
+                for q, terms, results in zip(queries, term_lists, batch)
+            ],
+            "took_ms": (time.perf_counter() - started) * 1000,
+        }
+        if query_trace is not None and self.traced(params):
+            response["trace"] = query_trace
+        self.write(response)
+
+
+class StatsHandler(BaseHandler):
+    def get(self):
+        self.write({"documents": len(self.service.searcher.filenames), **self.service.stats()})
+
+
+class MetricsHandler(BaseHandler):
+    """Totals of every traced query, in the Prometheus text format."""
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(METRICS.to_prometheus())
+
+
+def make_app(service):
+    args = {"service": service}
+    return tornado.web.Application([
+        (r"/search", SearchHandler, args),
+        (r"/batch", BatchHandler, args),
+        (r"/stats", StatsHandler, args),
+        (r"/metrics", MetricsHandler, args),
+    ])
+
+
+async def serve(host, port, service):
+    app = make_app(service)
+    app.listen(port, address=host)
+    logging.info(f"Serving {len(service.searcher.filenames)} documents on http://{host}:{port}")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the search engine over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--data-dir", default="Dataset", help="folder with the corpus (searched recursively)")
+    parser.add_argument("--index-dir", default="index", help="segmented index written by segments.py")
+    parser.add_argument("--shards-dir", help="serve the sharded index written by shards.py instead")
+    parser.add_argument("--workers", type=int, default=4, help="search threads")
+    parser.add_argument("--trace", action="store_true", help="trace every query into /metrics")
+    parser.add_argument("--metrics-file", help="write the metrics to this JSON file on exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    ensure_resources()
+    service = SearchService(load_searcher(args.index_dir, args.data_dir, args.shards_dir), args.workers, args.trace)
+    try:
+        asyncio.run(serve(args.host, args.port, service))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+        if args.metrics_file:
+            METRICS.export(args.metrics_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import os
+import json
+import shutil
+import logging
+import argparse
+import multiprocessing
+from functools import cached_property
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.sparse import vstack
+
+from corpus import list_corpus_files, SourceSpans
+from indexing import CorpusStats, IndexBuilder
+from index_store import write_index, open_index
+from ingest import DocSpool, IngestStats, iter_documents, preprocess_stream
+from segments import Segment, SegmentSearcher
+from semantic import fit_term_vectors
+from impacts import IMPACT_LEVELS
+from lexicon import Lexicon
+from analysis import load_schema
+import retrival
+
+SHARDS_FILE = "shards.json"
+SHARDS_VERSION = 2
+
+
+def build_shards(data_dir="Dataset", index_dir="shards", n_shards=4, workers=None, schema=None, prune_ratio=0.0):
+    """
+    Index the corpus as n_shards document shards.
+
+    Documents (see corpus.iter_passages) are preprocessed once and routed
+    to shards by their byte position in the corpus, so shards hold about as
+    many bytes each even when one large file is split into many passages
+    (gzipped sources count at their compressed size). Every shard is then built with the statistics of the whole
+    corpus (document count, document frequencies, average length) and the
+    whole vocabulary, so TF-IDF and BM25 scores are exactly those of one
+    unsharded index. LSA is fitted once over every shard's TF-IDF rows and
+    each shard embeds its documents in that one latent space, and every
+    shard quantizes its impacts with the scale of the largest BM25 score of
+    the corpus, so LSA and impact scores of different shards compare.
+
+    Args:
+        data_dir (str): folder holding the corpus.
+        index_dir (str): destination folder, one write_index folder per shard.
+        n_shards (int): most shards; shards that would get no document are left out.
+        workers (int): preprocessing processes.
+        schema (analysis.Schema): analyzers and fields of every shard.
+        prune_ratio (float): fraction of every term's lowest-impact postings
+            left out of each shard's impact-ordered index.
+
+    Returns:
+        dict: the shard manifest.
+    """
+    filenames = list_corpus_files(data_dir)
+    if not filenames:
+        raise ValueError(f"No documents found in {data_dir}")
+    n_shards = max(1, n_shards)
+    sizes = {f: os.path.getsize(os.path.join(data_dir, f)) for f in filenames}
+    file_starts = dict(zip(filenames, np.cumsum([0] + [sizes[f] for f in filenames[:-1]]).tolist()))
+    total = max(1, sum(sizes.values()))
+
+    stats = IngestStats()
+    builders = [IndexBuilder(schema) for _ in range(n_shards)]
+    names = [[] for _ in range(n_shards)]
+    raw_docs = [DocSpool() for _ in range(n_shards)]
+    spans = [[] for _ in range(n_shards)]
+    documents = iter_documents(data_dir, filenames)
+    analyzed = preprocess_stream(documents, workers, stats=stats, schema=builders[0].schema)
+    for passage, tokens, sentences, fields in analyzed:
+        position = file_starts[passage.path] + min(passage.start, sizes[passage.path])
+        shard = min(n_shards - 1, position * n_shards // total)
+        builders[shard].add_document(tokens, sentences, fields)
+        names[shard].append(passage.name)
+        raw_docs[shard].append(passage.text)
+        spans[shard].append((passage.path, passage.start, passage.end, passage.line))
+    logging.info(f"Ingested {stats}")
+    kept = [i for i in range(n_shards) if names[i]]
+    builders, names, raw_docs, spans = ([items[i] for i in kept] for items in (builders, names, raw_docs, spans))
+    n_shards = len(kept)
+    if not n_shards:
+        raise ValueError(f"No documents found in {data_dir}")
+    bounds = np.concatenate(([0], np.cumsum([len(n) for n in names]))).astype(np.int64).tolist()
+
+    corpus_stats = CorpusStats.combine(b.corpus_stats() for b in builders)
+    vocabulary = sorted(corpus_stats.doc_freq)
+    shard_names = [f"shard_{i:03d}" for i in range(n_shards)]
+    term_vectors = fit_term_vectors(vstack([b.tfidf_index(vocabulary, corpus_stats).doc_matrix for b in builders]))
+    # one impact quantization for every shard, so their impact scores merge
+    top_impact = max(
+        (float(p.max_impact) for b in builders for p in b.bm25_index(stats=corpus_stats).postings.values()),
+        default=0.0,
+    )
+    impact_scale = top_impact / IMPACT_LEVELS if top_impact > 0 else None
+
+    tmp_dir = index_dir.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for i, builder in enumerate(builders):
+        indexes = builder.build(vocabulary, corpus_stats, prune_ratio, term_vectors, impact_scale)
+        indexes["sources"] = SourceSpans.from_spans(spans[i])
+        write_index(os.path.join(tmp_dir, shard_names[i]), names[i], raw_docs[i].raw_docs(), indexes)
+        builders[i] = raw_docs[i] = spans[i] = indexes = None  # free each shard once it is on disk
+    manifest = {
+        "format_version": SHARDS_VERSION,
+        "n_docs": bounds[-1],
+        "n_terms": len(vocabulary),
+        "bounds": bounds,
+        "shards": shard_names,
+    }
+    with open(os.path.join(tmp_dir, SHARDS_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    old_dir = index_dir.rstrip(os.sep) + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logging.info(f"Wrote {n_shards} shards to {index_dir}")
+    return manifest
+
+
+def shards_exist(index_dir):
+    """Return True if index_dir holds a sharded index."""
+    return os.path.exists(os.path.join(index_dir, SHARDS_FILE))
+
+
+def read_manifest(index_dir):
+    with open(os.path.join(index_dir, SHARDS_FILE), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SHARDS_VERSION:
+        raise ValueError(f"Unsupported shard manifest version in {index_dir}; rebuild with `python shards.py`")
+    return manifest
+
+
+# worker process state: shard folders, and the shards opened so far
+_shard_dirs = []
+_opened = {}
+
+
+def _init_worker(shard_dirs):
+    _shard_dirs[:] = shard_dirs
+
+
+def _search_shard(shard, fn_name, key, query, args):
+    # every worker can serve every shard; the memory maps are shared through the page cache
+    data = _opened.get(shard)
+    if data is None:
+        data = _opened[shard] = open_index(_shard_dirs[shard])
+    return getattr(retrival, fn_name)(query, data[key], *args)
+
+
+class ShardedSearcher(SegmentSearcher):
+    """
+    Scatter-gather search over the shards written by build_shards.
+
+    Every query path (incidence, inverted index, boolean, phrase,
+    proximity, ranked and LSA search, and their pages) is sent to the
+    shards on a process pool, so shards are searched in parallel on
+    separate cores. Matches are concatenated in shard order; ranked
+    results, already sorted per shard, are merged with a heap. Global doc IDs, filenames, raw_docs and snippets come from the
+    parent's own memory maps of the shards (see SegmentSearcher).
+    """
+
+    def __init__(self, index_dir="shards", workers=None):
+        manifest = read_manifest(index_dir)
+        self.shard_dirs = [os.path.join(index_dir, name) for name in manifest["shards"]]
+        super().__init__([Segment(open_index(d)) for d in self.shard_dirs])
+        workers = workers or min(len(self.shard_dirs), os.cpu_count() or 1)
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.shard_dirs,),
+        )
+
+    @cached_property
+    def lexicons(self):
+        # every shard holds the whole corpus vocabulary, so one lexicon serves them all
+        return [Lexicon(self.segments[0].data["vocabulary"])]
+
+    def _search_segments(self, search_fn, key, query, segment_args):
+        # every shard's search runs on the pool at once
+        futures = [
+            self._pool.submit(_search_shard, shard, search_fn.__name__, key, query, args)
+            for shard, args in segment_args
+        ]
+        return [future.result() for future in futures]
+
+    def _paged(self, page_fn, key, query, cursor, page_size, segment_args=None):
+        # shards have no tombstones, so every shard past the cursor is asked
+        # for one page (and one extra hit) at once, and the first page_size
+        # hits in shard order are the page
+        if segment_args is None:
+            segment_args = [(i, ()) for i in range(len(self.segments))]
+        after = -1 if cursor is None else int(cursor)
+        requests = [
+            (i, (*args, max(after - int(self.bases[i]), -1), page_size + 1))
+            for i, args in segment_args
+            if after < int(self.bases[i]) + self.segments[i].n_docs - 1
+        ]
+        hits = []
+        for (i, _), docs in zip(requests, self._search_segments(page_fn, key, query, requests)):
+            hits.extend(int(self.bases[i]) + d for d in docs)
+            if len(hits) > page_size:
+                break
+        return retrival.ResultPage(tuple(hits[:page_size]), hits[page_size - 1] if len(hits) > page_size else None)
+
+    def search_lsa(self, query_terms, top_k=6, n_probe=None):
+        # the shards embed their documents in one latent space (see build_shards), so their scores merge
+        return self._ranked(retrival.search_lsa, "lsa_index", self._flat_terms(query_terms), top_k, n_probe)
+
+    def close(self):
+        self._pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a sharded index for scatter-gather search.")
+    parser.add_argument("--data-dir", default="Dataset", help="folder with the corpus (searched recursively)")
+    parser.add_argument("--index-dir", default="shards", help="where to write the shards")
+    parser.add_argument("--shards", type=int, default=4, help="number of document shards")
+    parser.add_argument("--workers", type=int, help="preprocessing processes")
+    parser.add_argument("--analysis", help="JSON file with the analyzers and fields to index with")
+    parser.add_argument("--prune-ratio", type=float, default=0.0,
+                        help="fraction of every term's lowest-impact postings to drop from the impact index")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    build_shards(args.data_dir, args.index_dir, args.shards, args.workers, load_schema(args.analysis),
+                 args.prune_ratio)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import numpy as np
+
+from analysis import DEFAULT_SCHEMA, field_term
+
+MAX_SNIPPET_CHARS = 1000
+
+
+def term_positions(positional_index, doc_idx, terms):
+    """
+    Token positions of any of the terms in one document, from the positional index.
+
+    Returns:
+        np.ndarray: positions (unsorted, may repeat).
+    """
+    found = []
+    for term in set(terms):
+        if term not in positional_index:
+            continue
+        entry = positional_index[term]
+        slot = int(np.searchsorted(entry.doc_ids, doc_idx))
+        if slot < len(entry.doc_ids) and entry.doc_ids[slot] == doc_idx:
+            found.append(entry.positions_in(slot))
+    return np.concatenate(found).astype(np.int64) if found else np.empty(0, dtype=np.int64)
+
+
+def _marked(text, terms, analyzer):
+    # (start, end) of every token, and every run of tokens forming an n-gram, whose term is one of terms
+    spans = analyzer.term_spans(text)
+    marked = []
+    for n in range(1, analyzer.ngrams + 1):
+        for i in range(len(spans) - n + 1):
+            if " ".join(term for _, _, term in spans[i:i + n]) in terms:
+                marked.append((spans[i][0], spans[i + n - 1][1]))
+    return marked
+
+
+def highlight(sentence, terms, schema=DEFAULT_SCHEMA):
+    """
+    Wrap every word of sentence that is analyzed into one of the terms in a
+    highlight span.
+
+    The sentence is tokenized and normalized by the schema's body analyzer,
+    as it was at index time; field_term keys of fields indexing the text
+    are matched with that field's analyzer (and its n-grams).
+    """
+    terms = set(terms)
+    marked = _marked(sentence, terms, schema.body)
+    for name, field in schema.fields.items():
+        prefix = field_term(name, "")
+        field_terms = {t[len(prefix):] for t in terms if t.startswith(prefix)}
+        if field.source == "text" and field_terms:
+            marked.extend(_marked(sentence, field_terms, field.analyzer))
+    parts = []
+    pos = 0
+    for start, end in sorted(marked):
+        start = max(start, pos)  # overlapping matches share one span
+        if start < end:
+            parts.append(sentence[pos:start])
+            parts.append(f'<span class="highlight">{sentence[start:end]}</span>')
+            pos = end
+    parts.append(sentence[pos:])
+    return "".join(parts)
+
+
+def make_snippet(text, data, doc_idx, terms, radius=50):
+    """
+    All sentences of a document containing query terms, with highlighting.
+
+    Matching sentences come from the positional index and the precomputed
+    sentence index, so the text is never sentence-split or scanned at query
+    time; only the matching sentences are sliced out and highlighted.
+
+    Args:
+        text (str): raw text of the document.
+        data (dict): index structures holding doc_idx (see indexing.build_indexes).
+        doc_idx (int): doc ID of the document in data.
+        terms (list of str): preprocessed query terms.
+        radius (int): half the length of the fallback snippet.
+
+    Returns:
+        str: snippet HTML.
+    """
+    sentence_index = data["sentence_index"]
+    rows = sentence_index.sentences_at(doc_idx, term_positions(data["positional_index"], doc_idx, terms))
+    if rows.size:
+        starts = sentence_index.char_starts[rows].tolist()
+        ends = sentence_index.char_ends[rows].tolist()
+        # Join snippets with ellipsis and limit total length
+        schema = data.get("analysis") or DEFAULT_SCHEMA
+        combined = " [...] ".join(highlight(text[start:end], terms, schema) for start, end in zip(starts, ends))
+        if len(combined) > MAX_SNIPPET_CHARS:  # Prevent very long results
+            combined = combined[:MAX_SNIPPET_CHARS] + " [...]"
+        return combined
+    # If no sentences found, return beginning of text
+    beginning = text[:radius * 2].strip().replace("\n", " ")
+    return f"{beginning} [...]"
@@ -0,0 +1,16 @@
+from corpus import iter_passages
+
+
+def test_passages_of_a_line_longer_than_a_passage_have_distinct_names(tmp_path):
+    (tmp_path / "big.txt").write_bytes(b"x" * 250 + b"\nab\n" + b"y" * 150)
+    passages = list(iter_passages(str(tmp_path), "big.txt", passage_bytes=100))
+    names = [p.name for p in passages]
+    assert len(set(names)) == len(names)
+    assert names[0] == "big.txt:1"
+    assert b"".join(p.text.encode() for p in passages) == (tmp_path / "big.txt").read_bytes()
+
+
+def test_an_empty_file_is_one_empty_document(tmp_path):
+    (tmp_path / "empty.txt").write_bytes(b"")
+    passages = list(iter_passages(str(tmp_path), "empty.txt"))
+    assert [(p.name, p.text, p.start, p.end) for p in passages] == [("empty.txt", "", 0, 0)]
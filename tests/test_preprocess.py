@@ -0,0 +1,25 @@
+import os
+import glob
+
+import pytest
+
+pytest.importorskip("nltk")
+
+from preprocess import MissingResourceError, ensure_resources, preprocess, preprocess_fast
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Dataset")
+
+
+@pytest.fixture(scope="module", autouse=True)
+def nltk_resources():
+    try:
+        ensure_resources()
+    except MissingResourceError as e:
+        pytest.skip(str(e))
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(DATASET, "*.txt"))), ids=os.path.basename)
+def test_preprocess_fast_matches_preprocess(path):
+    with open(path, encoding="utf-8") as file:
+        text = file.read()
+    assert preprocess_fast(text) == preprocess(text)
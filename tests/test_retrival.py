@@ -0,0 +1,33 @@
+import retrival
+from indexing import IndexBuilder
+from impacts import impact_index_from_bm25
+
+DOCS = [
+    "information retrieval ranks documents".split(),
+    "an inverted index maps terms to documents".split(),
+    "impact ordered postings stop early".split(),
+]
+
+
+def build():
+    builder = IndexBuilder()
+    for tokens in DOCS:
+        builder.add_document(tokens)
+    return builder
+
+
+def test_search_impact_matches_nothing_for_a_term_without_postings():
+    # a shard holds the whole vocabulary, including terms only other shards have postings for
+    builder = build()
+    impact_index = impact_index_from_bm25(builder.bm25_index(), builder.vocabulary() + ["absent"])
+    assert retrival.search_impact(["absent"], impact_index, 5) == []
+    assert [d for d, _ in retrival.search_impact(["absent", "documents"], impact_index, 5)] == [0, 1]
+
+
+def test_search_impact_ranks_like_bm25():
+    builder = build()
+    bm25 = builder.bm25_index()
+    impact_index = impact_index_from_bm25(bm25, builder.vocabulary())
+    query = ["documents", "index"]
+    assert [d for d, _ in retrival.search_impact(query, impact_index, 3)] == \
+        [d for d, _ in retrival.search_bm25(query, bm25, 3)]
@@ -0,0 +1,42 @@
+from indexing import IndexBuilder
+from segments import Segment, SegmentSearcher
+
+CORPUS = {
+    "retrieval.txt": "information retrieval ranks document by relevance to a query".split(),
+    "index.txt": "an inverted index maps every term to the document containing it".split(),
+    "ranking.txt": "bm25 and tfidf ranking weigh term frequency against document frequency".split(),
+    "database.txt": "a database system stores record and answers query over table".split(),
+    "network.txt": "a network routes packet between host using protocol".split(),
+    "compiler.txt": "a compiler translates source code into machine instruction".split(),
+}
+
+
+def segment(docs, deleted=()):
+    # segments built from token lists, as IncrementalIndexer writes them, without any preprocessing
+    builder = IndexBuilder()
+    for tokens in docs.values():
+        builder.add_document(tokens)
+    return Segment({"filenames": list(docs), "raw_docs": [" ".join(t) for t in docs.values()], **builder.build()},
+                   deleted)
+
+
+def test_lsa_finds_a_document_added_in_its_own_segment():
+    searcher = SegmentSearcher([segment(CORPUS), segment({"new.txt": ["platypus", "platypus", "mammal"]})])
+    new = searcher.filenames.index("new.txt")
+    assert searcher.search_tfidf(["platypus"], 3)[0][0] == new
+    assert searcher.search_lsa(["platypus"], 3)[0][0] == new
+
+
+def test_lsa_scores_of_small_segments_compare_with_the_others():
+    searcher = SegmentSearcher([
+        segment(CORPUS),
+        segment({"new2.txt": ["wordb"] * 3, "new3.txt": ["wordc"] * 2}),
+    ])
+    for term, name in (("wordb", "new2.txt"), ("wordc", "new3.txt")):
+        assert [searcher.filenames[d] for d, _ in searcher.search_lsa([term], 1)] == [name]
+
+
+def test_lsa_never_returns_tombstoned_documents():
+    searcher = SegmentSearcher([segment(CORPUS, deleted=[0]), segment({"new.txt": ["retrieval", "query"]})])
+    hits = [d for d, _ in searcher.search_lsa(["information", "retrieval"], 10)]
+    assert hits and 0 not in hits
@@ -0,0 +1,21 @@
+from analysis import Analyzer, Field, Schema, field_term
+from snippets import highlight
+
+PLAIN = Analyzer(normalizer="none", stopwords="none")
+SCHEMA = Schema(PLAIN, {"phrases": Field(Analyzer(normalizer="none", stopwords="none", ngrams=2), source="text")})
+
+
+def test_highlight_marks_tokens_as_the_index_analyzed_them():
+    # the hyphenated word is one token (one term) at index time, the clitic is split off
+    sentence = "A state-of-the-art index isn't slow."
+    assert SCHEMA.body("state-of-the-art isn't") == ["stateoftheart", "is", "nt"]
+    assert highlight(sentence, ["stateoftheart", "is"], SCHEMA) == (
+        'A <span class="highlight">state-of-the-art</span> index <span class="highlight">is</span>n\'t slow.'
+    )
+
+
+def test_highlight_marks_the_ngrams_of_a_text_field():
+    sentence = "Inverted index, then an index of positions."
+    assert highlight(sentence, [field_term("phrases", "inverted index")], SCHEMA) == (
+        '<span class="highlight">Inverted index</span>, then an index of positions.'
+    )